@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark per plan overhead of creating a new s3 client vs. reusing one from
+:mod:`bgs_deploy.boto_pool`, against a mocked s3.
+
+Usage::
+
+    python benchmarks/bench_client_pool.py --n-plans 200
+"""
+
+import argparse
+import json
+import time
+
+import boto3
+from moto import mock_aws
+
+from bgs_deploy.boto_pool import BotoClientPool
+from bgs_deploy.tf_state import read_tf_state
+
+bucket = "bgs-deploy-bench"
+key = "terraform.tfstate"
+
+
+def bench(n_plans):
+    with mock_aws():
+        boto_ses = boto3.session.Session(region_name="us-east-1")
+        s3_client = boto_ses.client("s3")
+        s3_client.create_bucket(Bucket=bucket)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps({"resources": []}))
+
+        def new_client():
+            return boto_ses.client("s3")
+
+        pool = BotoClientPool()
+
+        def pooled_client():
+            return pool.get_client(boto_ses, "s3")
+
+        for name, get_s3_client in [
+            ("new client per plan", new_client),
+            ("pooled client", pooled_client),
+        ]:
+            start = time.perf_counter()
+            for _ in range(n_plans):
+                read_tf_state(get_s3_client(), bucket, key)
+            elapsed = time.perf_counter() - start
+            print("{:<22} {:8.3f} sec total {:8.3f} ms / plan".format(
+                name, elapsed, elapsed / n_plans * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-plans", type=int, default=200)
+    args = parser.parse_args()
+    bench(args.n_plans)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark ``BlueGreenStageDeployment.should_create_bgs_resource``.
+
+Compare:
+
+1. the previous per-call path: validate inputs with ``Constant.Values()``,
+    format a string key, lookup in ``fact_table_dict``.
+2. the compiled fact table per-call path.
+3. the batch API :meth:`bgs_deploy.framework.FactTable.evaluate_batch`.
+
+Usage::
+
+    python benchmarks/bench_fact_table.py [n_rows]
+"""
+
+import itertools
+import random
+import sys
+import time
+
+from bgs_deploy.framework import (
+    DeploymentOptions, DeploymentEnvNames, BlueGreenStageDeployment,
+    get_fact_table, get_fact_table_dict, IS_VALID,
+)
+
+fact_table = get_fact_table()
+fact_table_dict = get_fact_table_dict()
+
+
+class StaticBlueGreenStageDeployment(BlueGreenStageDeployment):
+    def __init__(self, active, inactive, staging):
+        self._logic_ids = (active, inactive, staging)
+
+    @property
+    def current_active_logic_id(self):
+        return self._logic_ids[0]
+
+    @property
+    def current_inactive_logic_id(self):
+        return self._logic_ids[1]
+
+    @property
+    def current_staging_logic_id(self):
+        return self._logic_ids[2]
+
+
+def legacy_should_create_bgs_resource(bgd, deployment_option, bgd_env_name):
+    DeploymentOptions.validate(value=deployment_option, param_name="deployment_option")
+    DeploymentEnvNames.validate(value=bgd_env_name, param_name="bgd_env_name")
+    key = "{}-{}-{}-{}".format(
+        deployment_option,
+        int(bgd.has_active()),
+        int(bgd.has_inactive()),
+        int(bgd.has_staging()),
+    )
+    if fact_table_dict[key][IS_VALID]:
+        return fact_table_dict[key][bgd_env_name]
+    else:
+        raise Exception
+
+
+def make_rows(n_rows, seed=1):
+    rnd = random.Random(seed)
+    valid_rows = [
+        (option, has_active, has_inactive, has_staging)
+        for option in DeploymentOptions.Values()
+        for has_active, has_inactive, has_staging in itertools.product([0, 1], repeat=3)
+        if fact_table_dict["{}-{}-{}-{}".format(
+            option, has_active, has_inactive, has_staging)][IS_VALID]
+    ]
+    return [rnd.choice(valid_rows) for _ in range(n_rows)]
+
+
+def timeit(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(n_rows=10000):
+    rows = make_rows(n_rows)
+    bgd_list = [
+        StaticBlueGreenStageDeployment(
+            "a" if has_active else None,
+            "b" if has_inactive else None,
+            "c" if has_staging else None,
+        )
+        for _, has_active, has_inactive, has_staging in rows
+    ]
+    env_name = DeploymentEnvNames.staging
+
+    def run_legacy():
+        for (option, _, _, _), bgd in zip(rows, bgd_list):
+            legacy_should_create_bgs_resource(bgd, option, env_name)
+
+    def run_compiled():
+        for (option, _, _, _), bgd in zip(rows, bgd_list):
+            bgd.should_create_bgs_resource(option, env_name)
+
+    def run_batch():
+        fact_table.evaluate_batch(rows)
+
+    print("{} rows".format(n_rows))
+    elapsed_legacy = None
+    for name, func in [
+        ("legacy per call", run_legacy),
+        ("compiled per call", run_compiled),
+        ("compiled batch", run_batch),
+    ]:
+        elapsed = timeit(func)
+        if elapsed_legacy is None:
+            elapsed_legacy = elapsed
+        print("{:<20} {:8.4f} sec, {:6.1f}x".format(
+            name, elapsed, elapsed_legacy / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the cold start cost of ``bgs_deploy.framework`` and its fact table.
+
+Every measurement runs in a fresh interpreter:
+
+1. ``import bgs_deploy.framework``, the fact table is not loaded any more.
+2. load the fact table from the generated ``_fact_table_data`` module.
+3. parse ``fact-table.tsv``, which is what used to happen at import time.
+
+Usage::
+
+    python benchmarks/bench_fact_table_import.py [n_runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+dir_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+cases = [
+    # (name, setup code, timed code)
+    (
+        "import framework",
+        "",
+        "import bgs_deploy.framework",
+    ),
+    (
+        "load generated module",
+        "import bgs_deploy.framework as m",
+        "m.get_fact_table()",
+    ),
+    (
+        "parse tsv",
+        "import bgs_deploy.framework as m",
+        "m.FactTable.from_tsv()",
+    ),
+]
+
+timer_template = (
+    "{}\nimport time; start = time.perf_counter(); {}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure(setup, code, n_runs):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [dir_project_root, ] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+    elapsed_list = list()
+    for _ in range(n_runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", timer_template.format(setup, code)],
+            env=env,
+        )
+        elapsed_list.append(float(output.decode("utf-8").strip()))
+    return statistics.median(elapsed_list)
+
+
+def main(n_runs=20):
+    for name, setup, code in cases:
+        elapsed = measure(setup, code, n_runs)
+        print("{:<24} {:8.3f} ms (median of {} runs)".format(name, elapsed * 1000, n_runs))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark hashing build artifacts: read the whole file vs. chunked vs.
+parallel vs. manifest cache.
+
+Usage::
+
+    python benchmarks/bench_hashing.py --n-files 8 --size-mb 50
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from bgs_deploy.hashing import hash_files, HashManifest
+
+
+def read_all_md5(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def bench(n_files, size_mb):
+    dir_tmp = tempfile.mkdtemp()
+    try:
+        paths = list()
+        for i in range(n_files):
+            path = os.path.join(dir_tmp, "artifact-{}.zip".format(i))
+            with open(path, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(1024 * 1024))
+            paths.append(path)
+
+        manifest = HashManifest()
+        hash_files(paths, manifest=manifest)
+
+        for name, func in [
+            ("read whole file", lambda: [read_all_md5(path) for path in paths]),
+            ("chunked, 1 worker", lambda: hash_files(paths, max_workers=1)),
+            ("chunked, 4 workers", lambda: hash_files(paths, max_workers=4)),
+            ("manifest cache", lambda: hash_files(paths, manifest=manifest)),
+        ]:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            print("{:<20} {:8.3f} sec".format(name, elapsed))
+    finally:
+        shutil.rmtree(dir_tmp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-files", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=50)
+    args = parser.parse_args()
+    bench(args.n_files, args.size_mb)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per module import time budget, driven by ``python -X importtime``.
+
+Each module is imported in a fresh interpreter ``n_runs`` times, the median
+cumulative import time is compared with its budget. The three most expensive
+dependencies are listed to explain where the time goes. Exit with code 1 if
+any module exceeds its budget, so it can run in CI.
+
+Usage::
+
+    python benchmarks/bench_import_time.py [n_runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+dir_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module name -> cumulative import time budget in milliseconds
+budgets = [
+    ("bgs_deploy", 10),
+    ("bgs_deploy.exc", 10),
+    ("bgs_deploy.tf_state", 80),
+    ("bgs_deploy.s3_disk_cache", 80),
+    ("bgs_deploy.blue_green_iac", 120),
+    ("bgs_deploy.fleet", 120),
+    ("bgs_deploy.framework", 120),
+    ("bgs_deploy.fact_table_build", 120),
+    ("bgs_deploy.devops.config", 60),
+    ("bgs_deploy.devops.config_init", 10),
+    ("bgs_deploy.devops.boto_ses", 10),
+    ("bgs_deploy.cf.ecs_example", 10),
+    ("bgs_deploy.cf.lambda_example", 10),
+]
+
+
+def parse_importtime(stderr):
+    """
+    :rtype: list
+    :return: list of ``(module_name, level, self_us, cumulative_us)``, children
+        come before their parent like in the ``-X importtime`` output.
+    """
+    records = list()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module_name = line[len("import time:"):].split("|")
+        level = (len(module_name) - len(module_name.lstrip()) - 1) // 2
+        records.append((module_name.strip(), level, int(self_us), int(cumulative_us)))
+    return records
+
+
+def get_subtree(records, module_name):
+    """
+    Returns the record of ``module_name`` and the records it imported.
+
+    :rtype: tuple
+    """
+    index = [
+        i for i, (name, _, _, _) in enumerate(records) if name == module_name
+    ][-1]
+    level = records[index][1]
+    start = index
+    while start > 0 and records[start - 1][1] > level:
+        start -= 1
+    return records[index], records[start:index]
+
+
+def measure(module_name, n_runs):
+    """
+    :rtype: tuple
+    :return: median cumulative milliseconds, and dependency records of the
+        median run
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [dir_project_root, ] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+    runs = list()
+    for _ in range(n_runs):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import " + module_name],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if process.returncode:
+            raise RuntimeError(process.stderr.decode("utf-8"))
+        record, dependencies = get_subtree(
+            parse_importtime(process.stderr.decode("utf-8")), module_name)
+        runs.append((record[3] / 1000, dependencies))
+    runs.sort(key=lambda run: run[0])
+    return runs[len(runs) // 2]
+
+
+def main(n_runs=5):
+    failed = list()
+    for module_name, budget in budgets:
+        elapsed, dependencies = measure(module_name, n_runs)
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        top_dependencies = sorted(
+            dependencies, key=lambda record: record[2], reverse=True)[:3]
+        print("{:<32} {:8.1f} ms / {:4d} ms  {:<12} top self: {}".format(
+            module_name, elapsed, budget, status,
+            ", ".join(
+                "{} {:.1f} ms".format(name, self_us / 1000)
+                for name, _, self_us, _ in top_dependencies
+            ),
+        ))
+        if elapsed > budget:
+            failed.append(module_name)
+    if failed:
+        print("{} module(s) exceeded import time budget: {}".format(
+            len(failed), ", ".join(failed)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
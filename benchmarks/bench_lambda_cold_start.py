@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cold start benchmark of ``bgs_deploy.handlers.my_func``.
+
+Every run starts a fresh interpreter with ``AWS_LAMBDA_FUNCTION_NAME`` set,
+imports the handler and invokes it once, comparing config loaded from:
+
+- ``PYGITREPO_*`` environment variables through ``configirl``
+- the ``BGS_DEPLOY_CONFIG_SNAPSHOT`` environment variable
+- the generated ``bgs_deploy/devops/_config_snapshot.py`` module
+
+Usage::
+
+    python benchmarks/bench_lambda_cold_start.py [n_runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+from bgs_deploy.devops.config_snapshot import (
+    SNAPSHOT_ENV_VAR, encode_snapshot, render_snapshot_module,
+    path_snapshot_module,
+)
+
+dir_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+code = """
+import time
+start = time.perf_counter()
+from bgs_deploy.handlers.my_func import handler
+handler({"name": "Alice"}, None)
+print((time.perf_counter() - start) * 1000)
+"""
+
+snapshot = {
+    "METADATA": {},
+    "PROJECT_NAME": "bgs_deploy",
+    "PROJECT_NAME_SLUG": "bgs-deploy",
+    "STAGE": "dev",
+    "ENVIRONMENT_NAME": "bgs-deploy-dev",
+    "AWS_PROFILE_FOR_BOTO3": None,
+    "AWS_REGION": "us-east-1",
+    "ECS_EXAMPLE_ENVIRONMENT_NAME": "bgs-deploy-dev-ecs-example",
+}
+
+
+def run(env, n_runs):
+    full_env = dict(os.environ)
+    full_env.pop(SNAPSHOT_ENV_VAR, None)
+    full_env["AWS_LAMBDA_FUNCTION_NAME"] = "my_func"
+    full_env.update(env)
+    timings = list()
+    for _ in range(n_runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", code], cwd=dir_project_root, env=full_env)
+        timings.append(float(output))
+    return statistics.median(timings)
+
+
+def main():
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    if os.path.exists(path_snapshot_module):
+        raise SystemExit("{} exists, remove it first".format(path_snapshot_module))
+
+    results = [
+        ("env vars + configirl", run({
+            "PYGITREPO_{}".format(key): str(value)
+            for key, value in snapshot.items()
+            if key in ("PROJECT_NAME", "STAGE", "AWS_REGION")
+        }, n_runs)),
+        ("snapshot env var", run({SNAPSHOT_ENV_VAR: encode_snapshot(snapshot)}, n_runs)),
+    ]
+    with open(path_snapshot_module, "wb") as f:
+        f.write(render_snapshot_module(snapshot).encode("utf-8"))
+    try:
+        results.append(("snapshot module", run({}, n_runs)))
+    finally:
+        os.remove(path_snapshot_module)
+
+    for name, ms in results:
+        print("{:<24} {:8.2f} ms (median of {} cold starts)".format(name, ms, n_runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark :class:`bgs_deploy.ledger.DeploymentLedger` queries on a ledger of
+many state versions and services.
+
+Usage::
+
+    python benchmarks/bench_ledger.py --n-versions 5000 --n-services 50
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from bgs_deploy.ledger import DeploymentLedger
+from bgs_deploy.synthetic_tf_state import get_service_name, make_digest
+
+
+def make_state_data(service_name, version):
+    logic_ids = ["a", "b", "c"]
+    active = logic_ids[version % 3]
+    inactive = logic_ids[(version - 1) % 3]
+    state_data = {"logic_id": dict(), "blue_green_stage": dict()}
+    for logic_id in logic_ids:
+        release = version - (0 if logic_id == active else 1 if logic_id == inactive else 2)
+        state_data["logic_id"][logic_id] = {
+            "docker_image_digest": make_digest(service_name, release),
+            "task_definition_arn": "arn:aws:ecs:us-east-1:111122223333:task-definition/{}:{}".format(
+                service_name, release),
+            "task_definition_arg": None,
+        }
+    state_data["blue_green_stage"]["active"] = {"logic_id": active}
+    state_data["blue_green_stage"]["inactive"] = {"logic_id": inactive}
+    state_data["blue_green_stage"]["staging"] = {"logic_id": None}
+    return state_data
+
+
+def bench(n_versions, n_services):
+    db_path = os.path.join(tempfile.mkdtemp(), "ledger.sqlite")
+    ledger = DeploymentLedger(db_path, bucket="bucket", key="terraform.tfstate")
+    service_names = [get_service_name(i) for i in range(n_services)]
+    rnd = random.Random(1)
+
+    start = time.perf_counter()
+    for version in range(n_versions):
+        # every version changes a few services
+        changed = rnd.sample(service_names, min(3, n_services))
+        ledger.add_version(
+            "v{}".format(version),
+            1600000000.0 + version * 60,
+            {service_name: make_state_data(service_name, version) for service_name in changed},
+        )
+    print("load {} versions: {:.3f} sec, {:.1f} MB".format(
+        n_versions, time.perf_counter() - start, os.path.getsize(db_path) / 1e6))
+
+    for name, func in [
+        ("last 20 digests", lambda service_name: ledger.get_digest_history(service_name, limit=20)),
+        ("active history", lambda service_name: ledger.get_stage_history(service_name, limit=20)),
+        ("find arn by digest", lambda service_name: ledger.find_task_definition_arn(
+            service_name, make_digest(service_name, n_versions // 2))),
+    ]:
+        start = time.perf_counter()
+        for service_name in service_names:
+            func(service_name)
+        elapsed = time.perf_counter() - start
+        print("{:<20} {:8.3f} ms / query".format(name, elapsed / n_services * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-versions", type=int, default=5000)
+    parser.add_argument("--n-services", type=int, default=50)
+    args = parser.parse_args()
+    bench(args.n_versions, args.n_services)
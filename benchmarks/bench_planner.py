@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark terraform state parsing and blue / green planning on synthetic
+terraform state documents of different sizes.
+
+For each size it measures wall time and peak traced memory of:
+
+- ``json.loads`` of the full state
+- streaming parse with :func:`bgs_deploy.tf_state.load_tf_state`
+- building :class:`bgs_deploy.tf_state.TfStateIndex`
+- ``blue_green_state_data`` of one service by scanning all resources
+- ``blue_green_state_data`` of all services from the shared index
+- all ``get_future_*`` / ``should_create_*`` calls of all services
+
+Usage::
+
+    python benchmarks/bench_planner.py --sizes 1000 10000 100000 --output result.json
+"""
+
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.fleet import BlueGreenECSFleet, get_future_plan
+from bgs_deploy.synthetic_tf_state import (
+    generate_tf_state_with_n_resources, get_service_name, make_digest,
+)
+from bgs_deploy.tf_state import ResourceFilter, TfStateIndex, load_tf_state
+
+DeploymentOptions = BlueGreenECSDeployment.DeploymentOptions
+
+
+class InMemoryS3Client(object):
+    def __init__(self, body):
+        self.body = body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.body)}
+
+
+class InMemoryBotoSession(object):
+    def __init__(self, body):
+        self.body = body
+
+    def client(self, service_name):
+        return InMemoryS3Client(self.body)
+
+
+def measure(func):
+    """
+    Run ``func`` twice, once for wall time, once for peak traced memory.
+
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 1024 / 1024}
+
+
+def bench_size(n_resources, container_definitions_size):
+    tf_state_data = generate_tf_state_with_n_resources(
+        n_resources,
+        container_definitions_size=container_definitions_size,
+        seed=n_resources,
+    )
+    body = json.dumps(tf_state_data).encode("utf-8")
+    service_names = sorted({
+        resource_data["name"].rsplit("_", 1)[0]
+        for resource_data in tf_state_data["resources"]
+        if resource_data["type"] == "aws_ecs_task_definition"
+    })
+    del tf_state_data
+    boto_ses = InMemoryBotoSession(body)
+    resource_filter = ResourceFilter(
+        types=sorted(BlueGreenECSDeployment.TfResourceTypes.Values()))
+    parsed_tf_state_data = load_tf_state(io.BytesIO(body), resource_filter=resource_filter)
+    index = TfStateIndex.from_tf_state_data(parsed_tf_state_data)
+    deployment_list = [
+        dict(
+            service_name=service_name,
+            deployment_option=DeploymentOptions.deploy_to_staging,
+            docker_image_digest=make_digest("new", service_name),
+        )
+        for service_name in service_names
+    ]
+
+    def single_service_full_scan():
+        deployment = BlueGreenECSDeployment(
+            boto_ses, "bucket", "key",
+            service_name=service_names[len(service_names) // 2],
+            deployment_option=DeploymentOptions.do_nothing,
+        )
+        deployment._tf_state_data_cache = parsed_tf_state_data
+        return deployment.blue_green_state_data
+
+    def all_services_from_index():
+        for service_name in service_names:
+            BlueGreenECSDeployment(
+                boto_ses, "bucket", "key",
+                service_name=service_name,
+                deployment_option=DeploymentOptions.do_nothing,
+                tf_state_index=index,
+            ).blue_green_state_data
+
+    def all_services_future_plan():
+        for kwargs in deployment_list:
+            deployment = BlueGreenECSDeployment(
+                boto_ses, "bucket", "key", tf_state_index=index, **kwargs)
+            get_future_plan(deployment)
+
+    def fleet_end_to_end():
+        BlueGreenECSFleet(boto_ses, "bucket", "key", tf_state_stream=True) \
+            .plan(deployment_list)
+
+    cases = [
+        ("json.loads", lambda: json.loads(body)),
+        ("stream parse", lambda: load_tf_state(io.BytesIO(body), resource_filter=resource_filter)),
+        ("build index", lambda: TfStateIndex.from_tf_state_data(parsed_tf_state_data)),
+        ("bg state, 1 service, full scan", single_service_full_scan),
+        ("bg state, all services, index", all_services_from_index),
+        ("future plan, all services", all_services_future_plan),
+        ("fleet end to end (stream)", fleet_end_to_end),
+    ]
+    results = list()
+    print("--- {} resources, {} services, {:.1f} MB state ---".format(
+        n_resources, len(service_names), len(body) / 1024 / 1024))
+    for name, func in cases:
+        result = measure(func)
+        result["case"] = name
+        result["n_resources"] = n_resources
+        results.append(result)
+        print("{:<34} {:9.4f} sec {:9.2f} MB peak".format(
+            name, result["seconds"], result["peak_mb"]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--container-definitions-size", type=int, default=1000)
+    parser.add_argument("--output", help="write results to this json file")
+    args = parser.parse_args()
+
+    results = list()
+    for n_resources in args.sizes:
+        results.extend(bench_size(n_resources, args.container_definitions_size))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generated by ``python -m bgs_deploy.fact_table_build`` from ``fact-table.tsv``.
+DO NOT EDIT.
+"""
+
+TSV_SHA256 = "8af3bb7f2edfab4651954ee10ac4ed456fc804fcb3f88b2f90308be91129f805"
+
+OPTION_LIST = (
+    "do_nothing",
+    "deploy_to_staging",
+    "destroy_staging",
+    "deploy_to_active",
+    "roll_back_to_previous",
+)
+
+# one flag byte per (option index, presence mask), see bgs_deploy.framework.FactTable
+FLAGS = (
+    b'\x01\t\x00\x00\x03\x0b\x07\x0f'  # do_nothing
+    b'\t\t\x00\x00\x0b\x0b\x0f\x0f'  # deploy_to_staging
+    b'\x01\x01\x00\x00\x03\x03\x07\x07'  # destroy_staging
+    b'\x00\t\x00\x00\x00\x0b\x00\x0f'  # deploy_to_active
+    b'\x00\x00\x00\x00\x00\x00\x07\x0f'  # roll_back_to_previous
+)
@@ -2,37 +2,99 @@
 
 import json
 import re
+import time
 
 from attrs_mate import attr
 from constant2 import Constant
 
+from .boto_pool import get_client
+from .plan import DeploymentPlan
+from .tf_state import ResourceFilter, is_no_such_key_error, read_tf_state
+from .tf_target import get_tf_target_addresses
+from .tracing import noop_tracer
+
 
 @attr.s
 class BlueGreenDeployment(object):
+    """
+    :type strict_tf_state: bool
+    :param strict_tf_state: if True, an error loading the terraform state is
+        raised, only a missing state object (``NoSuchKey``) is an empty
+        state. If False, any error is an empty state.
+    """
     boto_ses = attr.ib()
     tf_s3_bucket = attr.ib()
     tf_s3_key = attr.ib()
+    tf_state_stream = attr.ib(default=False, kw_only=True)
+    tf_state_cache = attr.ib(default=None, kw_only=True)
+    tracer = attr.ib(default=noop_tracer, kw_only=True)
+    shared_cache = attr.ib(default=None, kw_only=True)
+    strict_tf_state = attr.ib(default=False, kw_only=True)
 
     _tf_state_data_cache = None
+    _tf_state_generation = None
+
+    def _tf_state_resource_filter(self):
+        """
+        Which terraform resources are needed when ``tf_state_stream`` is on.
+        None means keep everything.
+
+        :rtype: ResourceFilter
+        """
+        return None
+
+    def _load_tf_state_data(self):
+        s3_client = get_client(self.boto_ses, "s3")
+        return read_tf_state(
+            s3_client, self.tf_s3_bucket, self.tf_s3_key,
+            stream=self.tf_state_stream,
+            resource_filter=self._tf_state_resource_filter(),
+            cache=self.tf_state_cache,
+            tracer=self.tracer,
+        )
+
+    def _tf_state_cache_key(self):
+        resource_filter = self._tf_state_resource_filter() if self.tf_state_stream else None
+        return (
+            "tf_state",
+            self.tf_s3_bucket,
+            self.tf_s3_key,
+            None if resource_filter is None
+            else (resource_filter.types, resource_filter.name_prefixes),
+        )
 
     def _get_tf_state_data(self):
-        s3_client = self.boto_ses.client("s3")
-        try:
-            res = s3_client.get_object(Bucket=self.tf_s3_bucket, Key=self.tf_s3_key)
-        except:
-            return {"resources": []}
         try:
-            state_data = json.loads(res["Body"].read())
-        except:
+            if self.shared_cache is None:
+                return self._load_tf_state_data()
+            # errors are not cached, the next caller tries again
+            tf_state_data, self._tf_state_generation = self.shared_cache.get_with_generation(
+                self._tf_state_cache_key(), self._load_tf_state_data)
+            return tf_state_data
+        except Exception as e:
+            if self.strict_tf_state and not is_no_such_key_error(e):
+                raise
             return {"resources": []}
-        return state_data
 
     @property
     def tf_state_data(self):
+        """
+        Loaded once per instance. With a ``shared_cache``, instances share
+        the loaded state until it expires, it must not be changed.
+        """
         if self._tf_state_data_cache is None:
             self._tf_state_data_cache = self._get_tf_state_data()
         return self._tf_state_data_cache
 
+    def warm(self):
+        """
+        Load the terraform state now instead of on first use.
+
+        :return: self
+        """
+        _ = self.tf_state_data
+        return self
+
 
 sha256_pattern = re.compile("[A-Fa-f0-9]{64}")
 
@@ -56,6 +118,8 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
     deployment_option = attr.ib()
     docker_image_digest = attr.ib(default=None)
     task_definition_arn = attr.ib(default=None)
+    tf_state_index = attr.ib(default=None, kw_only=True)
+    reuse_task_definition = attr.ib(default=True, kw_only=True)
 
     @docker_image_digest.validator
     def check_docker_image_digest(self, attribute, value):
@@ -141,6 +205,17 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
         inactive = "inactive"
         staging = "staging"
 
+    class TfResourceTypes(Constant):
+        aws_ecs_task_definition = "aws_ecs_task_definition"
+        aws_ecs_service = "aws_ecs_service"
+        aws_lb_listener = "aws_lb_listener"
+
+    def _tf_state_resource_filter(self):
+        return ResourceFilter(
+            types=sorted(self.TfResourceTypes.Values()),
+            name_prefixes=(self.service_name,),
+        )
+
     _blue_green_state_data_cache = None
 
     def _initial_blue_green_state_data(self):
@@ -175,16 +250,44 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
             },
         }
 
+    def _iter_service_resources(self):
+        """
+        If a shared :class:`~bgs_deploy.tf_state.TfStateIndex` is given,
+        only iterate resources of this service. Otherwise iterate all resources
+        in the terraform state.
+        """
+        if self.tf_state_index is not None:
+            return self.tf_state_index.get_resources(self.service_name)
+        else:
+            return self.tf_state_data["resources"]
+
     def _get_blue_green_state_data(self):
+        with self.tracer.span("bg_state.build", service_name=self.service_name) as span:
+            state_data = self._build_blue_green_state_data(span)
+        return state_data
+
+    def _build_blue_green_state_data(self, span):
+        traced = self.tracer.enabled
+        n_resources = 0
+        n_container_definitions = 0
+        container_definitions_bytes = 0
+        container_definitions_seconds = 0.0
         state_data = self._initial_blue_green_state_data()
-        for resource_data in self.tf_state_data["resources"]:
+        for resource_data in self._iter_service_resources():
+            n_resources += 1
             if resource_data["type"] == "aws_ecs_task_definition" \
                     and resource_data["name"].startswith(self.service_name):
                 logic_id = resource_data["name"].replace(f"{self.service_name}_", "")
                 # get docker_image_digest
-                docker_image_uri = json.loads(
+                container_definitions = \
                     resource_data["instances"][0]["attributes"]["container_definitions"]
-                )[0]["image"]
+                if traced:
+                    start = time.perf_counter()
+                docker_image_uri = json.loads(container_definitions)[0]["image"]
+                if traced:
+                    container_definitions_seconds += time.perf_counter() - start
+                    container_definitions_bytes += len(container_definitions)
+                n_container_definitions += 1
                 docker_image_digest = docker_image_uri.split(":")[-1]
                 state_data["logic_id"][logic_id][self.DeploymentParameters.docker_image_digest] = docker_image_digest
                 # get task_definition_arn
@@ -206,12 +309,63 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
                     if resource_type_name.startswith("aws_lb_target_group"):
                         logic_id = resource_type_name.split("_")[-1]
                     state_data["blue_green_stage"][blue_green_stage_name]["logic_id"] = logic_id
+        self._resolve_reused_task_definitions(state_data)
+        if traced:
+            span.set_attribute("resources", n_resources)
+            span.set_attribute("container_definitions", n_container_definitions)
+            span.set_attribute("container_definitions_bytes", container_definitions_bytes)
+            span.set_attribute("container_definitions_seconds", container_definitions_seconds)
         return state_data
 
+    def _resolve_reused_task_definitions(self, state_data):
+        """
+        A logic id deployed with a reused or given task definition has an
+        ecs service but no task definition resource of its own. Its
+        ``task_definition_arn`` is the one the service runs, its
+        ``docker_image_digest`` comes from the logic id owning that task
+        definition, if any.
+        """
+        docker_image_digest = self.DeploymentParameters.docker_image_digest
+        task_definition_arn = self.DeploymentParameters.task_definition_arn
+        task_definition_arg = self.DeploymentParameters.task_definition_arg
+        # task definition arn -> docker image digest, of the owning logic id
+        owned = {
+            config_values[task_definition_arn]: config_values[docker_image_digest]
+            for config_values in state_data["logic_id"].values()
+            if config_values[task_definition_arn]
+        }
+        for config_values in state_data["logic_id"].values():
+            if config_values[task_definition_arn] or not config_values[task_definition_arg]:
+                continue
+            config_values[task_definition_arn] = config_values[task_definition_arg]
+            config_values[docker_image_digest] = owned.get(config_values[task_definition_arg])
+
     @property
     def blue_green_state_data(self):
+        """
+        With a ``shared_cache``, every instance gets its own copy of the
+        cached value, changing it doesn't affect other instances.
+
+        :rtype: dict
+        """
         if self._blue_green_state_data_cache is None:
-            self._blue_green_state_data_cache = self._get_blue_green_state_data()
+            if self.shared_cache is not None and self.tf_state_index is None:
+                # sets the generation the cached value is tied to
+                self.warm()
+            if self._tf_state_generation is not None and self.tf_state_index is None:
+                # tied to the generation of the terraform state it's built from
+                state_data = self.shared_cache.get(
+                    ("blue_green_state", self._tf_state_cache_key(),
+                     self._tf_state_generation, self.service_name),
+                    self._get_blue_green_state_data,
+                )
+                # two levels of dict, copied for much less than a deepcopy
+                self._blue_green_state_data_cache = {
+                    key: {name: dict(values) for name, values in value.items()}
+                    for key, value in state_data.items()
+                }
+            else:
+                self._blue_green_state_data_cache = self._get_blue_green_state_data()
         return self._blue_green_state_data_cache
 
     @property
@@ -293,6 +447,49 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
         else:
             return False
 
+    def find_reusable_task_definition(self, staging_logic_id=None):
+        """
+        When deploying a docker image digest to staging, find out if the
+        active logic id already runs this exact digest. Its task definition
+        is reused, as if ``task_definition_arn`` was given, so no new task
+        definition is registered and no new image is pulled. The digest is
+        still planned for the staging logic id. The staging logic id has no
+        task definition resource then, the state reader takes its digest and
+        arn from the task definition its ecs service runs.
+
+        The reused task definition stays owned by the terraform resource of
+        the active logic id, and is deregistered when that logic id is
+        destroyed, while staging may still point at it. Only the active
+        logic id is reused, it is destroyed two rotations later at the
+        earliest. The inactive logic id is never reused, the next
+        ``deploy_to_active`` turns it into the next staging logic id, which
+        is destroyed by the following ``deploy_to_staging``. Set
+        ``reuse_task_definition=False`` to always register a task definition
+        owned by the staging logic id.
+
+        :type staging_logic_id: str
+        :param staging_logic_id: optional, the result of
+            :meth:`find_which_logic_id_should_use_for_staging`.
+
+        :rtype: tuple
+        :return: ``(logic_id, task_definition_arn)``, None if nothing to reuse.
+        """
+        if not (self.reuse_task_definition
+                and self.deployment_option == self.DeploymentOptions.deploy_to_staging
+                and self.is_docker_image_digest_deployment_type()):
+            return None
+        if staging_logic_id is None:
+            staging_logic_id = self.find_which_logic_id_should_use_for_staging()
+        logic_id = self.active_logic_id
+        if not logic_id or logic_id == staging_logic_id:
+            return None
+        config_values = self.blue_green_state_data["logic_id"][logic_id]
+        task_definition_arn = config_values[self.DeploymentParameters.task_definition_arn]
+        if config_values[self.DeploymentParameters.docker_image_digest] == self.docker_image_digest \
+                and bool(task_definition_arn):
+            return logic_id, task_definition_arn
+        return None
+
     def get_future_logic_id_specified_config_value(self, logic_id, parameter_name):
         """
         For example, if ecs service name is helpdesk.
@@ -316,21 +513,38 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
             raise ValueError
         if parameter_name not in self.DeploymentParameters.Values():
             raise ValueError
+        staging_logic_id = self.find_which_logic_id_should_use_for_staging()
+        return self._get_future_logic_id_specified_config_value(
+            logic_id, parameter_name,
+            staging_logic_id,
+            self.find_reusable_task_definition(staging_logic_id),
+        )
+
+    def _get_future_logic_id_specified_config_value(self,
+                                                    logic_id,
+                                                    parameter_name,
+                                                    staging_logic_id,
+                                                    reused_task_definition=None):
+        # a reused task definition takes the task_definition_arn path,
+        # the digest is kept so the state and the ledger still know it
+        if reused_task_definition is None:
+            task_definition_arn = self.task_definition_arn
+        else:
+            task_definition_arn = reused_task_definition[1]
 
         if parameter_name == self.DeploymentParameters.docker_image_digest:
             parameter_value = self.docker_image_digest
         elif parameter_name == self.DeploymentParameters.task_definition_arn:
-            parameter_value = self.task_definition_arn
+            parameter_value = task_definition_arn
         elif parameter_name == self.DeploymentParameters.task_definition_arg:
-            if self.is_docker_image_digest_deployment_type():
+            if reused_task_definition is None and self.docker_image_digest is not None:
                 parameter_value = f"${{aws_ecs_task_definition.{self.service_name}_{logic_id}.arn}}"
             else:
-                parameter_value = self.task_definition_arn
+                parameter_value = task_definition_arn
         else:
             raise TypeError
 
         existing_value = self.blue_green_state_data["logic_id"][logic_id][parameter_name]
-        staging_logic_id = self.find_which_logic_id_should_use_for_staging()
 
         # When do_nothing, deploy_to_active, roll_back_to_previous
         #   it won't change any existing resources for logic group a, b, c
@@ -372,7 +586,14 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
 
         :rtype: str
         """
-        staging_logic_id = self.find_which_logic_id_should_use_for_staging()
+        return self._get_future_blue_green_stage_specified_logic_id(
+            blue_green_stage,
+            self.find_which_logic_id_should_use_for_staging(),
+        )
+
+    def _get_future_blue_green_stage_specified_logic_id(self,
+                                                        blue_green_stage,
+                                                        staging_logic_id):
         existing_logic_id = self.blue_green_state_data["blue_green_stage"][blue_green_stage]["logic_id"]
         # When doing do_nothing
         #   just use previous logic id
@@ -426,13 +647,17 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
         """
         if logic_id not in self.DeploymentLogicIds.Values():
             raise ValueError
+        return self._should_create_logic_id_specified_resource(
+            logic_id,
+            self.find_which_logic_id_should_use_for_staging(),
+        )
 
+    def _should_create_logic_id_specified_resource(self, logic_id, staging_logic_id):
         existing_docker_image_digest = self.blue_green_state_data["logic_id"][logic_id][
             self.DeploymentParameters.docker_image_digest]
         existing_task_definition_arn = self.blue_green_state_data["logic_id"][logic_id][
             self.DeploymentParameters.task_definition_arn]
         is_exists = (bool(existing_docker_image_digest) or bool(existing_task_definition_arn))
-        staging_logic_id = self.find_which_logic_id_should_use_for_staging()
 
         # for these options, we are not going to change any logic id specified
         # resources
@@ -471,7 +696,9 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
         """
         if blue_green_stage not in self.DeploymentStages.Values():
             raise ValueError
+        return self._should_create_blue_green_stage_specified_resource(blue_green_stage)
 
+    def _should_create_blue_green_stage_specified_resource(self, blue_green_stage):
         existing_logic_id = self.blue_green_state_data["blue_green_stage"][blue_green_stage]["logic_id"]
 
         # When do_nothing
@@ -515,3 +742,66 @@ class BlueGreenECSDeployment(BlueGreenDeployment):
                 return True
         else:
             raise ValueError
+
+    def compute_plan(self):
+        """
+        Evaluate all ``get_future_*`` and ``should_create_*`` methods at once.
+        The staging logic id is resolved only once, and the arguments are not
+        validated again for every call.
+
+        :rtype: DeploymentPlan
+        """
+        with self.tracer.span("plan.compute", service_name=self.service_name):
+            return self._compute_plan()
+
+    def _compute_plan(self):
+        staging_logic_id = self.find_which_logic_id_should_use_for_staging()
+        reused_task_definition = self.find_reusable_task_definition(staging_logic_id)
+        logic_ids = sorted(self.DeploymentLogicIds.Values())
+        parameter_names = sorted(self.DeploymentParameters.Values())
+        blue_green_stages = sorted(self.DeploymentStages.Values())
+        return DeploymentPlan(
+            service_name=self.service_name,
+            deployment_option=self.deployment_option,
+            logic_id_config_values={
+                logic_id: {
+                    parameter_name: self._get_future_logic_id_specified_config_value(
+                        logic_id, parameter_name, staging_logic_id, reused_task_definition)
+                    for parameter_name in parameter_names
+                }
+                for logic_id in logic_ids
+            },
+            blue_green_stage_logic_id={
+                blue_green_stage: self._get_future_blue_green_stage_specified_logic_id(
+                    blue_green_stage, staging_logic_id)
+                for blue_green_stage in blue_green_stages
+            },
+            should_create_logic_id={
+                logic_id: self._should_create_logic_id_specified_resource(
+                    logic_id, staging_logic_id)
+                for logic_id in logic_ids
+            },
+            should_create_blue_green_stage={
+                blue_green_stage: self._should_create_blue_green_stage_specified_resource(
+                    blue_green_stage)
+                for blue_green_stage in blue_green_stages
+            },
+            reused_task_definition=None if reused_task_definition is None else {
+                "logic_id": reused_task_definition[0],
+                self.DeploymentParameters.task_definition_arn: reused_task_definition[1],
+            },
+        )
+
+    def get_tf_target_addresses(self, plan=None):
+        """
+        Terraform resource addresses changed by this deployment, for
+        ``terraform apply -target=...``.
+
+        :type plan: DeploymentPlan
+        :param plan: optional, the result of :meth:`compute_plan`.
+
+        :rtype: list
+        """
+        if plan is None:
+            plan = self.compute_plan()
+        return get_tf_target_addresses(self.blue_green_state_data, plan)
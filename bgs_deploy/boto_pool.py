@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process wide registry of boto3 clients.
+
+``boto_ses.client("s3")`` loads the service model, resolves the endpoint and
+creates a new HTTP connection pool on every call. :func:`get_client` creates
+a client once per ``(session, service, region, client config)`` and reuses it,
+so connections are reused across :class:`~bgs_deploy.blue_green_iac.BlueGreenDeployment`
+instances. boto3 clients are thread safe, a registry can be shared by threads.
+"""
+
+import threading
+import weakref
+
+
+class BotoClientPool(object):
+    """
+    :type max_pool_connections: int
+    :param max_pool_connections: default size of the HTTP connection pool of
+        each client, can be overridden per :meth:`get_client` call. None
+        means the botocore default.
+    """
+
+    def __init__(self, max_pool_connections=None):
+        self.max_pool_connections = max_pool_connections
+        self._lock = threading.Lock()
+        # clients are dropped together with their session
+        self._clients = weakref.WeakKeyDictionary()
+
+    def get_client(self, boto_ses, service_name, region_name=None, **config_kwargs):
+        """
+        Get or create a client.
+
+        :param boto_ses: boto3 session.
+
+        :type service_name: str
+
+        :type region_name: str
+        :param region_name: default is the region of the session.
+
+        :param config_kwargs: ``botocore.config.Config`` arguments, for example
+            ``max_pool_connections``, ``connect_timeout``, ``read_timeout``.
+        """
+        if self.max_pool_connections is not None:
+            config_kwargs.setdefault("max_pool_connections", self.max_pool_connections)
+        key = (
+            service_name,
+            region_name or getattr(boto_ses, "region_name", None),
+            tuple(sorted(config_kwargs.items())),
+        )
+        # fast path, no lock
+        try:
+            return self._clients[boto_ses][key]
+        except KeyError:
+            pass
+        with self._lock:
+            clients = self._clients.setdefault(boto_ses, dict())
+            if key not in clients:
+                clients[key] = self._create_client(
+                    boto_ses, service_name, region_name, config_kwargs)
+            return clients[key]
+
+    @staticmethod
+    def _create_client(boto_ses, service_name, region_name, config_kwargs):
+        kwargs = dict()
+        if config_kwargs:
+            from botocore.config import Config
+
+            kwargs["config"] = Config(**config_kwargs)
+        if region_name is not None:
+            kwargs["region_name"] = region_name
+        return boto_ses.client(service_name, **kwargs)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+default_pool = BotoClientPool()
+
+
+def get_client(boto_ses, service_name, region_name=None, **config_kwargs):
+    """
+    Get or create a client from the process wide :data:`default_pool`.
+    See :meth:`BotoClientPool.get_client`.
+    """
+    return default_pool.get_client(
+        boto_ses, service_name, region_name=region_name, **config_kwargs)
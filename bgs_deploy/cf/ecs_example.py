@@ -2,27 +2,13 @@
 
 """
 Cloudformation Template Generation.
+
+``troposphere_mate`` is imported, and the template is built, when
+:func:`build_template` is called, not at import time.
 """
 
 import json
 
-from troposphere_mate import (
-    Template, Parameter, Ref, helper_fn_sub,
-    ecr,
-)
-
-from ..devops.config_init import config
-
-template = Template()
-
-param_env_name = Parameter(
-    "EnvironmentName",
-    Type="String",
-    Default=config.ECS_EXAMPLE_ENVIRONMENT_NAME.get_value()
-)
-
-template.add_parameter(param_env_name)
-
 ecr_repo_life_cycle_policy = {
     "rules": [
         {
@@ -41,19 +27,49 @@ ecr_repo_life_cycle_policy = {
     ]
 }
 
-ecr_repo_webapp = ecr.Repository(
-    "ECRRepoWebApp",
-    RepositoryName=helper_fn_sub("{}-webapp", param_env_name),
-    LifecyclePolicy=ecr.LifecyclePolicy(
-        LifecyclePolicyText=json.dumps(ecr_repo_life_cycle_policy)
+
+def build_template(config):
+    """
+    :type config: bgs_deploy.devops.config.Config
+
+    :rtype: dict
+    :return: all module level objects of the template
+    """
+    from troposphere_mate import (
+        Template, Parameter, Ref, helper_fn_sub,
+        ecr,
     )
-)
 
+    template = Template()
 
-template.create_resource_type_label()
+    param_env_name = Parameter(
+        "EnvironmentName",
+        Type="String",
+        Default=config.ECS_EXAMPLE_ENVIRONMENT_NAME.get_value()
+    )
 
-# give all aws resource common tags
-common_tags = {
-    "EnvironmentName": Ref(param_env_name),
-}
-template.update_tags(common_tags)
+    template.add_parameter(param_env_name)
+
+    ecr_repo_webapp = ecr.Repository(
+        "ECRRepoWebApp",
+        RepositoryName=helper_fn_sub("{}-webapp", param_env_name),
+        LifecyclePolicy=ecr.LifecyclePolicy(
+            LifecyclePolicyText=json.dumps(ecr_repo_life_cycle_policy)
+        )
+    )
+
+    template.create_resource_type_label()
+
+    # give all aws resource common tags
+    common_tags = {
+        "EnvironmentName": Ref(param_env_name),
+    }
+    template.update_tags(common_tags)
+
+    return dict(
+        config=config,
+        template=template,
+        param_env_name=param_env_name,
+        ecr_repo_webapp=ecr_repo_webapp,
+        common_tags=common_tags,
+    )
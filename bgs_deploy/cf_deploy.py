@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+
+"""
+Skip CloudFormation deploys when neither the template nor the parameters
+changed.
+
+Deploying an unchanged stack still uploads the template and waits for a
+change set round trip. :func:`deploy_if_changed` hashes the canonical
+template json together with the parameters, compares it with the hash of the
+last successful deploy, and only calls the deployer if they differ. The hash
+is stored either as a stack tag (:class:`StackTagHashStore`) or in a local
+json ledger (:class:`LocalLedgerHashStore`).
+
+The deployer is injectable. :class:`StackManagerDeployer` deploys with
+``troposphere_mate.StackManager.deploy``. :class:`CloudFormationDeployer`
+calls ``create_stack`` / ``update_stack`` directly, without
+``troposphere_mate``, it's what
+:class:`~bgs_deploy.cf_orchestrator.CloudFormationOrchestrator` uses.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from attrs_mate import attr
+
+from .boto_pool import get_client
+
+DEPLOY_HASH_TAG_KEY = "bgs-deploy:deploy-hash"
+
+# only trust the tag of a stack in one of these status
+STABLE_STACK_STATUS = (
+    "CREATE_COMPLETE",
+    "UPDATE_COMPLETE",
+    "IMPORT_COMPLETE",
+)
+
+
+def to_template_data(template):
+    """
+    :param template: a ``troposphere.Template``, a dict or a json string.
+
+    :rtype: dict
+    """
+    if isinstance(template, dict):
+        return template
+    if isinstance(template, str):
+        return json.loads(template)
+    return template.to_dict()
+
+
+def canonical_json(data):
+    """
+    Same data, same string: sorted keys, no whitespace.
+
+    :rtype: str
+    """
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def get_deploy_hash(template, parameters=None):
+    """
+    sha256 of the canonical template json and the parameters.
+
+    :type parameters: dict
+    :param parameters: ``{parameter_key: parameter_value}``
+
+    :rtype: str
+    """
+    parameters = {key: str(value) for key, value in (parameters or dict()).items()}
+    data = canonical_json({
+        "template": to_template_data(template),
+        "parameters": parameters,
+    })
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class StackRollbackCompleteError(ValueError):
+    """
+    The stack is in ``ROLLBACK_COMPLETE``: its creation failed and was rolled
+    back. It can't be updated, only deleted and created again.
+    """
+
+
+def is_stack_not_exists_error(e):
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict):
+        return False
+    error = response.get("Error", {})
+    return error.get("Code") == "ValidationError" \
+           and "does not exist" in error.get("Message", "")
+
+
+def is_no_update_error(e):
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict):
+        return False
+    error = response.get("Error", {})
+    return error.get("Code") == "ValidationError" \
+           and "No updates are to be performed" in error.get("Message", "")
+
+
+def describe_stack(cf_client, stack_name):
+    """
+    :rtype: dict
+    :return: None if the stack doesn't exist.
+    """
+    try:
+        return cf_client.describe_stacks(StackName=stack_name)["Stacks"][0]
+    except Exception as e:
+        if is_stack_not_exists_error(e):
+            return None
+        raise
+
+
+def check_not_rollback_complete(stack_name, stack):
+    """
+    :type stack: dict
+    :param stack: the result of :func:`describe_stack`.
+
+    :raises StackRollbackCompleteError:
+    """
+    if stack["StackStatus"] == "ROLLBACK_COMPLETE":
+        raise StackRollbackCompleteError(
+            "stack {} is in ROLLBACK_COMPLETE, its creation failed and it "
+            "can't be updated, delete it first".format(stack_name))
+
+
+def submit_stack(cf_client,
+                 stack_name,
+                 template_kwargs,
+                 parameters,
+                 tags,
+                 include_iam=False):
+    """
+    Create or update a stack, don't wait for it.
+
+    :type template_kwargs: dict
+    :param template_kwargs: ``TemplateBody`` or ``TemplateURL``.
+
+    :rtype: str
+    :return: "create", "update" or "no_update".
+
+    :raises StackRollbackCompleteError: the stack can't be updated.
+    """
+    kwargs = dict(
+        StackName=stack_name,
+        Parameters=[
+            dict(ParameterKey=key, ParameterValue=str(value))
+            for key, value in sorted(parameters.items())
+        ],
+        Tags=[dict(Key=key, Value=value) for key, value in sorted(tags.items())],
+    )
+    kwargs.update(template_kwargs)
+    if include_iam:
+        kwargs["Capabilities"] = ["CAPABILITY_IAM", "CAPABILITY_NAMED_IAM"]
+
+    stack = describe_stack(cf_client, stack_name)
+    if stack is None or stack["StackStatus"] == "REVIEW_IN_PROGRESS":
+        cf_client.create_stack(**kwargs)
+        return "create"
+    check_not_rollback_complete(stack_name, stack)
+    try:
+        cf_client.update_stack(**kwargs)
+    except Exception as e:
+        if is_no_update_error(e):
+            return "no_update"
+        raise
+    return "update"
+
+
+@attr.s
+class StackTagHashStore(object):
+    """
+    The hash is the :data:`DEPLOY_HASH_TAG_KEY` tag of the stack. The
+    deployer writes it, :meth:`put` is a no-op.
+
+    :param cf_client: optional, default is the pooled client of ``boto_ses``.
+    """
+    boto_ses = attr.ib()
+    cf_client = attr.ib(default=None)
+
+    tags_deployed_with_stack = True
+
+    def get(self, stack_name):
+        cf_client = self.cf_client or get_client(self.boto_ses, "cloudformation")
+        stack = describe_stack(cf_client, stack_name)
+        if stack is None or stack["StackStatus"] not in STABLE_STACK_STATUS:
+            return None
+        for tag in stack.get("Tags", []):
+            if tag["Key"] == DEPLOY_HASH_TAG_KEY:
+                return tag["Value"]
+        return None
+
+    def put(self, stack_name, deploy_hash):
+        pass
+
+
+@attr.s
+class LocalLedgerHashStore(object):
+    """
+    ``{stack_name: deploy_hash}`` in a local json file. Thread safe.
+
+    :type path: str
+    """
+    path = attr.ib()
+
+    _lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    tags_deployed_with_stack = False
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(f.read().decode("utf-8"))
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def get(self, stack_name):
+        return self._read().get(stack_name)
+
+    def put(self, stack_name, deploy_hash):
+        with self._lock:
+            ledger = self._read()
+            ledger[stack_name] = deploy_hash
+            dir_path = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(dir_path, exist_ok=True)
+            path_tmp = "{}.{}.tmp".format(self.path, uuid.uuid4().hex)
+            with open(path_tmp, "wb") as f:
+                f.write(json.dumps(ledger, indent=4, sort_keys=True).encode("utf-8"))
+            os.replace(path_tmp, self.path)
+
+
+@attr.s
+class CloudFormationDeployer(object):
+    """
+    Create or update a stack and wait until it's done.
+
+    :type include_iam: bool
+    :param include_iam: allow IAM resources, with ``CAPABILITY_NAMED_IAM``.
+
+    :type cft_bucket: str
+    :param cft_bucket: optional, upload the template to this bucket first,
+        required if the template is larger than 51,200 bytes.
+
+    :type recreate_rollback_complete: bool
+    :param recreate_rollback_complete: if True, a stack in
+        ``ROLLBACK_COMPLETE`` (nothing was created) is deleted and created
+        again. Otherwise :class:`StackRollbackCompleteError` is raised.
+
+    :param cf_client: optional, default is the pooled client of ``boto_ses``.
+    """
+    boto_ses = attr.ib()
+    include_iam = attr.ib(default=False)
+    cft_bucket = attr.ib(default=None)
+    recreate_rollback_complete = attr.ib(default=False)
+    cf_client = attr.ib(default=None)
+
+    def get_template_kwargs(self, stack_name, template_body):
+        if self.cft_bucket is None:
+            return dict(TemplateBody=template_body)
+        key = "cloudformation/{}/{}.json".format(
+            stack_name, hashlib.sha256(template_body.encode("utf-8")).hexdigest())
+        s3_client = get_client(self.boto_ses, "s3")
+        s3_client.put_object(
+            Bucket=self.cft_bucket, Key=key, Body=template_body.encode("utf-8"))
+        # regions launched after 2019 only have the regional endpoint
+        return dict(TemplateURL="https://{}.s3.{}.amazonaws.com/{}".format(
+            self.cft_bucket, s3_client.meta.region_name, key))
+
+    def __call__(self, stack_name, template, parameters, tags):
+        """
+        :param template: a ``troposphere.Template``, a dict or a json string.
+
+        :rtype: str
+        :return: "create", "update" or "no_update".
+        """
+        template_body = json.dumps(to_template_data(template), indent=4, sort_keys=True)
+        cf_client = self.cf_client or get_client(self.boto_ses, "cloudformation")
+        kwargs = dict(
+            template_kwargs=self.get_template_kwargs(stack_name, template_body),
+            parameters=parameters,
+            tags=tags,
+            include_iam=self.include_iam,
+        )
+        try:
+            action = submit_stack(cf_client, stack_name, **kwargs)
+        except StackRollbackCompleteError:
+            if not self.recreate_rollback_complete:
+                raise
+            cf_client.delete_stack(StackName=stack_name)
+            cf_client.get_waiter("stack_delete_complete").wait(StackName=stack_name)
+            action = submit_stack(cf_client, stack_name, **kwargs)
+        if action == "create":
+            cf_client.get_waiter("stack_create_complete").wait(StackName=stack_name)
+        elif action == "update":
+            cf_client.get_waiter("stack_update_complete").wait(StackName=stack_name)
+        return action
+
+
+@attr.s
+class StackManagerDeployer(object):
+    """
+    Deploy with ``troposphere_mate.StackManager.deploy`` and wait until it's
+    done.
+
+    :type stack_manager: troposphere_mate.StackManager
+
+    :type include_iam: bool
+    :param include_iam: allow IAM resources, with ``CAPABILITY_NAMED_IAM``.
+
+    :param cf_client: optional, default is the pooled client of
+        ``stack_manager.boto_ses``.
+    """
+    stack_manager = attr.ib()
+    include_iam = attr.ib(default=False)
+    cf_client = attr.ib(default=None)
+
+    def __call__(self, stack_name, template, parameters, tags):
+        """
+        :type template: troposphere_mate.Template
+
+        :rtype: str
+        :return: "create", "update" or "no_update".
+
+        :raises StackRollbackCompleteError: the stack can't be updated.
+        """
+        cf_client = self.cf_client or get_client(self.stack_manager.boto_ses, "cloudformation")
+        # StackManager.deploy makes the same choice, but doesn't report it
+        stack = describe_stack(cf_client, stack_name)
+        if stack is not None:
+            check_not_rollback_complete(stack_name, stack)
+        action = "create" if stack is None else "update"
+        try:
+            self.stack_manager.deploy(
+                template=template,
+                stack_name=stack_name,
+                stack_tags=tags,
+                stack_parameters={key: str(value) for key, value in parameters.items()},
+                include_iam=self.include_iam,
+            )
+        except Exception as e:
+            if is_no_update_error(e):
+                return "no_update"
+            raise
+        cf_client.get_waiter("stack_{}_complete".format(action)).wait(StackName=stack_name)
+        return action
+
+
+@attr.s
+class DeployResult(object):
+    """
+    :param deployer_result: return value of the deployer, None if skipped.
+    """
+    stack_name = attr.ib()
+    deploy_hash = attr.ib()
+    skipped = attr.ib()
+    deployer_result = attr.ib(default=None)
+
+
+def deploy_if_changed(stack_name,
+                      template,
+                      deployer,
+                      hash_store,
+                      parameters=None,
+                      tags=None,
+                      force=False):
+    """
+    Deploy a stack, unless the hash of the template and parameters equals
+    the hash of the last deploy.
+
+    :type stack_name: str
+
+    :param template: a ``troposphere.Template``, a dict or a json string.
+
+    :param deployer: ``deployer(stack_name, template, parameters, tags)``,
+        for example :class:`StackManagerDeployer`.
+
+    :param hash_store: :class:`StackTagHashStore` or :class:`LocalLedgerHashStore`.
+
+    :type parameters: dict
+    :type tags: dict
+
+    :type force: bool
+    :param force: deploy even if nothing changed.
+
+    :rtype: DeployResult
+    """
+    parameters = dict(parameters or dict())
+    template_data = to_template_data(template)
+    deploy_hash = get_deploy_hash(template_data, parameters)
+    if not force and hash_store.get(stack_name) == deploy_hash:
+        return DeployResult(stack_name=stack_name, deploy_hash=deploy_hash, skipped=True)
+
+    tags = dict(tags or dict())
+    if hash_store.tags_deployed_with_stack:
+        tags[DEPLOY_HASH_TAG_KEY] = deploy_hash
+    deployer_result = deployer(stack_name, template, parameters, tags)
+    hash_store.put(stack_name, deploy_hash)
+    return DeployResult(
+        stack_name=stack_name,
+        deploy_hash=deploy_hash,
+        skipped=False,
+        deployer_result=deployer_result,
+    )
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deploy many independent CloudFormation stacks concurrently.
+
+The boto3 waiters poll every stack at a fixed interval, one stack after
+another. :class:`CloudFormationOrchestrator` submits all stacks first, then
+polls each of them in its own thread with :class:`AdaptiveBackoff` (poll
+fast while the status changes, slower while it doesn't, much slower when
+throttled), and every CloudFormation API call goes through one shared
+:class:`TokenBucket`. Total wall time is close to the slowest stack.
+
+Progress is streamed as :class:`ProgressEvent` to the ``on_event`` callback.
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from attrs_mate import attr
+from constant2 import Constant
+
+from .boto_pool import get_client
+from .cf_deploy import (
+    STABLE_STACK_STATUS, DEPLOY_HASH_TAG_KEY, CloudFormationDeployer,
+    describe_stack, get_deploy_hash, submit_stack, to_template_data,
+)
+
+THROTTLING_ERROR_CODES = (
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+)
+
+
+def is_throttling_error(e):
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+class TokenBucket(object):
+    """
+    Thread safe rate limiter, ``rate`` calls per second on average with bursts
+    up to ``capacity``.
+
+    :type rate: float
+    :type capacity: float
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, block until it's available.
+
+        :rtype: float
+        :return: seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # reserve the token, callers wait in the order they came
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveBackoff(object):
+    """
+    Poll interval of one stack.
+
+    :type initial: float
+    :param initial: seconds, also used right after the status changed.
+
+    :type maximum: float
+
+    :type factor: float
+    :param factor: interval growth when the status didn't change.
+
+    :type jitter: float
+    :param jitter: +/- ratio of randomness added to each sleep.
+    """
+
+    def __init__(self, initial=2.0, maximum=30.0, factor=1.5, jitter=0.1):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.delay = initial
+
+    def on_progress(self):
+        self.delay = self.initial
+
+    def on_idle(self):
+        self.delay = min(self.maximum, self.delay * self.factor)
+
+    def on_throttle(self):
+        self.delay = min(self.maximum, self.delay * 2)
+
+    def sleep(self):
+        time.sleep(self.delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+class ProgressEventTypes(Constant):
+    submitted = "submitted"
+    skipped = "skipped"
+    status = "status"
+    throttled = "throttled"
+    complete = "complete"
+    failed = "failed"
+
+
+@attr.s
+class ProgressEvent(object):
+    stack_name = attr.ib()
+    event_type = attr.ib()
+    stack_status = attr.ib(default=None)
+    message = attr.ib(default=None)
+    timestamp = attr.ib(factory=time.time)
+
+
+@attr.s
+class StackDeployment(object):
+    """
+    :param template: a ``troposphere.Template``, a dict or a json string.
+    :type parameters: dict
+    :type tags: dict
+    """
+    stack_name = attr.ib()
+    template = attr.ib()
+    parameters = attr.ib(factory=dict)
+    tags = attr.ib(factory=dict)
+
+
+@attr.s
+class StackResult(object):
+    """
+    :type stack_status: str
+    :param stack_status: final status, None if failed before submitting.
+    """
+    stack_name = attr.ib()
+    ok = attr.ib(default=False)
+    skipped = attr.ib(default=False)
+    action = attr.ib(default=None)
+    stack_status = attr.ib(default=None)
+    deploy_hash = attr.ib(default=None)
+    error = attr.ib(default=None)
+    elapsed = attr.ib(default=None)
+    n_api_calls = attr.ib(default=0)
+
+
+@attr.s
+class CloudFormationOrchestrator(object):
+    """
+    :param boto_ses: boto3 session.
+
+    :type max_workers: int
+    :param max_workers: max number of stacks deployed at the same time.
+
+    :type rate_limiter: TokenBucket
+    :param rate_limiter: shared by all CloudFormation API calls, default is
+        4 calls per second.
+
+    :param backoff_factory: creates the :class:`AdaptiveBackoff` of a stack.
+
+    :param hash_store: optional, skip unchanged stacks, see
+        :func:`bgs_deploy.cf_deploy.deploy_if_changed`.
+
+    :param on_event: ``on_event(ProgressEvent)``, called from worker threads,
+        one call at a time.
+
+    :type timeout: float
+    :param timeout: per stack, seconds.
+
+    :param cf_client: optional, default is the pooled client of ``boto_ses``.
+    """
+    boto_ses = attr.ib()
+    max_workers = attr.ib(default=8)
+    rate_limiter = attr.ib(factory=lambda: TokenBucket(rate=4))
+    backoff_factory = attr.ib(default=AdaptiveBackoff)
+    hash_store = attr.ib(default=None)
+    include_iam = attr.ib(default=False)
+    cft_bucket = attr.ib(default=None)
+    on_event = attr.ib(default=None)
+    timeout = attr.ib(default=3600)
+    max_throttle_retries = attr.ib(default=10)
+    cf_client = attr.ib(default=None)
+
+    _event_lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def _get_cf_client(self):
+        if self.cf_client is None:
+            self.cf_client = get_client(self.boto_ses, "cloudformation")
+        return self.cf_client
+
+    def _emit(self, stack_name, event_type, **kwargs):
+        if self.on_event is None:
+            return
+        event = ProgressEvent(stack_name=stack_name, event_type=event_type, **kwargs)
+        with self._event_lock:
+            self.on_event(event)
+
+    def _call(self, result, backoff, func, *args, **kwargs):
+        """
+        Call a CloudFormation API through the rate limiter, retry when
+        throttled.
+        """
+        n_throttled = 0
+        while True:
+            self.rate_limiter.acquire()
+            result.n_api_calls += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e) or n_throttled >= self.max_throttle_retries:
+                    raise
+                n_throttled += 1
+                backoff.on_throttle()
+                self._emit(result.stack_name, ProgressEventTypes.throttled, message=str(e))
+                backoff.sleep()
+
+    def _wait(self, result, backoff, cf_client, deadline):
+        last_status = None
+        while True:
+            stack = self._call(result, backoff, describe_stack, cf_client, result.stack_name)
+            status = stack["StackStatus"] if stack else None
+            if status != last_status:
+                last_status = status
+                backoff.on_progress()
+                self._emit(result.stack_name, ProgressEventTypes.status, stack_status=status)
+            else:
+                backoff.on_idle()
+            if status is None or not status.endswith("_IN_PROGRESS"):
+                return status
+            if time.monotonic() + backoff.delay > deadline:
+                raise TimeoutError("stack {} is still {} after {} seconds".format(
+                    result.stack_name, status, self.timeout))
+            backoff.sleep()
+
+    def _deploy_one(self, stack):
+        start = time.monotonic()
+        result = StackResult(stack_name=stack.stack_name)
+        backoff = self.backoff_factory()
+        cf_client = self._get_cf_client()
+        try:
+            template_data = to_template_data(stack.template)
+            tags = dict(stack.tags)
+            if self.hash_store is not None:
+                result.deploy_hash = get_deploy_hash(template_data, stack.parameters)
+                if self.hash_store.tags_deployed_with_stack:
+                    # reads the stack tags, a CloudFormation call like any other
+                    deployed_hash = self._call(
+                        result, backoff, self.hash_store.get, stack.stack_name)
+                else:
+                    deployed_hash = self.hash_store.get(stack.stack_name)
+                if deployed_hash == result.deploy_hash:
+                    result.ok = result.skipped = True
+                    self._emit(stack.stack_name, ProgressEventTypes.skipped)
+                    return result
+                if self.hash_store.tags_deployed_with_stack:
+                    tags[DEPLOY_HASH_TAG_KEY] = result.deploy_hash
+
+            template_body = json.dumps(template_data, indent=4, sort_keys=True)
+            template_kwargs = CloudFormationDeployer(
+                boto_ses=self.boto_ses, cft_bucket=self.cft_bucket,
+            ).get_template_kwargs(stack.stack_name, template_body)
+            result.action = self._call(
+                result, backoff, submit_stack,
+                cf_client, stack.stack_name,
+                template_kwargs=template_kwargs,
+                parameters=stack.parameters,
+                tags=tags,
+                include_iam=self.include_iam,
+            )
+            self._emit(stack.stack_name, ProgressEventTypes.submitted, message=result.action)
+            result.stack_status = self._wait(result, backoff, cf_client, start + self.timeout)
+            result.ok = result.stack_status in STABLE_STACK_STATUS
+            if result.ok and self.hash_store is not None:
+                self.hash_store.put(stack.stack_name, result.deploy_hash)
+        except Exception as e:
+            result.ok = False
+            result.error = e
+        finally:
+            result.elapsed = time.monotonic() - start
+        if result.ok:
+            self._emit(stack.stack_name, ProgressEventTypes.complete,
+                       stack_status=result.stack_status)
+        else:
+            self._emit(stack.stack_name, ProgressEventTypes.failed,
+                       stack_status=result.stack_status,
+                       message=str(result.error) if result.error else None)
+        return result
+
+    def deploy(self, stacks):
+        """
+        :type stacks: list
+        :param stacks: list of :class:`StackDeployment`, must be independent.
+
+        :rtype: list
+        :return: list of :class:`StackResult` in the order of ``stacks``.
+        """
+        stacks = list(stacks)
+        if not stacks:
+            return []
+        names = [stack.stack_name for stack in stacks]
+        if len(set(names)) != len(names):
+            raise ValueError("duplicate stack name in {}".format(names))
+        self._get_cf_client()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stacks))) as executor:
+            return list(executor.map(self._deploy_one, stacks))
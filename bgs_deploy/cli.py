@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+``bgs-deploy`` command line interface.
+
+``bgs-deploy plan`` reads one deployment request per line (NDJSON) from stdin,
+plans them in batches against one parsed terraform state and writes one plan
+per line to stdout, in the input order::
+
+    $ cat deployments.ndjson
+    {"service_name": "helpdesk", "deployment_option": "deploy_to_staging", "docker_image_digest": "..."}
+    {"service_name": "billing", "deployment_option": "deploy_to_active"}
+    $ terraform state pull > terraform.tfstate
+    $ bgs-deploy plan --state terraform.tfstate < deployments.ndjson
+
+The input keys are the ones of :meth:`bgs_deploy.fleet.BlueGreenECSFleet.plan`,
+every output line is one of its results plus the input ``line`` number. A
+line that is not valid json, or not a valid deployment, gets a result with
+``error`` instead of failing the batch. Exit code is 1 if any ``error``.
+
+``--state`` reads a local state file and never imports boto3. Use
+``--bucket`` / ``--key`` (and ``--profile``) to read it from S3 instead. A
+state that can't be read fails the command, only a missing S3 object is an
+empty state.
+"""
+
+import json
+import os
+import sys
+
+from .fleet import LocalTfStateFleet, check_deployment_kwargs
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def iter_batches(lines, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Group the non blank input lines in batches, each item is
+    ``(line_number, kwargs, error)``, the line number starts from 1.
+
+    :param lines: iterable of str.
+    :type batch_size: int
+    """
+    batch = list()
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        kwargs, error = None, None
+        try:
+            kwargs = json.loads(line)
+            check_deployment_kwargs(kwargs)
+        except ValueError as e:
+            kwargs, error = None, str(e)
+        batch.append((line_number, kwargs, error))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
+
+
+def iter_plans(fleet, lines, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Plan the NDJSON ``lines`` with a fleet, every batch reuses the state index
+    of the fleet.
+
+    :type fleet: bgs_deploy.fleet.BlueGreenECSFleet
+    :param lines: iterable of str.
+    :type batch_size: int
+
+    :return: yield lists of results, one list per batch.
+    """
+    for batch in iter_batches(lines, batch_size=batch_size):
+        results = iter(fleet.plan([kwargs for _, kwargs, error in batch if error is None]))
+        batch_results = list()
+        for line_number, kwargs, error in batch:
+            if error is None:
+                result = next(results)
+            else:
+                result = {
+                    "service_name": None,
+                    "blue_green_state_data": None,
+                    "plan": None,
+                    "tf_target_addresses": None,
+                    "error": error,
+                }
+            result["line"] = line_number
+            batch_results.append(result)
+        yield batch_results
+
+
+def get_fleet(args):
+    """
+    :rtype: bgs_deploy.fleet.BlueGreenECSFleet
+    """
+    if args.state:
+        return LocalTfStateFleet(
+            None, None, None,
+            tf_state_path=args.state,
+            tf_state_stream=args.stream,
+        )
+
+    import boto3
+    from .fleet import BlueGreenECSFleet
+
+    return BlueGreenECSFleet(
+        boto3.session.Session(profile_name=args.profile),
+        args.bucket, args.key,
+        tf_state_stream=args.stream,
+        strict_tf_state=True,
+    )
+
+
+def run_plan(args, stdin, stdout):
+    """
+    :rtype: int
+    :return: exit code
+    """
+    fleet = get_fleet(args)
+    has_error = False
+    for batch_results in iter_plans(fleet, stdin, batch_size=args.batch_size):
+        for result in batch_results:
+            has_error = has_error or result["error"] is not None
+            stdout.write(json.dumps(result, sort_keys=True))
+            stdout.write("\n")
+        stdout.flush()
+    return 1 if has_error else 0
+
+
+def main(argv=None, stdin=None, stdout=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="bgs-deploy")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    plan_parser = subparsers.add_parser(
+        "plan", help="plan NDJSON deployment requests from stdin, one plan per line")
+    backend = plan_parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--state", help="local terraform state file")
+    backend.add_argument("--bucket", help="terraform state bucket, requires --key")
+    plan_parser.add_argument("--key", help="terraform state key")
+    plan_parser.add_argument("--profile", default=None, help="AWS profile")
+    plan_parser.add_argument("--stream", action="store_true",
+                             help="stream parse the state, only keep ECS blue / green resources")
+    plan_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                             help="requests planned per batch, output is flushed per batch")
+    args = parser.parse_args(argv)
+    if args.bucket and not args.key:
+        parser.error("--bucket requires --key")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be positive")
+
+    try:
+        return run_plan(args, stdin or sys.stdin, stdout or sys.stdout)
+    except BrokenPipeError:
+        # the reader went away, e.g. ``| head``, don't fail again on exit flush
+        if stdout is None:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
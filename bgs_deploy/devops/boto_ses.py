@@ -1,9 +1,33 @@
 # -*- coding: utf-8 -*-
 
-import boto3
-from .config_init import config
+"""
+The boto3 session for DevOps automation, created on first use.
+"""
 
-boto_ses = boto3.session.Session(
-    profile_name=config.AWS_PROFILE_FOR_BOTO3.get_value(),
-    region_name=config.AWS_REGION.get_value(),
-)
\ No newline at end of file
+_boto_ses = None
+
+
+def get_boto_ses():
+    """
+    :rtype: boto3.session.Session
+    """
+    global _boto_ses
+    if _boto_ses is None:
+        import boto3
+        from .config_init import get_config
+
+        config = get_config()
+        _boto_ses = boto3.session.Session(
+            profile_name=config.AWS_PROFILE_FOR_BOTO3.get_value(),
+            region_name=config.AWS_REGION.get_value(),
+        )
+    return _boto_ses
+
+
+def get_client(service_name, **config_kwargs):
+    """
+    Get a client of the DevOps boto3 session from the shared client pool.
+    """
+    from ..boto_pool import get_client as _get_client
+
+    return _get_client(get_boto_ses(), service_name, **config_kwargs)
@@ -2,32 +2,59 @@
 
 """
 Read config values based on the current environment name.
+
+The config files are read on first call of :func:`get_config`, not at import
+time.
 """
 
 import os
 from os.path import dirname, join
 
-from configirl import read_text, json_loads
-
-from .config import Config
-
 dir_project_root = dirname(dirname(dirname(__file__)))
 shared_config_file = join(dir_project_root, "config", "00-config-shared.json")
 shared_secret_config_file = join(dir_project_root, "config", "00-config-shared-secrets.json")
 env_config_file = join(dir_project_root, "config", "config-raw.json")
 
-config = Config()
-
-# circleci container runtime
-if config.is_circle_ci_runtime():
-    config.update(json_loads(read_text(shared_config_file)))
-    config.update(json_loads(read_text(env_config_file)))
-    config.AWS_ACCOUNT_ID.set_value(os.environ["AWS_ACCOUNT_ID"])
-# aws lambda runtime
-elif config.is_aws_lambda_runtime():
-    config.update_from_env_var(prefix="PYGITREPO_")
-# local runtime
-else:
-    config.update(json_loads(read_text(shared_config_file)))
-    config.update(json_loads(read_text(shared_secret_config_file)))
-    config.update(json_loads(read_text(env_config_file)))
\ No newline at end of file
+_config = None
+
+
+def load_config():
+    """
+    :rtype: bgs_deploy.devops.config.Config
+    """
+    from configirl import read_text, json_loads
+    from .config import Config
+
+    config = Config()
+
+    # circleci container runtime
+    if config.is_circle_ci_runtime():
+        config.update(json_loads(read_text(shared_config_file)))
+        config.update(json_loads(read_text(env_config_file)))
+        config.AWS_ACCOUNT_ID.set_value(os.environ["AWS_ACCOUNT_ID"])
+    # aws lambda runtime
+    elif config.is_aws_lambda_runtime():
+        config.update_from_env_var(prefix="PYGITREPO_")
+    # local runtime
+    else:
+        config.update(json_loads(read_text(shared_config_file)))
+        config.update(json_loads(read_text(shared_secret_config_file)))
+        config.update(json_loads(read_text(env_config_file)))
+    return config
+
+
+def get_config():
+    """
+    :rtype: bgs_deploy.devops.config.Config or
+        bgs_deploy.devops.config_snapshot.SnapshotConfig
+    """
+    global _config
+    if _config is None:
+        # aws lambda runtime, prefer the frozen snapshot, see config_snapshot.py
+        if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
+            from .config_snapshot import load_snapshot
+
+            _config = load_snapshot()
+        if _config is None:
+            _config = load_config()
+    return _config
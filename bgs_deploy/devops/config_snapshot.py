@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+Frozen config snapshot for the AWS Lambda runtime.
+
+In Lambda, :func:`bgs_deploy.devops.config_init.load_config` imports
+``configirl``, scans every ``PYGITREPO_*`` environment variable and evaluates
+``Derivable`` getters on demand. A snapshot resolves all constant and derived
+values once at build time, and ships them as either:
+
+- the generated module ``bgs_deploy/devops/_config_snapshot.py``, built by
+  ``python -m bgs_deploy.devops.config_snapshot --module``, packed into the
+  lambda source code.
+- the single environment variable ``BGS_DEPLOY_CONFIG_SNAPSHOT``, a base64
+  encoded zlib compressed json, printed by
+  ``python -m bgs_deploy.devops.config_snapshot --env-var``.
+
+:func:`load_snapshot` returns a :class:`SnapshotConfig`, which has the same
+``config.PROJECT_NAME.get_value()`` interface, and only needs the standard
+library.
+
+Secrets are never baked in: ``dont_dump`` fields and the keys of
+``config/00-config-shared-secrets.json`` are left out of the snapshot, the
+lambda function has to get them from somewhere else at runtime.
+"""
+
+import base64
+import json
+import os
+import sys
+import zlib
+
+SNAPSHOT_ENV_VAR = "BGS_DEPLOY_CONFIG_SNAPSHOT"
+
+path_snapshot_module = os.path.join(os.path.dirname(__file__), "_config_snapshot.py")
+
+# Derivable values depending on the runtime, resolved for the lambda runtime
+LAMBDA_RUNTIME_OVERRIDES = {
+    "AWS_PROFILE_FOR_BOTO3": None,
+}
+
+
+def build_snapshot(config, overrides=None, exclude=()):
+    """
+    Resolve all constant and derived values that are set, unset values and
+    ``dont_dump`` fields are left out.
+
+    :type config: bgs_deploy.devops.config.Config
+
+    :type overrides: dict
+    :param overrides: values to use instead of the resolved ones, default is
+        :data:`LAMBDA_RUNTIME_OVERRIDES`.
+
+    :type exclude: collections.abc.Container
+    :param exclude: keys never put in the snapshot, for example the secrets.
+
+    :rtype: dict
+    """
+    from configirl import DontDumpError, ValueNotSetError
+
+    if overrides is None:
+        overrides = LAMBDA_RUNTIME_OVERRIDES
+    snapshot = dict()
+    for key in config._declared_fields:
+        if key in exclude:
+            continue
+        # runtime dependent getters are not evaluated on the build machine
+        if key in overrides:
+            snapshot[key] = overrides[key]
+            continue
+        try:
+            snapshot[key] = getattr(config, key).get_value(check_dont_dump=True)
+        except (DontDumpError, ValueNotSetError):
+            pass
+    return snapshot
+
+
+def get_secret_keys(path=None):
+    """
+    Keys of the shared secrets config file, empty if it doesn't exist.
+
+    :type path: str
+    :rtype: set
+    """
+    if path is None:
+        from .config_init import shared_secret_config_file as path
+    try:
+        with open(path, "rb") as f:
+            return set(json.loads(f.read().decode("utf-8")))
+    except (IOError, OSError):
+        return set()
+
+
+def encode_snapshot(snapshot):
+    """
+    :type snapshot: dict
+    :rtype: str
+    """
+    data = json.dumps(snapshot, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return base64.b64encode(zlib.compress(data, 9)).decode("ascii")
+
+
+def decode_snapshot(text):
+    """
+    :type text: str
+    :rtype: dict
+    """
+    return json.loads(zlib.decompress(base64.b64decode(text)).decode("utf-8"))
+
+
+def render_snapshot_module(snapshot):
+    """
+    :type snapshot: dict
+    :rtype: str
+    """
+    return "\n".join([
+        "# -*- coding: utf-8 -*-",
+        "",
+        "# Generated by ``python -m bgs_deploy.devops.config_snapshot --module``,",
+        "# do not edit and do not commit.",
+        "",
+        "SNAPSHOT = {!r}".format(dict(sorted(snapshot.items()))),
+        "",
+    ])
+
+
+class ConfigValue(object):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def get_value(self, **kwargs):
+        return self.value
+
+
+class SnapshotConfig(object):
+    """
+    Read only config backed by a snapshot, ``config.KEY.get_value()`` works
+    like :class:`bgs_deploy.devops.config.Config`.
+    """
+
+    def __init__(self, snapshot):
+        for key, value in snapshot.items():
+            self.__dict__[key] = ConfigValue(value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is read only".format(self.__class__.__name__))
+
+    def to_dict(self):
+        return {key: config_value.value for key, config_value in self.__dict__.items()}
+
+
+def load_snapshot():
+    """
+    Load the snapshot from the environment variable, then from the generated
+    module. Returns None if neither exists.
+
+    :rtype: SnapshotConfig
+    """
+    text = os.environ.get(SNAPSHOT_ENV_VAR)
+    if text:
+        return SnapshotConfig(decode_snapshot(text))
+    try:
+        from ._config_snapshot import SNAPSHOT
+    except ImportError:
+        return None
+    return SnapshotConfig(SNAPSHOT)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Resolve the current config into a snapshot for the lambda runtime")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--module", action="store_true",
+                       help="write {}".format(os.path.basename(path_snapshot_module)))
+    group.add_argument("--env-var", action="store_true",
+                       help="print the value of {}".format(SNAPSHOT_ENV_VAR))
+    args = parser.parse_args(argv)
+
+    from .config_init import load_config
+
+    config = load_config()
+    secret_keys = get_secret_keys()
+    snapshot = build_snapshot(config, exclude=secret_keys)
+    left_out = sorted(key for key in secret_keys if key in config._declared_fields)
+    if left_out:
+        sys.stderr.write("secrets left out of the snapshot: {}\n".format(", ".join(left_out)))
+    if args.module:
+        with open(path_snapshot_module, "wb") as f:
+            f.write(render_snapshot_module(snapshot).encode("utf-8"))
+        print("wrote {}".format(path_snapshot_module))
+    else:
+        print(encode_snapshot(snapshot))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+
+"""
+Incremental, byte reproducible lambda source code / layer / deployment
+package builder.
+
+The ``zip`` command used by ``bin/lbd/lambda-env.sh`` rebuilds the zip from
+scratch every time and stores file mtimes, so the same source gives a
+different zip, and a different S3 object, on every build.
+:class:`LambdaPackageBuilder`:
+
+- fingerprints the content of every packed file and the requirements files,
+  and only rebuilds when the fingerprint differs from the one of the last
+  build. Digests are cached in a :class:`bgs_deploy.hashing.HashManifest`,
+  unchanged files are not read again.
+- writes entries sorted by name, with a fixed timestamp and normalized
+  permissions, so the same content always gives the same bytes.
+- compresses entries in a thread pool, ``zlib`` releases the GIL.
+
+Usage::
+
+    python -m bgs_deploy.devops.lbd_package source --output build/lambda/source.zip
+    python -m bgs_deploy.devops.lbd_package layer --site-packages ${dir_venv_site_packages} --output build/lambda/layer.zip
+"""
+
+import collections
+import fnmatch
+import hashlib
+import os
+import struct
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from attrs_mate import attr
+
+from ..hashing import CHUNK_SIZE, HashManifest, hash_files
+
+FINGERPRINT_VERSION = "1"
+
+BYTECODE_PATTERNS = [
+    "*__pycache__*",
+    "*.pyc",
+    "*.pyo",
+    "*.pyd",
+]
+
+# already in the lambda runtime or only needed to build
+LAMBDA_RUNTIME_PATTERNS = [
+    "boto3*",
+    "botocore*",
+    "s3transfer*",
+    "setuptools*",
+    "easy_install.py",
+    "pip*",
+    "wheel*",
+    "twine*",
+    "_pytest*",
+    "pytest*",
+]
+
+# 1980-01-01 00:00:00, the earliest zip timestamp
+DOS_TIME = 0
+DOS_DATE = (1 << 5) | 1
+
+ZIP_VERSION = 20
+ZIP_VERSION_MADE_BY = (3 << 8) | ZIP_VERSION  # unix
+ZIP_FLAG_UTF8 = 0x800
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_MAX_SIZE = 0xFFFFFFFF
+ZIP_MAX_ENTRIES = 0xFFFF
+
+
+@attr.s
+class PackageSource(object):
+    """
+    A directory to pack.
+
+    :type dir_path: str
+
+    :type arc_prefix: str
+    :param arc_prefix: directory of its files in the zip, for example
+        ``python`` for a layer.
+
+    :type exclude: list
+    :param exclude: ``fnmatch`` patterns of the path relative to ``dir_path``,
+        ``*`` also matches ``/``, like ``zip -x``.
+    """
+    dir_path = attr.ib()
+    arc_prefix = attr.ib(default="")
+    exclude = attr.ib(factory=lambda: list(BYTECODE_PATTERNS))
+
+    def is_excluded(self, relpath):
+        return any(fnmatch.fnmatchcase(relpath, pattern) for pattern in self.exclude)
+
+    def collect_files(self, skip=()):
+        """
+        :type skip: list
+        :param skip: absolute paths never packed, for example the output zip.
+
+        :rtype: list
+        :return: sorted list of ``(abspath, arcname)``.
+        """
+        root = os.path.abspath(self.dir_path)
+        skip = set(os.path.abspath(path) for path in skip)
+        files = list()
+        for dir_path, dir_names, file_names in os.walk(root):
+            rel_dir = os.path.relpath(dir_path, root).replace(os.sep, "/")
+            rel_dir = "" if rel_dir == "." else rel_dir + "/"
+            dir_names[:] = sorted(
+                name for name in dir_names
+                if not self.is_excluded(rel_dir + name + "/")
+            )
+            for file_name in file_names:
+                relpath = rel_dir + file_name
+                abspath = os.path.join(dir_path, file_name)
+                if self.is_excluded(relpath) or abspath in skip:
+                    continue
+                arcname = "{}/{}".format(self.arc_prefix.strip("/"), relpath) \
+                    if self.arc_prefix.strip("/") else relpath
+                files.append((abspath, arcname))
+        files.sort(key=lambda item: item[1])
+        return files
+
+
+def get_file_mode(path):
+    """
+    Only keep the executable bit, umask and owner don't change the zip.
+    """
+    return 0o755 if os.stat(path).st_mode & 0o100 else 0o644
+
+
+def compress_entry(path, compress_level=9):
+    """
+    :rtype: tuple
+    :return: ``(method, crc32, compressed_data, uncompressed_size)``
+    """
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = 0
+    size = 0
+    raw_chunks = list()
+    chunks = list()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            raw_chunks.append(chunk)
+            chunks.append(compressor.compress(chunk))
+    chunks.append(compressor.flush())
+    data = b"".join(chunks)
+    # like zip, store the entry if deflate doesn't make it smaller
+    if len(data) >= size:
+        return ZIP_STORED, crc, b"".join(raw_chunks), size
+    return ZIP_DEFLATED, crc, data, size
+
+
+def write_zip(path, files, compress_level=9, max_workers=4):
+    """
+    Write a deterministic zip, entries in the order of ``files``.
+
+    :type files: list
+    :param files: list of ``(abspath, arcname)``.
+
+    :rtype: int
+    :return: size of the zip in bytes.
+    """
+    if len(files) > ZIP_MAX_ENTRIES:
+        raise ValueError("more than {} entries needs zip64, not supported".format(ZIP_MAX_ENTRIES))
+    path_tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    central_directory = list()
+    try:
+        with open(path_tmp, "wb") as f, \
+                ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            # bounded read ahead, only a few compressed entries are in memory
+            pending = collections.deque()
+            files_iter = iter(files)
+
+            def submit_next():
+                for abspath, arcname in files_iter:
+                    pending.append((
+                        abspath, arcname,
+                        executor.submit(compress_entry, abspath, compress_level),
+                    ))
+                    return
+
+            for _ in range(max(1, max_workers) * 4):
+                submit_next()
+            while pending:
+                abspath, arcname, future = pending.popleft()
+                submit_next()
+                method, crc, data, size = future.result()
+                if size > ZIP_MAX_SIZE or f.tell() > ZIP_MAX_SIZE:
+                    raise ValueError("{} needs zip64, not supported".format(arcname))
+                name = arcname.encode("utf-8")
+                offset = f.tell()
+                f.write(struct.pack(
+                    "<IHHHHHIIIHH",
+                    0x04034b50, ZIP_VERSION, ZIP_FLAG_UTF8, method, DOS_TIME, DOS_DATE,
+                    crc, len(data), size, len(name), 0,
+                ))
+                f.write(name)
+                f.write(data)
+                external_attr = (0o100000 | get_file_mode(abspath)) << 16
+                central_directory.append(struct.pack(
+                    "<IHHHHHHIIIHHHHHII",
+                    0x02014b50, ZIP_VERSION_MADE_BY, ZIP_VERSION, ZIP_FLAG_UTF8, method,
+                    DOS_TIME, DOS_DATE, crc, len(data), size, len(name), 0, 0, 0, 0,
+                    external_attr, offset,
+                ) + name)
+
+            cd_offset = f.tell()
+            for record in central_directory:
+                f.write(record)
+            cd_size = f.tell() - cd_offset
+            f.write(struct.pack(
+                "<IHHHHIIH",
+                0x06054b50, 0, 0, len(central_directory), len(central_directory),
+                cd_size, cd_offset, 0,
+            ))
+            total_size = f.tell()
+        os.replace(path_tmp, path)
+    finally:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+    return total_size
+
+
+@attr.s
+class BuildResult(object):
+    """
+    :type rebuilt: bool
+    :param rebuilt: False if the fingerprint didn't change.
+    """
+    path = attr.ib()
+    fingerprint = attr.ib()
+    rebuilt = attr.ib()
+    n_files = attr.ib()
+    size = attr.ib()
+
+
+@attr.s
+class LambdaPackageBuilder(object):
+    """
+    :type output_path: str
+    :param output_path: the zip. Its fingerprint is stored in
+        ``<output_path>.fingerprint``, the file digest cache in
+        ``<output_path>.hash-manifest.json``.
+
+    :type sources: list
+    :param sources: list of :class:`PackageSource`.
+
+    :type requirements: list
+    :param requirements: paths of requirements files, part of the fingerprint.
+
+    :type compress_level: int
+    :type max_workers: int
+    """
+    output_path = attr.ib()
+    sources = attr.ib()
+    requirements = attr.ib(factory=list)
+    compress_level = attr.ib(default=9)
+    max_workers = attr.ib(default=4)
+
+    @property
+    def path_fingerprint(self):
+        return self.output_path + ".fingerprint"
+
+    @property
+    def path_hash_manifest(self):
+        return self.output_path + ".hash-manifest.json"
+
+    def collect_files(self):
+        """
+        :rtype: list
+        :return: list of ``(abspath, arcname)`` sorted by arcname.
+        """
+        skip = [self.output_path, self.path_fingerprint, self.path_hash_manifest]
+        files = list()
+        for source in self.sources:
+            files.extend(source.collect_files(skip=skip))
+        files.sort(key=lambda item: item[1])
+        counter = collections.Counter(arcname for _, arcname in files)
+        duplicates = sorted(arcname for arcname, n in counter.items() if n > 1)
+        if duplicates:
+            raise ValueError("duplicate entries in the zip: {}".format(duplicates))
+        return files
+
+    def get_fingerprint(self, files, manifest=None):
+        """
+        sha256 of every arcname, file mode and content digest, the requirements
+        and the compress level.
+
+        :rtype: str
+        """
+        paths = [abspath for abspath, _ in files] + list(self.requirements)
+        digests = hash_files(
+            paths, algorithm="sha256", manifest=manifest, max_workers=self.max_workers)
+        hasher = hashlib.sha256()
+        hasher.update("version {}\n".format(FINGERPRINT_VERSION).encode("utf-8"))
+        hasher.update("compress_level {}\n".format(self.compress_level).encode("utf-8"))
+        for abspath, arcname in files:
+            hasher.update("file {} {:o} {}\n".format(
+                arcname, get_file_mode(abspath), digests[abspath]).encode("utf-8"))
+        for path in self.requirements:
+            hasher.update("requirements {} {}\n".format(
+                os.path.basename(path), digests[path]).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def read_last_fingerprint(self):
+        try:
+            with open(self.path_fingerprint, "rb") as f:
+                return f.read().decode("utf-8").strip()
+        except (IOError, OSError):
+            return None
+
+    def build(self, force=False):
+        """
+        :type force: bool
+        :param force: rebuild even if the fingerprint didn't change.
+
+        :rtype: BuildResult
+        """
+        files = self.collect_files()
+        manifest = HashManifest(path=self.path_hash_manifest)
+        fingerprint = self.get_fingerprint(files, manifest=manifest)
+        manifest.save()
+
+        if not force \
+                and os.path.exists(self.output_path) \
+                and self.read_last_fingerprint() == fingerprint:
+            return BuildResult(
+                path=self.output_path,
+                fingerprint=fingerprint,
+                rebuilt=False,
+                n_files=len(files),
+                size=os.path.getsize(self.output_path),
+            )
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        size = write_zip(
+            self.output_path, files,
+            compress_level=self.compress_level,
+            max_workers=self.max_workers,
+        )
+        with open(self.path_fingerprint, "wb") as f:
+            f.write(fingerprint.encode("utf-8"))
+        return BuildResult(
+            path=self.output_path,
+            fingerprint=fingerprint,
+            rebuilt=True,
+            n_files=len(files),
+            size=size,
+        )
+
+
+dir_package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+package_name = os.path.basename(dir_package)
+dir_project_root = os.path.dirname(dir_package)
+
+
+def get_source_builder(output_path, requirements=None, **kwargs):
+    """
+    The source code of this package, in the zip as ``<package_name>/...``.
+
+    :rtype: LambdaPackageBuilder
+    """
+    return LambdaPackageBuilder(
+        output_path=output_path,
+        sources=[PackageSource(dir_path=dir_package, arc_prefix=package_name), ],
+        requirements=requirements or [],
+        **kwargs
+    )
+
+
+def get_layer_builder(output_path, dir_site_packages, requirements=None, **kwargs):
+    """
+    Dependencies only, in the zip as ``python/...``.
+
+    :rtype: LambdaPackageBuilder
+    """
+    exclude = BYTECODE_PATTERNS + LAMBDA_RUNTIME_PATTERNS + [package_name + "*", ]
+    return LambdaPackageBuilder(
+        output_path=output_path,
+        sources=[PackageSource(dir_path=dir_site_packages, arc_prefix="python", exclude=exclude), ],
+        requirements=requirements or [],
+        **kwargs
+    )
+
+
+def get_deploy_pkg_builder(output_path, dir_site_packages, requirements=None, **kwargs):
+    """
+    Dependencies and the installed package, at the root of the zip.
+
+    :rtype: LambdaPackageBuilder
+    """
+    exclude = BYTECODE_PATTERNS + LAMBDA_RUNTIME_PATTERNS
+    return LambdaPackageBuilder(
+        output_path=output_path,
+        sources=[PackageSource(dir_path=dir_site_packages, exclude=exclude), ],
+        requirements=requirements or [],
+        **kwargs
+    )
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Build a lambda zip, only if its content changed")
+    parser.add_argument("kind", choices=["source", "layer", "deploy-pkg"])
+    parser.add_argument("--output", required=True, help="path of the zip")
+    parser.add_argument("--site-packages", help="required for layer and deploy-pkg")
+    parser.add_argument("--requirements", action="append",
+                        help="requirements file, default is requirements.txt")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--force", action="store_true", help="rebuild anyway")
+    args = parser.parse_args(argv)
+
+    requirements = args.requirements
+    if requirements is None:
+        path_requirements = os.path.join(dir_project_root, "requirements.txt")
+        requirements = [path_requirements, ] if os.path.exists(path_requirements) else []
+    if args.kind == "source":
+        builder = get_source_builder(
+            args.output, requirements=requirements, max_workers=args.max_workers)
+    else:
+        if not args.site_packages:
+            parser.error("--site-packages is required for {}".format(args.kind))
+        get_builder = get_layer_builder if args.kind == "layer" else get_deploy_pkg_builder
+        builder = get_builder(
+            args.output, args.site_packages,
+            requirements=requirements, max_workers=args.max_workers)
+
+    result = builder.build(force=args.force)
+    print("{} {} ({} files, {} bytes, fingerprint {})".format(
+        "built" if result.rebuilt else "unchanged, skip",
+        result.path, result.n_files, result.size, result.fingerprint[:12]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+Freeze ``fact-table.tsv`` into the generated ``_fact_table_data.py`` module.
+
+The generated module only contains a tuple of option names and a bytes
+literal, so loading the fact table costs no file I/O and no CSV parsing.
+
+Usage::
+
+    # regenerate after editing fact-table.tsv
+    python -m bgs_deploy.fact_table_build
+
+    # exit with code 1 if fact-table.tsv and _fact_table_data.py drift apart
+    python -m bgs_deploy.fact_table_build --check
+"""
+
+import hashlib
+import os
+import sys
+
+from .framework import FactTable, fact_table_tsv
+
+path_fact_table_data_py = os.path.join(os.path.dirname(__file__), "_fact_table_data.py")
+
+module_template = '''# -*- coding: utf-8 -*-
+
+"""
+Generated by ``python -m bgs_deploy.fact_table_build`` from ``fact-table.tsv``.
+DO NOT EDIT.
+"""
+
+TSV_SHA256 = "{tsv_sha256}"
+
+OPTION_LIST = (
+{option_list}
+)
+
+# one flag byte per (option index, presence mask), see bgs_deploy.framework.FactTable
+FLAGS = (
+{flags}
+)
+'''
+
+
+def render_fact_table_module(tsv_path=fact_table_tsv):
+    """
+    Render the source code of the generated module.
+
+    :rtype: str
+    """
+    with open(tsv_path, "rb") as f:
+        tsv_sha256 = hashlib.sha256(f.read()).hexdigest()
+    fact_table = FactTable.from_tsv(tsv_path)
+    option_list = "\n".join(
+        "    \"{}\",".format(option) for option in fact_table.option_list
+    )
+    flags = "\n".join(
+        "    {!r}  # {}".format(fact_table.flags[i * 8:(i + 1) * 8], option)
+        for i, option in enumerate(fact_table.option_list)
+    )
+    return module_template.format(
+        tsv_sha256=tsv_sha256,
+        option_list=option_list,
+        flags=flags,
+    )
+
+
+def build(tsv_path=fact_table_tsv, py_path=path_fact_table_data_py):
+    with open(py_path, "wb") as f:
+        f.write(render_fact_table_module(tsv_path).encode("utf-8"))
+
+
+def check(tsv_path=fact_table_tsv, py_path=path_fact_table_data_py):
+    """
+    :rtype: bool
+    :return: True if the generated module is up to date.
+    """
+    try:
+        with open(py_path, "rb") as f:
+            content = f.read().decode("utf-8")
+    except IOError:
+        return False
+    return content == render_fact_table_module(tsv_path)
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv[1:]:
+        if check():
+            print("{} is up to date".format(path_fact_table_data_py))
+        else:
+            print(
+                "{} is out of date, run 'python -m bgs_deploy.fact_table_build'".format(
+                    path_fact_table_data_py)
+            )
+            sys.exit(1)
+    else:
+        build()
+        print("generated {}".format(path_fact_table_data_py))
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Plan blue / green deployment for many ECS services sharing one terraform state.
+
+A :class:`BlueGreenECSDeployment` scans the full resource list to find its own
+resources. When hundreds of services live in the same terraform state,
+:class:`BlueGreenECSFleet` downloads and parses the state once, indexes it by
+service name and resource type, then hands the index to every service.
+"""
+
+from attrs_mate import attr
+
+from .blue_green_iac import BlueGreenDeployment, BlueGreenECSDeployment
+from .tf_state import ResourceFilter, TfStateIndex, read_tf_state_file
+
+
+DEPLOYMENT_KEYS = ("service_name", "deployment_option", "docker_image_digest", "task_definition_arn")
+
+
+def check_deployment_kwargs(kwargs):
+    """
+    Check one item of the ``deployment_list`` of
+    :meth:`BlueGreenECSFleet.plan` before planning it.
+
+    :type kwargs: dict
+    :raises ValueError: not a dict, missing ``service_name`` /
+        ``deployment_option``, or unknown keys.
+    """
+    if not isinstance(kwargs, dict):
+        raise ValueError("expect a dict, got {!r}".format(kwargs))
+    if "service_name" not in kwargs or "deployment_option" not in kwargs:
+        raise ValueError("service_name and deployment_option are required: {}".format(kwargs))
+    unknown = set(kwargs) - set(DEPLOYMENT_KEYS)
+    if unknown:
+        raise ValueError("unknown keys {}".format(sorted(unknown)))
+
+
+def get_future_plan(deployment):
+    """
+    Evaluate all ``get_future_*`` and ``should_create_*`` methods of a
+    deployment, see :meth:`BlueGreenECSDeployment.compute_plan`.
+
+    :type deployment: BlueGreenECSDeployment
+    :rtype: dict
+    """
+    return deployment.compute_plan().to_dict()
+
+
+@attr.s
+class BlueGreenECSFleet(BlueGreenDeployment):
+    """
+    :type service_names: list
+    :param service_names: optional, if given, only resources of these services
+        are kept when ``tf_state_stream`` is on.
+    """
+    service_names = attr.ib(default=None, kw_only=True)
+
+    _tf_state_index_cache = None
+
+    def _tf_state_resource_filter(self):
+        return ResourceFilter(
+            types=sorted(BlueGreenECSDeployment.TfResourceTypes.Values()),
+            name_prefixes=self.service_names or (),
+        )
+
+    @property
+    def tf_state_index(self):
+        """
+        :rtype: TfStateIndex
+        """
+        if self._tf_state_index_cache is None:
+            tf_state_data = self.tf_state_data
+            if self._tf_state_generation is None:
+                self._tf_state_index_cache = self._build_tf_state_index(tf_state_data)
+            else:
+                # tied to the generation of the terraform state it's built from
+                self._tf_state_index_cache = self.shared_cache.get(
+                    ("tf_state_index", self._tf_state_cache_key(), self._tf_state_generation),
+                    lambda: self._build_tf_state_index(tf_state_data),
+                )
+        return self._tf_state_index_cache
+
+    def warm(self):
+        """
+        Load the terraform state and build its index now instead of on first
+        use.
+
+        :return: self
+        """
+        _ = self.tf_state_index
+        return self
+
+    def _build_tf_state_index(self, tf_state_data):
+        with self.tracer.span("tf_state.index") as span:
+            tf_state_index = TfStateIndex.from_tf_state_data(
+                tf_state_data,
+                types=BlueGreenECSDeployment.TfResourceTypes.Values(),
+            )
+            span.set_attribute("resources", len(tf_state_data["resources"]))
+        return tf_state_index
+
+    def get_deployment(self,
+                       service_name,
+                       deployment_option,
+                       docker_image_digest=None,
+                       task_definition_arn=None):
+        """
+        Create a :class:`BlueGreenECSDeployment` backed by the shared index.
+
+        :rtype: BlueGreenECSDeployment
+        """
+        return BlueGreenECSDeployment(
+            self.boto_ses, self.tf_s3_bucket, self.tf_s3_key,
+            service_name=service_name,
+            deployment_option=deployment_option,
+            docker_image_digest=docker_image_digest,
+            task_definition_arn=task_definition_arn,
+            tf_state_index=self.tf_state_index,
+            tracer=self.tracer,
+        )
+
+    def plan(self, deployment_list):
+        """
+        Plan many services in one call.
+
+        :type deployment_list: list
+        :param deployment_list: list of dict, keys are ``service_name``,
+            ``deployment_option`` and optional ``docker_image_digest``,
+            ``task_definition_arn``.
+
+        :rtype: list
+        :return: one dict per input, in the same order, with keys
+            ``service_name``, ``blue_green_state_data``, ``plan``,
+            ``tf_target_addresses`` and ``error``.
+            An invalid deployment, or a service whose resources in the state
+            are broken, has ``error`` message instead of ``plan``, it doesn't
+            fail the other ones. Only an error loading the state is raised.
+        """
+        self.warm()
+        results = list()
+        for kwargs in deployment_list:
+            result = {
+                "service_name": kwargs.get("service_name") if isinstance(kwargs, dict) else None,
+                "blue_green_state_data": None,
+                "plan": None,
+                "tf_target_addresses": None,
+                "error": None,
+            }
+            try:
+                check_deployment_kwargs(kwargs)
+                deployment = self.get_deployment(**kwargs)
+                result["blue_green_state_data"] = deployment.blue_green_state_data
+                plan = deployment.compute_plan()
+                result["plan"] = plan.to_dict()
+                result["tf_target_addresses"] = deployment.get_tf_target_addresses(plan)
+            # attrs validators of BlueGreenECSDeployment raise AssertionError
+            except (ValueError, AssertionError) as e:
+                result["error"] = str(e) or repr(e)
+            # unexpected resources of this service in the state
+            except Exception as e:
+                result["error"] = repr(e)
+            results.append(result)
+        return results
+
+
+@attr.s
+class LocalTfStateFleet(BlueGreenECSFleet):
+    """
+    A fleet reading the terraform state from a local file instead of S3,
+    ``boto_ses``, ``tf_s3_bucket`` and ``tf_s3_key`` are not used::
+
+        fleet = LocalTfStateFleet(None, None, None, tf_state_path="terraform.tfstate")
+
+    Neither boto3 nor botocore is imported.
+
+    :type tf_state_path: str
+    """
+    tf_state_path = attr.ib(default=None, kw_only=True)
+
+    def _load_tf_state_data(self):
+        return read_tf_state_file(
+            self.tf_state_path,
+            stream=self.tf_state_stream,
+            resource_filter=self._tf_state_resource_filter(),
+        )
+
+    def _get_tf_state_data(self):
+        # a missing or broken local file is an error, not an empty state
+        return self._load_tf_state_data()
@@ -2,6 +2,7 @@
 
 import csv
 import os
+from array import array
 
 from attrs_mate import attr
 from constant2 import Constant
@@ -22,7 +23,7 @@ class ConstantMixIn(Constant):
             raise ValueError(msg)
 
 
-class DeploymentOptions(Constant, ConstantMixIn):
+class DeploymentOptions(ConstantMixIn):
     do_nothing = "do_nothing"
     deploy_to_staging = "deploy_to_staging"
     destroy_staging = "destroy_staging"
@@ -30,50 +31,238 @@ class DeploymentOptions(Constant, ConstantMixIn):
     roll_back_to_previous = "roll_back_to_previous"
 
 
-class DeploymentLogicIds(Constant, ConstantMixIn):
+class DeploymentLogicIds(ConstantMixIn):
     a = "a"
     b = "b"
     c = "c"
 
 
-class DeploymentEnvNames(Constant, ConstantMixIn):
+class DeploymentEnvNames(ConstantMixIn):
     active = "active"
     inactive = "inactive"
     staging = "staging"
 
 
 fact_table_tsv = os.path.join(os.path.dirname(__file__), "fact-table.tsv")
-fact_table_dict = dict()
-"""
-{
-    "do_nothing-0-0-0": {
-        "is_valid": True | False,
-        "future_active": True | False,
-        "future_inactive": True | False,
-        "future_staging": True | False,
-    },
-    ...
-}
-"""
 
 IS_VALID = "is_valid"
 
-with open(fact_table_tsv, newline="") as csvfile:
-    csv_reader = csv.reader(csvfile, delimiter="\t")
-    next(csv_reader)
-    for row in csv_reader:
-        key = "-".join(row[:4])
-        is_valid = bool(int(row[4]))
-        future_active = bool(int(row[5]))
-        future_inactive = bool(int(row[6]))
-        future_staging = bool(int(row[7]))
-        fact_table_dict[key] = {
-            IS_VALID: is_valid,
-            DeploymentEnvNames.active: future_active,
-            DeploymentEnvNames.inactive: future_inactive,
-            DeploymentEnvNames.staging: future_staging,
+
+def read_fact_table_rows(path=fact_table_tsv):
+    """
+    Read the fact table tsv file, without header.
+
+    :rtype: list
+    """
+    with open(path, newline="") as csvfile:
+        csv_reader = csv.reader(csvfile, delimiter="\t")
+        next(csv_reader)
+        return list(csv_reader)
+
+
+_fact_table_dict = None
+
+
+def get_fact_table_dict():
+    """
+    The fact table in human readable format, parsed from the tsv file on
+    first call. The deployment logic uses the compiled :func:`get_fact_table`.
+
+    .. code-block:: python
+
+        {
+            "do_nothing-0-0-0": {
+                "is_valid": True | False,
+                "active": True | False,
+                "inactive": True | False,
+                "staging": True | False,
+            },
+            ...
         }
 
+    :rtype: dict
+    """
+    global _fact_table_dict
+    if _fact_table_dict is None:
+        fact_table_dict = dict()
+        for row in read_fact_table_rows():
+            key = "-".join(row[:4])
+            is_valid = bool(int(row[4]))
+            future_active = bool(int(row[5]))
+            future_inactive = bool(int(row[6]))
+            future_staging = bool(int(row[7]))
+            fact_table_dict[key] = {
+                IS_VALID: is_valid,
+                DeploymentEnvNames.active: future_active,
+                DeploymentEnvNames.inactive: future_inactive,
+                DeploymentEnvNames.staging: future_staging,
+            }
+        _fact_table_dict = fact_table_dict
+    return _fact_table_dict
+
+
+# bit flags of a compiled fact table entry
+FLAG_IS_VALID = 0b0001
+FLAG_FUTURE_ACTIVE = 0b0010
+FLAG_FUTURE_INACTIVE = 0b0100
+FLAG_FUTURE_STAGING = 0b1000
+# key not in fact table, shares no bit with the flags above, so it never
+# looks valid to a caller only testing ``FLAG_IS_VALID``
+FLAG_UNKNOWN = 0b1_0000
+
+env_name_to_future_flag = {
+    DeploymentEnvNames.active: FLAG_FUTURE_ACTIVE,
+    DeploymentEnvNames.inactive: FLAG_FUTURE_INACTIVE,
+    DeploymentEnvNames.staging: FLAG_FUTURE_STAGING,
+}
+
+
+def to_presence_mask(has_active, has_inactive, has_staging):
+    """
+    Encode whether active / inactive / staging exists into a 3-bit integer.
+
+    :rtype: int
+    """
+    return (bool(has_active) << 2) | (bool(has_inactive) << 1) | bool(has_staging)
+
+
+class FactTable(object):
+    """
+    The fact table compiled into a flat integer indexed structure.
+
+    The entry for ``(option_index, presence_mask)`` is at
+    ``option_index * 8 + presence_mask``, its value is a combination of the
+    ``FLAG_*`` bits. The table is padded to 256 bytes, so a batch of keys
+    packed in ``bytes`` can be evaluated with one :meth:`bytes.translate` call.
+
+    :type option_list: list
+    :param option_list: deployment option values, the position is the option index.
+
+    :type flags: bytes
+    """
+
+    def __init__(self, option_list, flags):
+        if len(option_list) * 8 > 256:
+            raise ValueError("too many deployment options for a byte indexed fact table")
+        self.option_list = tuple(option_list)
+        self.option_index = {option: i for i, option in enumerate(self.option_list)}
+        # accept both option value and option index in batch evaluation
+        self._batch_option_index = dict(self.option_index)
+        self._batch_option_index.update({i: i for i in range(len(self.option_list))})
+        self.flags = bytes(flags).ljust(256, bytes([FLAG_UNKNOWN, ]))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        :type rows: list
+        :param rows: rows of the fact table tsv file without header, all
+            values are str.
+
+        :rtype: FactTable
+        """
+        option_list = list()
+        for row in rows:
+            if row[0] not in option_list:
+                option_list.append(row[0])
+        flags = bytearray([FLAG_UNKNOWN, ] * (len(option_list) * 8))
+        for row in rows:
+            option, has_active, has_inactive, has_staging = row[:4]
+            flag = 0
+            for value, bit in zip(
+                row[4:8],
+                (FLAG_IS_VALID, FLAG_FUTURE_ACTIVE, FLAG_FUTURE_INACTIVE, FLAG_FUTURE_STAGING),
+            ):
+                if int(value):
+                    flag |= bit
+            mask = to_presence_mask(int(has_active), int(has_inactive), int(has_staging))
+            flags[option_list.index(option) * 8 + mask] = flag
+        return cls(option_list, flags)
+
+    @classmethod
+    def from_tsv(cls, path=fact_table_tsv):
+        """
+        :type path: str
+        :rtype: FactTable
+        """
+        return cls.from_rows(read_fact_table_rows(path))
+
+    def get_option_index(self, deployment_option):
+        """
+        :type deployment_option: str
+        :rtype: int
+        """
+        try:
+            return self.option_index[deployment_option]
+        except KeyError:
+            DeploymentOptions.validate(
+                value=deployment_option, param_name="deployment_option"
+            )
+            raise
+
+    def lookup(self, option_index, presence_mask):
+        """
+        :type option_index: int
+        :type presence_mask: int
+        :rtype: int
+
+        :raises KeyError: the combination is not defined in the fact table.
+        """
+        flags = self.flags[(option_index << 3) | presence_mask]
+        if flags == FLAG_UNKNOWN:
+            raise KeyError((self.option_list[option_index], presence_mask))
+        return flags
+
+    def evaluate_batch(self, rows):
+        """
+        Evaluate many ``(deployment_option, has_active, has_inactive, has_staging)``
+        rows in one call. ``deployment_option`` can be the option value or
+        the option index.
+
+        :type rows: list
+        :rtype: array.array
+        :return: array of flags, ``FLAG_UNKNOWN`` for undefined key.
+        """
+        option_index = self._batch_option_index
+        keys = bytes([
+            (option_index[option] << 3)
+            | (bool(has_active) << 2) | (bool(has_inactive) << 1) | bool(has_staging)
+            for option, has_active, has_inactive, has_staging in rows
+        ])
+        return array("B", keys.translate(self.flags))
+
+    def evaluate_columns(self, option_indexes, presence_masks):
+        """
+        Columnar version of :meth:`evaluate_batch`, for callers already
+        having integer option indexes and presence masks, for example
+        ``array.array("B")`` or numpy ``uint8`` arrays.
+
+        :rtype: array.array
+        """
+        keys = bytes([
+            (option_index << 3) | presence_mask
+            for option_index, presence_mask in zip(option_indexes, presence_masks)
+        ])
+        return array("B", keys.translate(self.flags))
+
+
+_fact_table = None
+
+
+def get_fact_table():
+    """
+    Load the compiled fact table from the generated ``_fact_table_data``
+    module on first call. Run ``python -m bgs_deploy.fact_table_build``
+    after editing ``fact-table.tsv``.
+
+    :rtype: FactTable
+    """
+    global _fact_table
+    if _fact_table is None:
+        from . import _fact_table_data
+        _fact_table = FactTable(_fact_table_data.OPTION_LIST, _fact_table_data.FLAGS)
+    return _fact_table
+
+
 @attr.s
 class BlueGreenStageDeployment(object):
     @property
@@ -170,23 +359,25 @@ class BlueGreenStageDeployment(object):
 
         :rtype: bool
         """
-        DeploymentOptions.validate(
-            value=deployment_option, param_name="deployment_option"
-        )
-        DeploymentEnvNames.validate(
-            value=bgd_env_name, param_name="bgd_env_name"
-        )
-        key = "{}-{}-{}-{}".format(
-            deployment_option,
-            self.has_active(),
-            self.has_inactive(),
-            self.has_staging(),
+        fact_table = get_fact_table()
+        option_index = fact_table.get_option_index(deployment_option)
+        try:
+            future_flag = env_name_to_future_flag[bgd_env_name]
+        except KeyError:
+            DeploymentEnvNames.validate(
+                value=bgd_env_name, param_name="bgd_env_name"
+            )
+            raise
+        has_active = self.has_active()
+        has_inactive = self.has_inactive()
+        has_staging = self.has_staging()
+        flags = fact_table.lookup(
+            option_index,
+            to_presence_mask(has_active, has_inactive, has_staging),
         )
-        if key not in fact_table_dict:
-            raise KeyError
 
-        if fact_table_dict[key][IS_VALID]:
-            return fact_table_dict[key][bgd_env_name]
+        if flags & FLAG_IS_VALID:
+            return bool(flags & future_flag)
         else:
             d = {
                 0: "not exists",
@@ -198,8 +389,8 @@ class BlueGreenStageDeployment(object):
                 "inactive = {}, "
                 "staging = {}"
             ).format(
-                d[int(self.has_active())],
-                d[int(self.has_inactive())],
-                d[int(self.has_staging())],
+                d[int(has_active)],
+                d[int(has_inactive)],
+                d[int(has_staging)],
             )
             raise Exception(msg)
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from bgs_deploy.devops.config_init import config
+from bgs_deploy.devops.config_init import get_config
 
 def handler(event, context):
+    config = get_config()
     msg = "Hello {}! This is a demo project called %s" % config.PROJECT_NAME.get_value()
     if event.get("name"):
         return msg.format(event.get("name"))
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""
+Streaming, parallel file hashing for build artifacts.
+
+Files are read in fixed size chunks, files larger than
+:data:`MMAP_THRESHOLD` are memory mapped, so a 200 MB lambda layer never
+sits in memory as one ``bytes``. ``hashlib`` releases the GIL while hashing
+large buffers, :func:`hash_files` hashes many files in a thread pool.
+
+A :class:`HashManifest` remembers the digest of a file by its path, size and
+mtime, unchanged files are never read again::
+
+    manifest = HashManifest(path=".bgs-hash-manifest.json")
+    digests = hash_files(paths, algorithm="sha256", manifest=manifest)
+    manifest.save()
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from attrs_mate import attr
+
+SUPPORTED_ALGORITHMS = ("md5", "sha256")
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+MMAP_THRESHOLD = 64 * 1024 * 1024  # 64 MB
+
+
+def new_hasher(algorithm):
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        raise ValueError("algorithm has to be one of {}, got {!r}".format(
+            SUPPORTED_ALGORITHMS, algorithm))
+    return hashlib.new(algorithm)
+
+
+def hash_fileobj(f, algorithm="md5", chunk_size=CHUNK_SIZE):
+    """
+    Hash a binary file object from its current position to the end.
+
+    :rtype: str
+    """
+    hasher = new_hasher(algorithm)
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_file(path,
+              algorithm="md5",
+              chunk_size=CHUNK_SIZE,
+              mmap_threshold=MMAP_THRESHOLD):
+    """
+    :type path: str
+
+    :type algorithm: str
+    :param algorithm: "md5" or "sha256".
+
+    :type chunk_size: int
+    :param chunk_size: bytes hashed per ``update()`` call.
+
+    :type mmap_threshold: int
+    :param mmap_threshold: files of this size or larger are memory mapped
+        instead of read.
+
+    :rtype: str
+    :return: hex digest.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or size < mmap_threshold:
+            return hash_fileobj(f, algorithm=algorithm, chunk_size=chunk_size)
+        hasher = new_hasher(algorithm)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for offset in range(0, size, chunk_size):
+                    hasher.update(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+        return hasher.hexdigest()
+
+
+@attr.s
+class HashManifest(object):
+    """
+    ``{abspath: {"size", "mtime_ns", "<algorithm>": digest}}``, a digest is
+    only valid while the file keeps the same size and mtime. Thread safe.
+
+    :type path: str
+    :param path: optional json file, loaded on creation and written by
+        :meth:`save`. Without it the manifest only lives in memory.
+    """
+    path = attr.ib(default=None)
+
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+
+    _entries = attr.ib(factory=dict, init=False, repr=False)
+    _lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                self._entries = json.loads(f.read().decode("utf-8"))
+        except (IOError, OSError, ValueError):
+            self._entries = dict()
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def get(self, path, algorithm, stat):
+        """
+        :type stat: os.stat_result
+        :rtype: str
+        :return: None if unknown or the file changed.
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            if entry is not None \
+                    and entry["size"] == stat.st_size \
+                    and entry["mtime_ns"] == stat.st_mtime_ns \
+                    and algorithm in entry:
+                self.hits += 1
+                return entry[algorithm]
+            self.misses += 1
+            return None
+
+    def put(self, path, algorithm, stat, digest):
+        key = self._key(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None \
+                    or entry["size"] != stat.st_size \
+                    or entry["mtime_ns"] != stat.st_mtime_ns:
+                entry = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                self._entries[key] = entry
+            entry[algorithm] = digest
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            data = json.dumps(self._entries, indent=4, sort_keys=True).encode("utf-8")
+        dir_path = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dir_path, exist_ok=True)
+        path_tmp = "{}.{}.tmp".format(self.path, uuid.uuid4().hex)
+        with open(path_tmp, "wb") as f:
+            f.write(data)
+        os.replace(path_tmp, self.path)
+
+
+def hash_file_cached(path, algorithm="md5", manifest=None, **kwargs):
+    """
+    :func:`hash_file`, but look up ``manifest`` first.
+
+    :type manifest: HashManifest
+
+    :rtype: str
+    """
+    if manifest is None:
+        return hash_file(path, algorithm=algorithm, **kwargs)
+    stat = os.stat(path)
+    digest = manifest.get(path, algorithm, stat)
+    if digest is None:
+        digest = hash_file(path, algorithm=algorithm, **kwargs)
+        # the file may have changed while being hashed, then don't cache it
+        if os.stat(path).st_mtime_ns == stat.st_mtime_ns:
+            manifest.put(path, algorithm, stat, digest)
+    return digest
+
+
+def hash_files(paths, algorithm="md5", manifest=None, max_workers=4, **kwargs):
+    """
+    Hash many files concurrently.
+
+    :type paths: list
+    :type max_workers: int
+
+    :rtype: dict
+    :return: ``{path: digest}`` in the order of ``paths``.
+    """
+    paths = list(paths)
+    if not paths:
+        return dict()
+
+    def hash_one(path):
+        return hash_file_cached(path, algorithm=algorithm, manifest=manifest, **kwargs)
+
+    if max_workers <= 1 or len(paths) == 1:
+        digests = [hash_one(path) for path in paths]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            digests = list(executor.map(hash_one, paths))
+    return dict(zip(paths, digests))
+
+
+def main(argv=None):
+    """
+    Print the digest of each file, one per line, in the argument order.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the hex digest of files")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--algorithm", default="md5", choices=SUPPORTED_ALGORITHMS)
+    args = parser.parse_args(argv)
+    for digest in hash_files(args.paths, algorithm=args.algorithm).values():
+        print(digest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deployment ledger, the history of every service's blue / green state, built
+from the S3 object versions of the terraform state.
+
+Rolling back further than one step needs a ``task_definition_arn`` that is no
+longer in the current state. :class:`DeploymentLedger` lists the object
+versions of the state file, fetches and parses the new ones in parallel,
+reduces each to the ``blue_green_state_data`` of every service, and stores it
+in an indexed SQLite file. Versions already in the ledger are never fetched
+again.
+
+``LastModified`` only has a one second resolution, versions of the same second
+are ordered by ``seq``, the order in which they were listed.
+
+Usage::
+
+    ledger = DeploymentLedger("ledger.sqlite", bucket="my-bucket", key="terraform.tfstate")
+    ledger.sync(s3_client)
+    ledger.get_digest_history("helpdesk", limit=20)
+"""
+
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from attrs_mate import attr
+
+from .blue_green_iac import BlueGreenECSDeployment
+from .tf_state import ResourceFilter, TfStateIndex, load_tf_state
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS state_version (
+    version_id TEXT PRIMARY KEY,
+    last_modified REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    size INTEGER,
+    etag TEXT
+);
+CREATE TABLE IF NOT EXISTS logic_id_version (
+    version_id TEXT NOT NULL,
+    last_modified REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    service_name TEXT NOT NULL,
+    logic_id TEXT NOT NULL,
+    docker_image_digest TEXT,
+    task_definition_arn TEXT,
+    task_definition_arg TEXT,
+    PRIMARY KEY (version_id, service_name, logic_id)
+);
+CREATE INDEX IF NOT EXISTS ix_logic_id_version_service
+    ON logic_id_version (service_name, last_modified, seq);
+CREATE INDEX IF NOT EXISTS ix_logic_id_version_digest
+    ON logic_id_version (service_name, docker_image_digest, last_modified, seq);
+CREATE TABLE IF NOT EXISTS blue_green_stage_version (
+    version_id TEXT NOT NULL,
+    last_modified REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    service_name TEXT NOT NULL,
+    blue_green_stage TEXT NOT NULL,
+    logic_id TEXT,
+    PRIMARY KEY (version_id, service_name, blue_green_stage)
+);
+CREATE INDEX IF NOT EXISTS ix_blue_green_stage_version_service
+    ON blue_green_stage_version (service_name, blue_green_stage, last_modified, seq);
+"""
+
+DeploymentParameters = BlueGreenECSDeployment.DeploymentParameters
+
+
+def reduce_tf_state(tf_state_data):
+    """
+    Reduce a terraform state to the ``blue_green_state_data`` of every
+    service in it. Services whose resources don't follow the naming
+    convention are left out.
+
+    :type tf_state_data: dict
+
+    :rtype: dict
+    :return: ``{service_name: blue_green_state_data}``
+    """
+    index = TfStateIndex.from_tf_state_data(
+        tf_state_data, types=BlueGreenECSDeployment.TfResourceTypes.Values())
+    result = dict()
+    for service_name in index.service_names():
+        deployment = BlueGreenECSDeployment(
+            None, None, None,
+            service_name=service_name,
+            deployment_option=BlueGreenECSDeployment.DeploymentOptions.do_nothing,
+            tf_state_index=index,
+        )
+        try:
+            result[service_name] = deployment.blue_green_state_data
+        except (KeyError, IndexError, TypeError, ValueError):
+            pass
+    return result
+
+
+def fetch_state_version(s3_client, bucket, key, version_id):
+    """
+    Download, parse and reduce one version of the terraform state.
+
+    :rtype: dict
+    :return: ``{service_name: blue_green_state_data}``
+    """
+    body = s3_client.get_object(Bucket=bucket, Key=key, VersionId=version_id)["Body"]
+    try:
+        tf_state_data = load_tf_state(body, resource_filter=ResourceFilter(
+            types=sorted(BlueGreenECSDeployment.TfResourceTypes.Values())))
+    finally:
+        body.close()
+    return reduce_tf_state(tf_state_data)
+
+
+def list_state_versions(s3_client, bucket, key):
+    """
+    All versions of the object, delete markers excluded.
+
+    :rtype: list
+    :return: list of dict with ``VersionId``, ``LastModified``, ``Size``, ``ETag``.
+    """
+    versions = list()
+    paginator = s3_client.get_paginator("list_object_versions")
+    for page in paginator.paginate(Bucket=bucket, Prefix=key):
+        for version in page.get("Versions", []):
+            if version["Key"] == key:
+                versions.append(version)
+    return versions
+
+
+@attr.s
+class SyncResult(object):
+    """
+    :type n_fetched: int
+    :param n_fetched: versions added to the ledger by this sync.
+
+    :type errors: dict
+    :param errors: ``{version_id: exception}``, retried by the next sync.
+    """
+    n_versions = attr.ib(default=0)
+    n_fetched = attr.ib(default=0)
+    errors = attr.ib(factory=dict)
+    elapsed = attr.ib(default=None)
+
+
+@attr.s
+class DeploymentLedger(object):
+    """
+    :type db_path: str
+    :param db_path: the SQLite file, ``":memory:"`` works too.
+
+    :type bucket: str
+    :type key: str
+    :param key: the terraform state file, one ledger per state file.
+    """
+    db_path = attr.ib()
+    bucket = attr.ib()
+    key = attr.ib()
+
+    _connection = attr.ib(default=None, init=False, repr=False)
+
+    @property
+    def connection(self):
+        """
+        :rtype: sqlite3.Connection
+        """
+        if self._connection is None:
+            connection = sqlite3.connect(self.db_path)
+            connection.row_factory = sqlite3.Row
+            # one transaction per version, don't fsync each of them
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.executescript(SCHEMA)
+            with connection:
+                for name in ("bucket", "key"):
+                    connection.execute(
+                        "INSERT OR IGNORE INTO ledger_meta (name, value) VALUES (?, ?)",
+                        (name, getattr(self, name)))
+            meta = dict(connection.execute("SELECT name, value FROM ledger_meta").fetchall())
+            for name in ("bucket", "key"):
+                if meta[name] != getattr(self, name):
+                    connection.close()
+                    raise ValueError("{} is the ledger of {} '{}', not '{}'".format(
+                        self.db_path, name, meta[name], getattr(self, name)))
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def get_version_ids(self):
+        """
+        :rtype: set
+        """
+        return set(
+            row[0] for row in self.connection.execute("SELECT version_id FROM state_version"))
+
+    def get_max_seq(self):
+        """
+        :rtype: int
+        """
+        return self.connection.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM state_version").fetchone()[0]
+
+    def add_version(self,
+                    version_id,
+                    last_modified,
+                    services_state_data,
+                    seq=None,
+                    size=None,
+                    etag=None):
+        """
+        Store one reduced state version, in one transaction.
+
+        :type last_modified: float
+        :param last_modified: unix timestamp.
+
+        :type seq: int
+        :param seq: orders versions with the same ``last_modified``, default
+            is after all known versions.
+
+        :type services_state_data: dict
+        :param services_state_data: ``{service_name: blue_green_state_data}``,
+            see :func:`reduce_tf_state`.
+        """
+        if seq is None:
+            seq = self.get_max_seq() + 1
+        logic_id_rows = list()
+        blue_green_stage_rows = list()
+        for service_name, state_data in services_state_data.items():
+            for logic_id, config_values in state_data["logic_id"].items():
+                if not any(config_values.values()):
+                    continue
+                logic_id_rows.append((
+                    version_id, last_modified, seq, service_name, logic_id,
+                    config_values[DeploymentParameters.docker_image_digest],
+                    config_values[DeploymentParameters.task_definition_arn],
+                    config_values[DeploymentParameters.task_definition_arg],
+                ))
+            for blue_green_stage, stage_data in state_data["blue_green_stage"].items():
+                if stage_data["logic_id"] is None:
+                    continue
+                blue_green_stage_rows.append((
+                    version_id, last_modified, seq, service_name, blue_green_stage,
+                    stage_data["logic_id"],
+                ))
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO state_version (version_id, last_modified, seq, size, etag) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (version_id, last_modified, seq, size, etag))
+            connection.executemany(
+                "INSERT OR REPLACE INTO logic_id_version VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                logic_id_rows)
+            connection.executemany(
+                "INSERT OR REPLACE INTO blue_green_stage_version VALUES (?, ?, ?, ?, ?, ?)",
+                blue_green_stage_rows)
+
+    def sync(self, s3_client, max_workers=8):
+        """
+        Fetch the versions not in the ledger yet, in parallel. A failed version
+        is not stored, the next sync retries it.
+
+        :rtype: SyncResult
+        """
+        start = time.monotonic()
+        versions = list_state_versions(s3_client, self.bucket, self.key)
+        known = self.get_version_ids()
+        # listed newest first
+        new_versions = [
+            version for version in reversed(versions) if version["VersionId"] not in known]
+        max_seq = self.get_max_seq()
+        seqs = {
+            version["VersionId"]: max_seq + i
+            for i, version in enumerate(new_versions, start=1)
+        }
+        result = SyncResult(n_versions=len(versions))
+        if new_versions:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(new_versions))) as executor:
+                future_to_version = {
+                    executor.submit(
+                        fetch_state_version,
+                        s3_client, self.bucket, self.key, version["VersionId"],
+                    ): version
+                    for version in new_versions
+                }
+                # sqlite is only written from this thread
+                for future in as_completed(future_to_version):
+                    version = future_to_version[future]
+                    try:
+                        services_state_data = future.result()
+                    except Exception as e:
+                        result.errors[version["VersionId"]] = e
+                        continue
+                    self.add_version(
+                        version["VersionId"],
+                        version["LastModified"].timestamp(),
+                        services_state_data,
+                        seq=seqs[version["VersionId"]],
+                        size=version.get("Size"),
+                        etag=version.get("ETag"),
+                    )
+                    result.n_fetched += 1
+        result.elapsed = time.monotonic() - start
+        return result
+
+    def get_digest_history(self, service_name, limit=20):
+        """
+        The last docker image digests deployed for a service, most recent
+        first.
+
+        :rtype: list
+        :return: list of dict with ``docker_image_digest``,
+            ``task_definition_arn``, ``first_seen`` and ``last_seen``
+            (unix timestamps).
+        """
+        rows = self.connection.execute(
+            """
+            SELECT docker_image_digest,
+                   task_definition_arn,
+                   MIN(last_modified) AS first_seen,
+                   MAX(last_modified) AS last_seen,
+                   MAX(seq) AS last_seq,
+                   MIN(seq) AS first_seq
+            FROM logic_id_version
+            WHERE service_name = ? AND docker_image_digest IS NOT NULL
+            GROUP BY docker_image_digest, task_definition_arn
+            ORDER BY last_seen DESC, last_seq DESC, first_seq DESC
+            LIMIT ?
+            """,
+            (service_name, limit),
+        )
+        return [
+            {
+                "docker_image_digest": row["docker_image_digest"],
+                "task_definition_arn": row["task_definition_arn"],
+                "first_seen": row["first_seen"],
+                "last_seen": row["last_seen"],
+            }
+            for row in rows
+        ]
+
+    def find_task_definition_arn(self, service_name, docker_image_digest):
+        """
+        The most recent task definition arn which ran this digest.
+
+        :rtype: str
+        :return: None if the digest was never deployed.
+        """
+        row = self.connection.execute(
+            """
+            SELECT task_definition_arn
+            FROM logic_id_version
+            WHERE service_name = ? AND docker_image_digest = ?
+                AND task_definition_arn IS NOT NULL
+            ORDER BY last_modified DESC, seq DESC
+            LIMIT 1
+            """,
+            (service_name, docker_image_digest),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def get_stage_history(self, service_name, blue_green_stage="active", limit=20):
+        """
+        What ran in a blue / green stage over time, most recent first,
+        consecutive versions with the same task definition are merged.
+
+        :rtype: list
+        :return: list of dict with ``logic_id``, ``docker_image_digest``,
+            ``task_definition_arn``, ``first_seen`` and ``last_seen``.
+        """
+        rows = self.connection.execute(
+            """
+            SELECT s.last_modified, s.logic_id,
+                   l.docker_image_digest, l.task_definition_arn
+            FROM blue_green_stage_version s
+            LEFT JOIN logic_id_version l
+                ON l.version_id = s.version_id
+                AND l.service_name = s.service_name
+                AND l.logic_id = s.logic_id
+            WHERE s.service_name = ? AND s.blue_green_stage = ?
+            ORDER BY s.last_modified DESC, s.seq DESC
+            """,
+            (service_name, blue_green_stage),
+        )
+        history = list()
+        for row in rows:
+            if history \
+                    and history[-1]["logic_id"] == row["logic_id"] \
+                    and history[-1]["task_definition_arn"] == row["task_definition_arn"]:
+                history[-1]["first_seen"] = row["last_modified"]
+                continue
+            if len(history) == limit:
+                break
+            history.append({
+                "logic_id": row["logic_id"],
+                "docker_image_digest": row["docker_image_digest"],
+                "task_definition_arn": row["task_definition_arn"],
+                "first_seen": row["last_modified"],
+                "last_seen": row["last_modified"],
+            })
+        return history
+
+    def get_blue_green_state_data(self, service_name, version_id):
+        """
+        Rebuild the ``blue_green_state_data`` of a service at a state version.
+
+        :rtype: dict
+        """
+        state_data = BlueGreenECSDeployment(
+            None, None, None,
+            service_name=service_name,
+            deployment_option=BlueGreenECSDeployment.DeploymentOptions.do_nothing,
+        )._initial_blue_green_state_data()
+        for row in self.connection.execute(
+                "SELECT * FROM logic_id_version WHERE version_id = ? AND service_name = ?",
+                (version_id, service_name)):
+            for parameter_name in DeploymentParameters.Values():
+                state_data["logic_id"][row["logic_id"]][parameter_name] = row[parameter_name]
+        for row in self.connection.execute(
+                "SELECT * FROM blue_green_stage_version WHERE version_id = ? AND service_name = ?",
+                (version_id, service_name)):
+            state_data["blue_green_stage"][row["blue_green_stage"]]["logic_id"] = row["logic_id"]
+        return state_data
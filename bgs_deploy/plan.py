@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+Frozen result of a blue / green deployment plan.
+
+:meth:`bgs_deploy.blue_green_iac.BlueGreenECSDeployment.compute_plan` evaluates
+all ``get_future_*`` and ``should_create_*`` methods once and stores the
+answers in a :class:`DeploymentPlan`. Template renderers read the plan, or
+its :meth:`DeploymentPlan.to_tfvars` map, instead of calling the deployment
+object again.
+"""
+
+import json
+from types import MappingProxyType
+
+
+def _freeze(dct):
+    return MappingProxyType(dict(dct))
+
+
+class DeploymentPlan(object):
+    """
+    :type service_name: str
+
+    :type deployment_option: str
+
+    :type logic_id_config_values: dict
+    :param logic_id_config_values: ``{logic_id: {parameter_name: value}}``,
+        the future config value of each logic id.
+
+    :type blue_green_stage_logic_id: dict
+    :param blue_green_stage_logic_id: ``{blue_green_stage: logic_id}``, which
+        logic id each active / inactive / staging stage points to.
+
+    :type should_create_logic_id: dict
+    :param should_create_logic_id: ``{logic_id: bool}``
+
+    :type should_create_blue_green_stage: dict
+    :param should_create_blue_green_stage: ``{blue_green_stage: bool}``
+
+    :type reused_task_definition: dict
+    :param reused_task_definition: ``{"logic_id": ..., "task_definition_arn": ...}``
+        if staging reuses the task definition of the active logic id running
+        the same docker image digest, otherwise None. The staging
+        ``task_definition_arg`` is then this arn, not a new task definition.
+    """
+    __slots__ = (
+        "service_name",
+        "deployment_option",
+        "logic_id_config_values",
+        "blue_green_stage_logic_id",
+        "should_create_logic_id",
+        "should_create_blue_green_stage",
+        "reused_task_definition",
+    )
+
+    def __init__(self,
+                 service_name,
+                 deployment_option,
+                 logic_id_config_values,
+                 blue_green_stage_logic_id,
+                 should_create_logic_id,
+                 should_create_blue_green_stage,
+                 reused_task_definition=None):
+        set_attr = super(DeploymentPlan, self).__setattr__
+        set_attr("service_name", service_name)
+        set_attr("deployment_option", deployment_option)
+        set_attr("logic_id_config_values", _freeze({
+            logic_id: _freeze(config_values)
+            for logic_id, config_values in logic_id_config_values.items()
+        }))
+        set_attr("blue_green_stage_logic_id", _freeze(blue_green_stage_logic_id))
+        set_attr("should_create_logic_id", _freeze({
+            logic_id: bool(flag)
+            for logic_id, flag in should_create_logic_id.items()
+        }))
+        set_attr("should_create_blue_green_stage", _freeze({
+            blue_green_stage: bool(flag)
+            for blue_green_stage, flag in should_create_blue_green_stage.items()
+        }))
+        set_attr("reused_task_definition", None if reused_task_definition is None
+                 else _freeze(reused_task_definition))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __eq__(self, other):
+        if not isinstance(other, DeploymentPlan):
+            return NotImplemented
+        return self.to_dict() == other.to_dict() \
+               and self.service_name == other.service_name \
+               and self.deployment_option == other.deployment_option
+
+    def __hash__(self):
+        return hash(json.dumps(self.to_tfvars(), sort_keys=True))
+
+    def __repr__(self):
+        return "{}(service_name={!r}, deployment_option={!r})".format(
+            self.__class__.__name__, self.service_name, self.deployment_option)
+
+    def get_config_value(self, logic_id, parameter_name):
+        return self.logic_id_config_values[logic_id][parameter_name]
+
+    def get_logic_id(self, blue_green_stage):
+        return self.blue_green_stage_logic_id[blue_green_stage]
+
+    def to_dict(self):
+        """
+        Same layout as ``blue_green_state_data``, plus the ``should_create``
+        flags and ``reused_task_definition``.
+
+        :rtype: dict
+        """
+        return {
+            "logic_id": {
+                logic_id: dict(config_values)
+                for logic_id, config_values in self.logic_id_config_values.items()
+            },
+            "blue_green_stage": {
+                blue_green_stage: {"logic_id": logic_id}
+                for blue_green_stage, logic_id in self.blue_green_stage_logic_id.items()
+            },
+            "should_create": {
+                "logic_id": dict(self.should_create_logic_id),
+                "blue_green_stage": dict(self.should_create_blue_green_stage),
+            },
+            "reused_task_definition": None if self.reused_task_definition is None
+            else dict(self.reused_task_definition),
+        }
+
+    def to_tfvars(self):
+        """
+        Flat terraform variables map, for example with service ``helpdesk``::
+
+            {
+                "helpdesk_logic_a_docker_image_digest": "...",
+                "helpdesk_logic_a_should_create": true,
+                "helpdesk_active_logic_id": "a",
+                "helpdesk_active_should_create": true,
+                ...
+            }
+
+        :rtype: dict
+        """
+        tfvars = dict()
+        for logic_id, config_values in sorted(self.logic_id_config_values.items()):
+            prefix = "{}_logic_{}".format(self.service_name, logic_id)
+            for parameter_name, value in sorted(config_values.items()):
+                tfvars["{}_{}".format(prefix, parameter_name)] = value
+            tfvars["{}_should_create".format(prefix)] = self.should_create_logic_id[logic_id]
+        for blue_green_stage, logic_id in sorted(self.blue_green_stage_logic_id.items()):
+            prefix = "{}_{}".format(self.service_name, blue_green_stage)
+            tfvars["{}_logic_id".format(prefix)] = logic_id
+            tfvars["{}_should_create".format(prefix)] = \
+                self.should_create_blue_green_stage[blue_green_stage]
+        return tfvars
+
+    def to_tfvars_json(self, indent=None):
+        """
+        Content of a ``*.tfvars.json`` file.
+
+        :rtype: str
+        """
+        return json.dumps(self.to_tfvars(), indent=indent, sort_keys=True)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+"""
+Long running planning service with warm state.
+
+Every CI job used to start python, import boto3, download and parse the
+terraform state and plan one service. :class:`PlanService` keeps the boto3
+session and clients, the parsed terraform state and its index (in a
+:class:`~bgs_deploy.shared_cache.SharedCache`, refreshed after ``ttl``) and
+the compiled fact table in memory, and :func:`make_server` serves it over
+HTTP to concurrent clients:
+
+- ``POST /plan``, body is a json list of deployments (or
+  ``{"deployments": [...]}``), same keys as
+  :meth:`bgs_deploy.fleet.BlueGreenECSFleet.plan`. Returns
+  ``{"results": [...], "elapsed": seconds}``.
+- ``POST /invalidate``, drop the cached state, the next plan loads it again.
+- ``GET /metrics``, request count, errors and latency percentiles per
+  endpoint, and the cache counters.
+- ``GET /health``
+
+Usage::
+
+    python -m bgs_deploy.plan_server --bucket my-bucket --key terraform.tfstate --port 8765
+"""
+
+import collections
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from attrs_mate import attr
+
+from .fleet import BlueGreenECSFleet, check_deployment_kwargs
+from .shared_cache import SharedCache
+from .tracing import noop_tracer
+
+MAX_BODY_SIZE = 10 * 1024 * 1024  # 10 MB
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    One thread per connection, same as ``http.server.ThreadingHTTPServer``
+    of Python 3.7+.
+    """
+    daemon_threads = True
+
+
+class LatencyStats(object):
+    """
+    Request count, error count and latency percentiles of the last
+    ``window`` requests. Thread safe.
+    """
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.errors = 0
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=False):
+        with self._lock:
+            self.count += 1
+            if error:
+                self.errors += 1
+            self._latencies.append(latency)
+
+    def to_dict(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data = {"count": self.count, "errors": self.errors}
+        if not latencies:
+            return data
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        data.update({
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": latencies[-1],
+            "mean": sum(latencies) / len(latencies),
+        })
+        return data
+
+
+@attr.s
+class PlanService(object):
+    """
+    :param boto_ses: boto3 session, kept for the life of the service.
+
+    :type ttl: float
+    :param ttl: seconds the parsed terraform state is reused.
+    """
+    boto_ses = attr.ib()
+    tf_s3_bucket = attr.ib()
+    tf_s3_key = attr.ib()
+    ttl = attr.ib(default=30)
+    tf_state_stream = attr.ib(default=False)
+    tf_state_cache = attr.ib(default=None)
+    tracer = attr.ib(default=noop_tracer)
+
+    shared_cache = attr.ib(default=None, init=False)
+    metrics = attr.ib(factory=dict, init=False)
+    started_at = attr.ib(factory=time.time, init=False)
+
+    _metrics_lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.shared_cache = SharedCache(ttl=self.ttl)
+
+    def get_fleet(self):
+        """
+        A new fleet per request, the state and index come from the shared
+        cache, so a request always plans against one state. A state that
+        can't be loaded fails the request with 500, instead of planning
+        against an empty state.
+
+        :rtype: BlueGreenECSFleet
+        """
+        return BlueGreenECSFleet(
+            self.boto_ses, self.tf_s3_bucket, self.tf_s3_key,
+            tf_state_stream=self.tf_state_stream,
+            tf_state_cache=self.tf_state_cache,
+            tracer=self.tracer,
+            shared_cache=self.shared_cache,
+            strict_tf_state=True,
+        )
+
+    def warm(self):
+        """
+        Load the terraform state, its index and the fact table before the
+        first request.
+        """
+        from .framework import get_fact_table
+
+        get_fact_table()
+        self.get_fleet().warm()
+
+    def plan(self, deployment_list):
+        """
+        :type deployment_list: list
+        :rtype: list
+        """
+        return self.get_fleet().plan(deployment_list)
+
+    def invalidate(self):
+        self.shared_cache.invalidate()
+
+    def record(self, endpoint, latency, error=False):
+        """
+        Record one request, handler threads share the ``metrics`` dict.
+        """
+        with self._metrics_lock:
+            stats = self.metrics.get(endpoint)
+            if stats is None:
+                stats = self.metrics[endpoint] = LatencyStats()
+        stats.record(latency, error=error)
+
+    def get_metrics(self):
+        """
+        :rtype: dict
+        """
+        with self._metrics_lock:
+            metrics = sorted(self.metrics.items())
+        return {
+            "uptime": time.time() - self.started_at,
+            "requests": {
+                endpoint: stats.to_dict()
+                for endpoint, stats in metrics
+            },
+            "cache": self.shared_cache.stats(),
+        }
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_deployment_list(body):
+    """
+    :type body: bytes
+    :rtype: list
+    """
+    try:
+        data = json.loads(body.decode("utf-8"))
+    except ValueError as e:
+        raise BadRequest("invalid json: {}".format(e))
+    if isinstance(data, dict):
+        data = data.get("deployments")
+    if not isinstance(data, list):
+        raise BadRequest("expect a list of deployments or {\"deployments\": [...]}")
+    for item in data:
+        try:
+            check_deployment_kwargs(item)
+        except ValueError as e:
+            raise BadRequest(str(e))
+    return data
+
+
+class PlanRequestHandler(BaseHTTPRequestHandler):
+    service = None  # type: PlanService
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, sort_keys=True).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_SIZE:
+            # the body is not read, the next request can't be parsed from
+            # this connection
+            self.close_connection = True
+            raise BadRequest("body larger than {} bytes".format(MAX_BODY_SIZE))
+        return self.rfile.read(length)
+
+    def _handle(self, routes):
+        start = time.perf_counter()
+        path = self.path.split("?", 1)[0]
+        endpoint = "{} {}".format(self.command, path)
+        handler = routes.get(path)
+        if handler is None:
+            if self.headers.get("Content-Length", "0") != "0":
+                self.close_connection = True
+            self._send_json(404, {"error": "not found: {}".format(endpoint)})
+            return
+        try:
+            status, data = handler()
+        except BadRequest as e:
+            status, data = 400, {"error": str(e)}
+        except Exception as e:
+            status, data = 500, {"error": repr(e)}
+        elapsed = time.perf_counter() - start
+        if "elapsed" in data:
+            data["elapsed"] = elapsed
+        # recorded before the response is written, a client reading
+        # /metrics right after its request sees it counted
+        self.service.record(endpoint, elapsed, error=status >= 400)
+        self._send_json(status, data)
+
+    def do_GET(self):
+        self._handle({
+            "/health": lambda: (200, {"status": "ok"}),
+            "/metrics": lambda: (200, self.service.get_metrics()),
+        })
+
+    def do_POST(self):
+        self._handle({
+            "/plan": self._plan,
+            "/invalidate": self._invalidate,
+        })
+
+    def _plan(self):
+        deployment_list = parse_deployment_list(self._read_body())
+        return 200, {"results": self.service.plan(deployment_list), "elapsed": None}
+
+    def _invalidate(self):
+        self._read_body()
+        self.service.invalidate()
+        return 200, {"status": "ok"}
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    """
+    :type service: PlanService
+
+    :type port: int
+    :param port: 0 picks a free port, see ``server.server_address``.
+
+    :rtype: ThreadingHTTPServer
+    """
+    handler_class = type("BoundPlanRequestHandler", (PlanRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler_class)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve blue / green plans over HTTP")
+    parser.add_argument("--bucket", required=True, help="terraform state bucket")
+    parser.add_argument("--key", required=True, help="terraform state key")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", default=None, help="AWS profile")
+    parser.add_argument("--ttl", type=float, default=30, help="seconds the state is reused")
+    parser.add_argument("--stream", action="store_true", help="stream parse the state")
+    args = parser.parse_args(argv)
+
+    import boto3
+
+    service = PlanService(
+        boto3.session.Session(profile_name=args.profile),
+        args.bucket, args.key,
+        ttl=args.ttl,
+        tf_state_stream=args.stream,
+    )
+    service.warm()
+    server = make_server(service, host=args.host, port=args.port)
+    print("serving plans of s3://{}/{} on http://{}:{}".format(
+        args.bucket, args.key, *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
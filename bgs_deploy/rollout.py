@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+Roll out many ECS services in dependency waves.
+
+:class:`RolloutScheduler` takes a list of :class:`ServiceRollout`, orders
+them into waves with Kahn's algorithm (a service runs after all services it
+``depends_on``), and runs planning plus an injectable apply step for each
+wave with at most ``max_workers`` services at the same time, with per
+service timeout and fail fast cancellation.
+
+The apply step is a callable ``apply_func(deployment, plan, cancel_event)``,
+for example a function running ``terraform apply -target=...``. Every
+service gets its own ``cancel_event`` (a :class:`threading.Event`), set when
+the service times out or the rollout is cancelled. The apply should check it
+if it runs for long, a thread can't be killed: a timed out service is
+abandoned, its worker keeps running in the background but no longer takes a
+slot of ``max_workers``.
+"""
+
+import collections
+import time
+import threading
+
+from attrs_mate import attr
+from constant2 import Constant
+
+
+class RolloutStatus(Constant):
+    succeeded = "succeeded"
+    failed = "failed"
+    timeout = "timeout"
+    cancelled = "cancelled"
+    skipped = "skipped"  # a dependency didn't succeed
+
+
+@attr.s
+class ServiceRollout(object):
+    """
+    :type depends_on: list
+    :param depends_on: service names which have to succeed first.
+
+    :type timeout: float
+    :param timeout: seconds, overrides :attr:`RolloutScheduler.timeout`.
+    """
+    service_name = attr.ib()
+    deployment_option = attr.ib()
+    docker_image_digest = attr.ib(default=None)
+    task_definition_arn = attr.ib(default=None)
+    depends_on = attr.ib(factory=list)
+    timeout = attr.ib(default=None)
+
+
+@attr.s
+class RolloutResult(object):
+    """
+    :type plan: bgs_deploy.plan.DeploymentPlan
+    :param plan: None if planning failed or never started.
+
+    :param apply_result: return value of ``apply_func``.
+
+    :type wave: int
+    :param wave: 0 based index of the wave the service belongs to.
+    """
+    service_name = attr.ib()
+    wave = attr.ib()
+    status = attr.ib(default=None)
+    plan = attr.ib(default=None)
+    apply_result = attr.ib(default=None)
+    error = attr.ib(default=None)
+    elapsed = attr.ib(default=None)
+
+    @property
+    def ok(self):
+        return self.status == RolloutStatus.succeeded
+
+
+def build_waves(rollouts):
+    """
+    Group services into waves, every service only depends on services of
+    previous waves. Services in a wave are in input order.
+
+    :type rollouts: list
+    :param rollouts: list of :class:`ServiceRollout`.
+
+    :rtype: list
+    :return: list of list of service names.
+    """
+    order = dict()
+    for rollout in rollouts:
+        if rollout.service_name in order:
+            raise ValueError(f"duplicate service '{rollout.service_name}'")
+        order[rollout.service_name] = len(order)
+
+    n_pending_deps = dict()
+    dependents = {service_name: list() for service_name in order}
+    for rollout in rollouts:
+        depends_on = set(rollout.depends_on)
+        for dependency in depends_on:
+            if dependency not in order:
+                raise ValueError(
+                    f"'{rollout.service_name}' depends on unknown service '{dependency}'")
+            dependents[dependency].append(rollout.service_name)
+        n_pending_deps[rollout.service_name] = len(depends_on)
+
+    waves = list()
+    wave = [name for name, n in n_pending_deps.items() if n == 0]
+    n_scheduled = 0
+    while wave:
+        wave.sort(key=order.get)
+        waves.append(wave)
+        n_scheduled += len(wave)
+        next_wave = list()
+        for service_name in wave:
+            for dependent in dependents[service_name]:
+                n_pending_deps[dependent] -= 1
+                if n_pending_deps[dependent] == 0:
+                    next_wave.append(dependent)
+        wave = next_wave
+
+    if n_scheduled != len(order):
+        in_cycle = sorted(
+            (name for name, n in n_pending_deps.items() if n > 0), key=order.get)
+        raise ValueError(f"dependency cycle between services: {in_cycle}")
+    return waves
+
+
+def dry_run_apply(deployment, plan, cancel_event):
+    """
+    Default apply step, apply nothing and return the terraform target
+    addresses of the plan.
+    """
+    return deployment.get_tf_target_addresses(plan)
+
+
+@attr.s
+class RolloutScheduler(object):
+    """
+    :type fleet: bgs_deploy.fleet.BlueGreenECSFleet
+    :param fleet: creates the deployment of each service.
+
+    :param apply_func: ``apply_func(deployment, plan, cancel_event)``,
+        raise to fail the service.
+
+    :type max_workers: int
+    :param max_workers: max number of services applied at the same time,
+        abandoned timed out services are not counted.
+
+    :type timeout: float
+    :param timeout: default per service timeout in seconds, None is no limit.
+        It starts when the service starts, not when it is queued.
+
+    :type fail_fast: bool
+    :param fail_fast: if True, the first failed or timed out service cancels
+        everything not finished yet. If False, only services depending on it,
+        directly or not, are skipped.
+    """
+    fleet = attr.ib()
+    apply_func = attr.ib(default=dry_run_apply)
+    max_workers = attr.ib(default=4)
+    timeout = attr.ib(default=None)
+    fail_fast = attr.ib(default=True)
+    poll_interval = attr.ib(default=0.05)
+
+    def _run_one(self, rollout, result, cancel_event, done, wakeup):
+        start = time.monotonic()
+        try:
+            deployment = self.fleet.get_deployment(
+                service_name=rollout.service_name,
+                deployment_option=rollout.deployment_option,
+                docker_image_digest=rollout.docker_image_digest,
+                task_definition_arn=rollout.task_definition_arn,
+            )
+            result.plan = deployment.compute_plan()
+            result.apply_result = self.apply_func(deployment, result.plan, cancel_event)
+            result.status = RolloutStatus.succeeded
+        except Exception as e:
+            result.error = e
+            result.status = RolloutStatus.failed
+        finally:
+            result.elapsed = time.monotonic() - start
+            done.set()
+            wakeup.set()
+
+    def _start(self, rollout, result, wakeup):
+        """
+        Run one service in its own daemon thread, a timed out worker is
+        abandoned and must not hold a slot of a pool.
+
+        :rtype: tuple
+        :return: ``(done event, cancel event, start time)``
+        """
+        done = threading.Event()
+        cancel_event = threading.Event()
+        worker = threading.Thread(
+            target=self._run_one,
+            args=(rollout, result, cancel_event, done, wakeup),
+            name="rollout-{}".format(rollout.service_name),
+            daemon=True,
+        )
+        start = time.monotonic()
+        worker.start()
+        return done, cancel_event, start
+
+    def _run_wave(self, wave_rollouts, results, cancel_event):
+        queue = collections.deque(wave_rollouts)
+        timeouts = {
+            rollout.service_name: rollout.timeout if rollout.timeout is not None else self.timeout
+            for rollout in wave_rollouts
+        }
+        # service name -> (done event, cancel event of the service, start time)
+        running = dict()
+        wakeup = threading.Event()
+        while queue or running:
+            while queue and len(running) < self.max_workers:
+                rollout = queue.popleft()
+                if cancel_event.is_set():
+                    results[rollout.service_name].status = RolloutStatus.cancelled
+                else:
+                    running[rollout.service_name] = self._start(
+                        rollout, results[rollout.service_name], wakeup)
+            if not running:
+                continue
+
+            wakeup.wait(self.poll_interval)
+            wakeup.clear()
+            now = time.monotonic()
+            for service_name, (done, service_cancel_event, start) in list(running.items()):
+                timeout = timeouts[service_name]
+                if done.is_set():
+                    del running[service_name]
+                    if results[service_name].status == RolloutStatus.failed and self.fail_fast:
+                        cancel_event.set()
+                elif timeout is not None and now - start > timeout:
+                    # the worker thread can't be killed, signal and abandon it,
+                    # it keeps writing to the old result object
+                    service_cancel_event.set()
+                    del running[service_name]
+                    results[service_name] = RolloutResult(
+                        service_name=service_name,
+                        wave=results[service_name].wave,
+                        status=RolloutStatus.timeout,
+                        error=TimeoutError(f"'{service_name}' timed out after {timeout} seconds"),
+                        elapsed=now - start,
+                    )
+                    if self.fail_fast:
+                        cancel_event.set()
+
+            if cancel_event.is_set():
+                for done, service_cancel_event, start in running.values():
+                    service_cancel_event.set()
+
+    def run(self, rollouts):
+        """
+        :type rollouts: list
+        :param rollouts: list of :class:`ServiceRollout`.
+
+        :rtype: list
+        :return: list of :class:`RolloutResult`, in the order of ``rollouts``.
+        """
+        rollouts = list(rollouts)
+        waves = build_waves(rollouts)
+        rollout_by_name = {rollout.service_name: rollout for rollout in rollouts}
+        results = dict()
+        for i, wave in enumerate(waves):
+            for service_name in wave:
+                results[service_name] = RolloutResult(service_name=service_name, wave=i)
+
+        # load and index the shared terraform state before workers start
+        self.fleet.warm()
+        cancel_event = threading.Event()
+        for wave in waves:
+            to_run = list()
+            for service_name in wave:
+                if cancel_event.is_set():
+                    results[service_name].status = RolloutStatus.cancelled
+                elif any(
+                        results[dependency].status != RolloutStatus.succeeded
+                        for dependency in rollout_by_name[service_name].depends_on
+                ):
+                    results[service_name].status = RolloutStatus.skipped
+                else:
+                    to_run.append(rollout_by_name[service_name])
+            if to_run:
+                self._run_wave(to_run, results, cancel_event)
+        return [results[rollout.service_name] for rollout in rollouts]
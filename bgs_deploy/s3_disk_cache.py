@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent local cache for S3 objects, validated by ETag.
+
+Every CI job on the same runner used to download the terraform state again.
+:class:`S3DiskCache` keeps the object body on disk next to its ETag, and
+refreshes it with a conditional ``get_object(IfNoneMatch=etag)`` request.
+If S3 says ``304 Not Modified``, the local copy is used and no body is
+transferred.
+
+Several processes can share a ``cache_dir`` (parallel CI jobs on one
+runner): the index is re-read and written atomically while holding an
+exclusive ``flock`` on ``index.lock``. Windows has no ``fcntl``, there the
+cache is safe for threads of one process only.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from attrs_mate import attr
+
+from .tf_state import _DeadlineReader
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, windows
+    fcntl = None
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+COPY_BUFFER_SIZE = 1024 * 1024  # 1 MB
+
+
+def is_not_modified_error(e):
+    """
+    Is this a botocore ``ClientError`` for ``304 Not Modified``?
+
+    :rtype: bool
+    """
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict):
+        return False
+    status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    error_code = response.get("Error", {}).get("Code")
+    return status_code == 304 or error_code in ("304", "NotModified")
+
+
+@attr.s
+class S3DiskCache(object):
+    """
+    :type cache_dir: str
+    :param cache_dir: where the object bodies and the index are stored.
+
+    :type max_size: int
+    :param max_size: max total size of the cached bodies in bytes. The least
+        recently used objects are evicted when exceeded. Objects larger than
+        that are never cached.
+    """
+    cache_dir = attr.ib()
+    max_size = attr.ib(default=1024 * 1024 * 1024)  # 1 GB
+
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+    bytes_downloaded = attr.ib(default=0, init=False)
+    bytes_saved = attr.ib(default=0, init=False)
+
+    _index = attr.ib(default=None, init=False, repr=False)
+    _lock = attr.ib(factory=threading.RLock, init=False, repr=False)
+
+    @property
+    def path_index(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    @property
+    def path_lock(self):
+        return os.path.join(self.cache_dir, LOCK_FILE)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Exclusive access to the index, across threads and processes. The
+        index is re-read from disk, another process may have changed it.
+        """
+        with self._lock:
+            if fcntl is None:
+                self._index = None
+                yield
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.path_lock, "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    self._index = None
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def get_cache_key(bucket, key):
+        return hashlib.sha256("s3://{}/{}".format(bucket, key).encode("utf-8")).hexdigest()
+
+    def get_body_path(self, cache_key):
+        return os.path.join(self.cache_dir, cache_key + ".body")
+
+    @property
+    def index(self):
+        """
+        ``{cache_key: {"bucket", "key", "etag", "size", "last_access"}}``
+
+        Last loaded copy, it is reloaded from disk on every cache operation.
+
+        :rtype: dict
+        """
+        if self._index is None:
+            try:
+                with open(self.path_index, "rb") as f:
+                    self._index = json.loads(f.read().decode("utf-8"))
+            except (IOError, OSError, ValueError):
+                self._index = dict()
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path_tmp = "{}.{}.tmp".format(self.path_index, uuid.uuid4().hex)
+        with open(path_tmp, "wb") as f:
+            f.write(json.dumps(self.index).encode("utf-8"))
+        os.replace(path_tmp, self.path_index)
+
+    def _remove_entry(self, cache_key):
+        self.index.pop(cache_key, None)
+        try:
+            os.remove(self.get_body_path(cache_key))
+        except OSError:
+            pass
+
+    def _evict(self, keep_cache_key):
+        total_size = sum(entry["size"] for entry in self.index.values())
+        lru_entries = sorted(self.index.items(), key=lambda kv: kv[1]["last_access"])
+        for cache_key, entry in lru_entries:
+            if total_size <= self.max_size:
+                break
+            if cache_key == keep_cache_key:
+                continue
+            self._remove_entry(cache_key)
+            total_size -= entry["size"]
+
+    def _is_cached(self, cache_key):
+        return (cache_key in self.index) \
+               and os.path.exists(self.get_body_path(cache_key))
+
+    def open_object(self, s3_client, bucket, key, deadline=None):
+        """
+        Returns a binary file object of the latest body of ``s3://bucket/key``.
+        The caller should close it.
+
+        Exceptions raised by ``s3_client.get_object``, for example the object
+        doesn't exists, are not handled.
+
+        :type deadline: float
+        :param deadline: ``time.monotonic()`` value, ``TimeoutError`` is
+            raised if downloading the body to the cache is not done by then.
+        """
+        cache_key = self.get_cache_key(bucket, key)
+        kwargs = dict(Bucket=bucket, Key=key)
+        # only hold the lock for index access, so concurrent downloads of
+        # different objects are not serialized
+        with self._locked():
+            entry = self.index.get(cache_key) if self._is_cached(cache_key) else None
+            if entry is not None:
+                entry = dict(entry)
+                kwargs["IfNoneMatch"] = entry["etag"]
+        try:
+            res = s3_client.get_object(**kwargs)
+        except Exception as e:
+            if entry is None or not is_not_modified_error(e):
+                raise
+            with self._locked():
+                try:
+                    f = open(self.get_body_path(cache_key), "rb")
+                except (IOError, OSError):
+                    # evicted by another process meanwhile
+                    f = None
+                else:
+                    self.hits += 1
+                    self.bytes_saved += entry["size"]
+                    if cache_key in self.index:
+                        self.index[cache_key]["last_access"] = time.time()
+                    self._save_index()
+            if f is not None:
+                return f
+            del kwargs["IfNoneMatch"]
+            res = s3_client.get_object(**kwargs)
+
+        size = res.get("ContentLength")
+        with self._locked():
+            self.misses += 1
+            if size is not None:
+                self.bytes_downloaded += size
+            if size is None or size > self.max_size:
+                self._remove_entry(cache_key)
+                self._save_index()
+                return res["Body"]
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path_body = self.get_body_path(cache_key)
+        path_tmp = "{}.{}.tmp".format(path_body, uuid.uuid4().hex)
+        body = res["Body"]
+        if deadline is not None:
+            body = _DeadlineReader(body, deadline=deadline, chunk_size=COPY_BUFFER_SIZE)
+        try:
+            with open(path_tmp, "wb") as f:
+                shutil.copyfileobj(body, f, COPY_BUFFER_SIZE)
+        except BaseException:
+            body.close()
+            os.remove(path_tmp)
+            raise
+        with self._locked():
+            os.replace(path_tmp, path_body)
+            self.index[cache_key] = {
+                "bucket": bucket,
+                "key": key,
+                "etag": res["ETag"],
+                "size": size,
+                "last_access": time.time(),
+            }
+            self._evict(keep_cache_key=cache_key)
+            self._save_index()
+            return open(path_body, "rb")
+
+    def get_object_body(self, s3_client, bucket, key):
+        """
+        Returns the latest body of ``s3://bucket/key`` in bytes.
+
+        :rtype: bytes
+        """
+        f = self.open_object(s3_client, bucket, key)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def invalidate(self, bucket, key):
+        with self._locked():
+            self._remove_entry(self.get_cache_key(bucket, key))
+            self._save_index()
+
+    def clear(self):
+        with self._locked():
+            for cache_key in list(self.index):
+                self._remove_entry(cache_key)
+            self._save_index()
+
+    @property
+    def stats(self):
+        """
+        :rtype: dict
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""
+Upload build artifacts to S3, skip the upload if the object already has the
+same content.
+
+The sha256 of the local file is stored in the object metadata
+(:data:`CONTENT_HASH_METADATA_KEY`). :func:`upload_file` compares it with a
+``head_object`` call first, and only uploads if they differ. Large files are
+uploaded as a multipart upload, parts are uploaded concurrently with tunable
+part size and concurrency.
+
+Usage::
+
+    python -m bgs_deploy.s3_upload build/lambda/layer.zip --bucket my-bucket --key lambda/layer.zip
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from attrs_mate import attr
+
+from .hashing import hash_file_cached
+
+CONTENT_HASH_METADATA_KEY = "bgs-deploy-sha256"
+
+MB = 1024 * 1024
+MIN_PART_SIZE = 5 * MB  # S3 limit, except the last part
+MAX_PARTS = 10000  # S3 limit
+DEFAULT_PART_SIZE = 8 * MB
+DEFAULT_MULTIPART_THRESHOLD = 16 * MB
+
+
+def is_not_found_error(e):
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict):
+        return False
+    status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    error_code = response.get("Error", {}).get("Code")
+    return status_code == 404 or error_code in ("404", "NoSuchKey", "NotFound")
+
+
+def get_remote_content_hash(s3_client, bucket, key):
+    """
+    :rtype: str
+    :return: None if the object doesn't exist or has no content hash.
+    """
+    try:
+        response = s3_client.head_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        if is_not_found_error(e):
+            return None
+        raise
+    return response.get("Metadata", {}).get(CONTENT_HASH_METADATA_KEY)
+
+
+def get_part_size(size, part_size):
+    """
+    At least :data:`MIN_PART_SIZE`, and large enough to stay below
+    :data:`MAX_PARTS` parts.
+
+    :rtype: int
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+    while part_size * MAX_PARTS < size:
+        part_size *= 2
+    return part_size
+
+
+@attr.s
+class UploadResult(object):
+    """
+    :type skipped: bool
+    :param skipped: the object already had the same content.
+
+    :type bytes_saved: int
+    :param bytes_saved: bytes not uploaded because of the skip.
+
+    :type n_parts: int
+    :param n_parts: 0 for a single ``put_object`` call.
+    """
+    bucket = attr.ib()
+    key = attr.ib()
+    size = attr.ib()
+    content_hash = attr.ib()
+    skipped = attr.ib()
+    bytes_uploaded = attr.ib(default=0)
+    bytes_saved = attr.ib(default=0)
+    n_parts = attr.ib(default=0)
+    elapsed = attr.ib(default=None)
+
+
+def _upload_part(s3_client, path, bucket, key, upload_id, part_number, offset, length):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        body = f.read(length)
+    response = s3_client.upload_part(
+        Bucket=bucket,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=body,
+    )
+    return dict(PartNumber=part_number, ETag=response["ETag"])
+
+
+def multipart_upload(s3_client,
+                     path,
+                     bucket,
+                     key,
+                     part_size=DEFAULT_PART_SIZE,
+                     max_workers=4,
+                     extra_args=None):
+    """
+    Upload a file in parts concurrently. The upload is aborted if any part
+    fails.
+
+    :type extra_args: dict
+    :param extra_args: passed to ``create_multipart_upload``, for example
+        ``Metadata``.
+
+    :rtype: int
+    :return: number of parts.
+    """
+    size = os.path.getsize(path)
+    part_size = get_part_size(size, part_size)
+    ranges = [
+        (i + 1, offset, min(part_size, size - offset))
+        for i, offset in enumerate(range(0, max(size, 1), part_size))
+    ]
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket, Key=key, **(extra_args or dict()))["UploadId"]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(ranges)))) as executor:
+            parts = list(executor.map(
+                lambda args: _upload_part(s3_client, path, bucket, key, upload_id, *args),
+                ranges,
+            ))
+        s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload=dict(Parts=parts),
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return len(ranges)
+
+
+def upload_file(s3_client,
+                path,
+                bucket,
+                key,
+                part_size=DEFAULT_PART_SIZE,
+                max_workers=4,
+                multipart_threshold=DEFAULT_MULTIPART_THRESHOLD,
+                extra_args=None,
+                force=False,
+                manifest=None):
+    """
+    Upload a file unless the object already has the same content hash.
+
+    :type part_size: int
+    :param part_size: bytes per part of a multipart upload, at least 5 MB.
+
+    :type max_workers: int
+    :param max_workers: parts uploaded at the same time.
+
+    :type multipart_threshold: int
+    :param multipart_threshold: files of this size or larger are uploaded
+        in parts.
+
+    :type extra_args: dict
+    :param extra_args: for example ``ContentType``, passed to ``put_object`` /
+        ``create_multipart_upload``.
+
+    :type force: bool
+    :param force: upload even if the content is the same.
+
+    :type manifest: bgs_deploy.hashing.HashManifest
+    :param manifest: optional, cache of the local content hash.
+
+    :rtype: UploadResult
+    """
+    start = time.monotonic()
+    size = os.path.getsize(path)
+    content_hash = hash_file_cached(path, algorithm="sha256", manifest=manifest)
+    result = UploadResult(
+        bucket=bucket, key=key, size=size, content_hash=content_hash, skipped=False)
+    if not force and get_remote_content_hash(s3_client, bucket, key) == content_hash:
+        result.skipped = True
+        result.bytes_saved = size
+        result.elapsed = time.monotonic() - start
+        return result
+
+    extra_args = dict(extra_args or dict())
+    metadata = dict(extra_args.pop("Metadata", dict()))
+    metadata[CONTENT_HASH_METADATA_KEY] = content_hash
+    extra_args["Metadata"] = metadata
+    if size >= multipart_threshold:
+        result.n_parts = multipart_upload(
+            s3_client, path, bucket, key,
+            part_size=part_size,
+            max_workers=max_workers,
+            extra_args=extra_args,
+        )
+    else:
+        with open(path, "rb") as f:
+            s3_client.put_object(Bucket=bucket, Key=key, Body=f, **extra_args)
+    result.bytes_uploaded = size
+    result.elapsed = time.monotonic() - start
+    return result
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Upload a file to S3, skip if the object has the same content")
+    parser.add_argument("path")
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--key", required=True)
+    parser.add_argument("--profile", default=None, help="AWS profile")
+    parser.add_argument("--part-size-mb", type=int, default=DEFAULT_PART_SIZE // MB)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--force", action="store_true", help="upload anyway")
+    args = parser.parse_args(argv)
+
+    import boto3
+    from .boto_pool import get_client
+
+    boto_ses = boto3.session.Session(profile_name=args.profile)
+    result = upload_file(
+        get_client(boto_ses, "s3", max_pool_connections=max(10, args.max_workers)),
+        args.path, args.bucket, args.key,
+        part_size=args.part_size_mb * MB,
+        max_workers=args.max_workers,
+        force=args.force,
+    )
+    s3_uri = "s3://{}/{}".format(result.bucket, result.key)
+    if result.skipped:
+        print("unchanged, skip {}, {} bytes saved".format(s3_uri, result.bytes_saved))
+    else:
+        print("uploaded {} bytes to {} in {:.2f} sec ({} parts)".format(
+            result.bytes_uploaded, s3_uri, result.elapsed, result.n_parts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+Thread safe cache shared by many deployment objects, with TTL, explicit
+invalidation and single-flight loading.
+
+``BlueGreenDeployment.tf_state_data`` is cached per instance, so a long
+running process planning in many threads downloads and parses the same
+terraform state again for every deployment. Give them one
+:class:`SharedCache`::
+
+    cache = SharedCache(ttl=30)
+    deployment = BlueGreenECSDeployment(..., shared_cache=cache)
+
+The first caller of a key runs the loader, concurrent callers of the same key
+wait for it instead of loading again (coalesced). A value is reloaded once it
+is older than ``ttl``. Errors are raised to every waiting caller and never
+cached.
+
+Every load gets a new, increasing generation number. Values derived from a
+cached value can put the generation in their own key, so they are never
+mixed with a newer parent value.
+"""
+
+import itertools
+import threading
+import time
+
+
+class _Entry(object):
+    __slots__ = ("value", "generation", "expires_at")
+
+    def __init__(self, value, generation, expires_at):
+        self.value = value
+        self.generation = generation
+        self.expires_at = expires_at
+
+
+class _Flight(object):
+    __slots__ = ("event", "entry", "error", "stale")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.error = None
+        # invalidated while loading, the result is returned but not cached
+        self.stale = False
+
+
+class SharedCache(object):
+    """
+    :type ttl: float
+    :param ttl: seconds a value is served before it is loaded again, None
+        means forever (until invalidated).
+
+    :type max_entries: int
+    :param max_entries: expired entries are dropped first, then the ones
+        closest to expiry.
+
+    :param clock: returns seconds, for tests.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.evictions = 0
+        self._entries = dict()
+        self._flights = dict()
+        self._generations = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        :param key: hashable.
+        :param loader: called without argument when the key is missing or
+            expired.
+        """
+        return self.get_with_generation(key, loader)[0]
+
+    def get_with_generation(self, key, loader):
+        """
+        :rtype: tuple
+        :return: ``(value, generation)``
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.expires_at is None or self.clock() < entry.expires_at):
+                self.hits += 1
+                return entry.value, entry.generation
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.misses += 1
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+
+        if not is_leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry.value, flight.entry.generation
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self.errors += 1
+                flight.error = e
+                del self._flights[key]
+            flight.event.set()
+            raise
+
+        with self._lock:
+            now = self.clock()
+            flight.entry = _Entry(
+                value=value,
+                generation=next(self._generations),
+                expires_at=None if self.ttl is None else now + self.ttl,
+            )
+            if not flight.stale:
+                self._entries[key] = flight.entry
+                self._evict(now)
+            del self._flights[key]
+        flight.event.set()
+        return value, flight.entry.generation
+
+    def _evict(self, now):
+        if len(self._entries) <= self.max_entries:
+            return
+        for key, entry in list(self._entries.items()):
+            if entry.expires_at is not None and entry.expires_at <= now:
+                del self._entries[key]
+                self.evictions += 1
+        n_extra = len(self._entries) - self.max_entries
+        if n_extra > 0:
+            keys = sorted(
+                self._entries,
+                key=lambda key: (self._entries[key].expires_at is None,
+                                 self._entries[key].expires_at or 0),
+            )
+            for key in keys[:n_extra]:
+                del self._entries[key]
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """
+        Drop a key, or everything if ``key`` is None. A load in flight still
+        returns its value to its callers, but it is not cached.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                for flight in self._flights.values():
+                    flight.stale = True
+            else:
+                self._entries.pop(key, None)
+                flight = self._flights.get(key)
+                if flight is not None:
+                    flight.stale = True
+
+    def stats(self):
+        """
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "in_flight": len(self._flights),
+            }
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generate realistic terraform state documents for tests and benchmarks.
+
+Each service owns up to three logic ids (``a``, ``b``, ``c``), every logic id
+has an ``aws_ecs_task_definition``, an ``aws_lb_target_group`` and an
+``aws_ecs_service``, and every blue / green stage in use has an
+``aws_lb_listener`` depending on the target group of its logic id. Noise
+resources of unrelated types are mixed in between.
+"""
+
+import hashlib
+import json
+import random
+
+LOGIC_IDS = ("a", "b", "c")
+
+# valid (has_active, has_inactive, has_staging) combinations
+STAGE_LAYOUTS = (
+    (False, False, False),
+    (False, False, True),
+    (True, False, False),
+    (True, False, True),
+    (True, True, False),
+    (True, True, True),
+)
+
+NOISE_RESOURCE_TYPES = (
+    "aws_s3_bucket",
+    "aws_iam_role",
+    "aws_security_group",
+    "aws_cloudwatch_log_group",
+    "aws_ssm_parameter",
+)
+
+AWS_ACCOUNT_ID = "111122223333"
+AWS_REGION = "us-east-1"
+
+
+def make_digest(*parts):
+    return hashlib.sha256("-".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def make_task_definition(service_name, logic_id, revision, container_definitions_size):
+    name = "{}_{}".format(service_name, logic_id)
+    digest = make_digest(service_name, logic_id, revision)
+    container_definition = {
+        "name": service_name,
+        "image": "{}.dkr.ecr.{}.amazonaws.com/{}@sha256:{}".format(
+            AWS_ACCOUNT_ID, AWS_REGION, service_name, digest),
+        "cpu": 256,
+        "memory": 512,
+        "essential": True,
+        "portMappings": [{"containerPort": 80, "hostPort": 80, "protocol": "tcp"}],
+        "environment": [],
+    }
+    size = len(json.dumps(container_definition))
+    i = 0
+    while size < container_definitions_size:
+        env_var = {"name": "ENV_VAR_{}".format(i), "value": make_digest(name, i)}
+        container_definition["environment"].append(env_var)
+        size += len(json.dumps(env_var)) + 2
+        i += 1
+    return {
+        "mode": "managed",
+        "type": "aws_ecs_task_definition",
+        "name": name,
+        "provider": "provider.aws",
+        "instances": [
+            {
+                "schema_version": 1,
+                "attributes": {
+                    "arn": "arn:aws:ecs:{}:{}:task-definition/{}:{}".format(
+                        AWS_REGION, AWS_ACCOUNT_ID, name, revision),
+                    "container_definitions": json.dumps([container_definition, ]),
+                    "family": name,
+                    "revision": revision,
+                },
+                "private": "bnVsbA==",
+            },
+        ],
+    }
+
+
+def make_target_group(service_name, logic_id):
+    name = "{}_{}".format(service_name, logic_id)
+    return {
+        "mode": "managed",
+        "type": "aws_lb_target_group",
+        "name": name,
+        "provider": "provider.aws",
+        "instances": [
+            {
+                "schema_version": 0,
+                "attributes": {
+                    "arn": "arn:aws:elasticloadbalancing:{}:{}:targetgroup/{}/{}".format(
+                        AWS_REGION, AWS_ACCOUNT_ID, name, make_digest(name)[:16]),
+                    "port": 80,
+                    "protocol": "HTTP",
+                },
+            },
+        ],
+    }
+
+
+def make_ecs_service(service_name, logic_id, task_definition_arn):
+    name = "{}_{}".format(service_name, logic_id)
+    return {
+        "mode": "managed",
+        "type": "aws_ecs_service",
+        "name": name,
+        "provider": "provider.aws",
+        "instances": [
+            {
+                "schema_version": 0,
+                "attributes": {
+                    "name": name,
+                    "desired_count": 1,
+                    "task_definition": task_definition_arn,
+                },
+                "depends_on": [
+                    "aws_ecs_task_definition.{}".format(name),
+                    "aws_lb_target_group.{}".format(name),
+                ],
+            },
+        ],
+    }
+
+
+def make_listener(service_name, blue_green_stage, logic_id):
+    return {
+        "mode": "managed",
+        "type": "aws_lb_listener",
+        "name": "{}_{}".format(service_name, blue_green_stage),
+        "provider": "provider.aws",
+        "instances": [
+            {
+                "schema_version": 0,
+                "attributes": {
+                    "port": {"active": 80, "inactive": 8080, "staging": 9090}[blue_green_stage],
+                    "protocol": "HTTP",
+                },
+                "depends_on": [
+                    "aws_lb.{}".format(service_name),
+                    "aws_lb_target_group.{}_{}".format(service_name, logic_id),
+                ],
+            },
+        ],
+    }
+
+
+def make_noise_resource(i, rnd, size):
+    resource_type = NOISE_RESOURCE_TYPES[i % len(NOISE_RESOURCE_TYPES)]
+    return {
+        "mode": "managed",
+        "type": resource_type,
+        "name": "noise_{}".format(i),
+        "provider": "provider.aws",
+        "instances": [
+            {
+                "schema_version": 0,
+                "attributes": {
+                    "id": make_digest(resource_type, i),
+                    "tags": {
+                        "Description": (make_digest(rnd.random()) * (size // 64 + 1))[:size],
+                    },
+                },
+            },
+        ],
+    }
+
+
+def get_service_name(i):
+    return "service{}".format(i)
+
+
+def generate_service_resources(service_name, rnd, container_definitions_size=1000):
+    """
+    Generate resources of one service with a random valid stage layout.
+
+    :rtype: list
+    """
+    has_active, has_inactive, has_staging = rnd.choice(STAGE_LAYOUTS)
+    logic_ids = list(LOGIC_IDS)
+    rnd.shuffle(logic_ids)
+    stage_logic_id = dict()
+    if has_active:
+        stage_logic_id["active"] = logic_ids[0]
+    if has_inactive:
+        stage_logic_id["inactive"] = logic_ids[1]
+    if has_staging:
+        stage_logic_id["staging"] = logic_ids[2]
+
+    resources = list()
+    for logic_id in sorted(stage_logic_id.values()):
+        revision = rnd.randint(1, 999)
+        task_definition = make_task_definition(
+            service_name, logic_id, revision, container_definitions_size)
+        resources.append(task_definition)
+        resources.append(make_target_group(service_name, logic_id))
+        resources.append(make_ecs_service(
+            service_name, logic_id,
+            task_definition["instances"][0]["attributes"]["arn"],
+        ))
+    for blue_green_stage, logic_id in sorted(stage_logic_id.items()):
+        resources.append(make_listener(service_name, blue_green_stage, logic_id))
+    return resources
+
+
+def _generate_services_resources(n_services, rnd, container_definitions_size):
+    resources = list()
+    for i in range(n_services):
+        resources.extend(generate_service_resources(
+            get_service_name(i), rnd,
+            container_definitions_size=container_definitions_size,
+        ))
+    return resources
+
+
+def _mix_in_noise(resources, n_noise_resources, rnd, noise_resource_size):
+    """
+    Insert noise resources at random positions.
+    """
+    total = len(resources) + n_noise_resources
+    noise_positions = set(rnd.sample(range(total), n_noise_resources))
+    mixed = list()
+    service_resources = iter(resources)
+    noise_counter = 0
+    for position in range(total):
+        if position in noise_positions:
+            mixed.append(make_noise_resource(noise_counter, rnd, noise_resource_size))
+            noise_counter += 1
+        else:
+            mixed.append(next(service_resources))
+    return mixed
+
+
+def _make_tf_state_data(resources, rnd, seed):
+    return {
+        "version": 4,
+        "terraform_version": "0.12.29",
+        "serial": rnd.randint(1, 10000),
+        "lineage": make_digest("lineage", seed),
+        "outputs": {},
+        "resources": resources,
+    }
+
+
+def generate_tf_state(n_services,
+                      n_noise_resources=0,
+                      container_definitions_size=1000,
+                      noise_resource_size=200,
+                      seed=None):
+    """
+    Generate a terraform state document.
+
+    :type n_services: int
+    :param n_services: services are named ``service0``, ``service1``, ...
+
+    :type n_noise_resources: int
+    :param n_noise_resources: number of resources not related to any service.
+
+    :type container_definitions_size: int
+    :param container_definitions_size: approximate size in bytes of the
+        ``container_definitions`` json string of each task definition.
+
+    :type noise_resource_size: int
+    :param noise_resource_size: approximate size in bytes of each noise resource.
+
+    :type seed: int
+
+    :rtype: dict
+    """
+    rnd = random.Random(seed)
+    resources = _generate_services_resources(n_services, rnd, container_definitions_size)
+    resources = _mix_in_noise(resources, n_noise_resources, rnd, noise_resource_size)
+    return _make_tf_state_data(resources, rnd, seed)
+
+
+def generate_tf_state_with_n_resources(n_resources,
+                                       noise_ratio=0.5,
+                                       container_definitions_size=1000,
+                                       noise_resource_size=200,
+                                       seed=None):
+    """
+    Generate a terraform state document with ``n_resources`` resources, about
+    ``noise_ratio`` of them are noise resources.
+
+    :rtype: dict
+    """
+    rnd = random.Random(seed)
+    # a service has 6 resources in average over STAGE_LAYOUTS
+    n_services = max(1, int(n_resources * (1 - noise_ratio) / 6))
+    resources = _generate_services_resources(n_services, rnd, container_definitions_size)
+    n_noise_resources = max(0, n_resources - len(resources))
+    resources = _mix_in_noise(resources, n_noise_resources, rnd, noise_resource_size)
+    return _make_tf_state_data(resources, rnd, seed)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Render one terraform file per service from its :class:`~bgs_deploy.plan.DeploymentPlan`.
+
+Rendering hundreds of services on every pipeline run is mostly wasted work,
+the plan of most services didn't change. :class:`TfRenderer` hashes the
+inputs of each file (template source, plan and extra context) and keeps the
+hashes in a manifest file in the output directory. Only files whose inputs
+changed are rendered again, and a file is only rewritten when its content
+changed. Compiled templates are cached by their source, rendering runs in a
+thread pool.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from attrs_mate import attr
+
+MANIFEST_FILE = ".bgs-render-manifest.json"
+
+DEFAULT_TEMPLATE_PATH = os.path.join(
+    os.path.dirname(__file__), "tf_templates", "ecs_blue_green.tf.j2")
+
+_compiled_templates = dict()
+_compiled_templates_lock = threading.Lock()
+
+
+def get_compiled_template(source):
+    """
+    Compile a jinja2 template, compiled templates are cached by source.
+
+    :type source: str
+    :rtype: jinja2.Template
+    """
+    template_sha256 = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    try:
+        return _compiled_templates[template_sha256]
+    except KeyError:
+        pass
+    import jinja2
+
+    with _compiled_templates_lock:
+        if template_sha256 not in _compiled_templates:
+            env = jinja2.Environment(
+                undefined=jinja2.StrictUndefined,
+                keep_trailing_newline=True,
+            )
+            env.filters["tojson"] = json.dumps
+            _compiled_templates[template_sha256] = env.from_string(source)
+        return _compiled_templates[template_sha256]
+
+
+def get_input_hash(template_sha256, plan, extra_context):
+    """
+    Fingerprint of everything a rendered file depends on.
+
+    :rtype: str
+    """
+    data = {
+        "template": template_sha256,
+        "service_name": plan.service_name,
+        "deployment_option": plan.deployment_option,
+        "plan": plan.to_tfvars(),
+        "extra_context": extra_context,
+    }
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _write_if_changed(path, content):
+    """
+    :rtype: bool
+    :return: True if the file is written.
+    """
+    content = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == content:
+                return False
+    except (IOError, OSError):
+        pass
+    path_tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    with open(path_tmp, "wb") as f:
+        f.write(content)
+    os.replace(path_tmp, path)
+    return True
+
+
+@attr.s
+class RenderResult(object):
+    """
+    File names written, rendered but unchanged, and skipped by input hash.
+    """
+    written = attr.ib(factory=list)
+    unchanged = attr.ib(factory=list)
+    skipped = attr.ib(factory=list)
+
+
+@attr.s
+class TfRenderer(object):
+    """
+    :type output_dir: str
+    :param output_dir: ``<service_name>.tf`` files and the manifest are
+        written here.
+
+    :type template_path: str
+    :param template_path: jinja2 template, the context has ``plan``
+        (:class:`~bgs_deploy.plan.DeploymentPlan`), ``service_name``,
+        ``tfvars`` and the keys of ``extra_context``.
+
+    :type max_workers: int
+    """
+    output_dir = attr.ib()
+    template_path = attr.ib(default=DEFAULT_TEMPLATE_PATH)
+    max_workers = attr.ib(default=8)
+
+    @property
+    def path_manifest(self):
+        return os.path.join(self.output_dir, MANIFEST_FILE)
+
+    def get_output_path(self, service_name):
+        return os.path.join(self.output_dir, "{}.tf".format(service_name))
+
+    def _read_manifest(self):
+        try:
+            with open(self.path_manifest, "rb") as f:
+                return json.loads(f.read().decode("utf-8"))
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def _write_manifest(self, manifest):
+        _write_if_changed(
+            self.path_manifest, json.dumps(manifest, indent=4, sort_keys=True))
+
+    def _render_one(self, template, plan, extra_context):
+        context = dict(extra_context)
+        context.update(
+            plan=plan,
+            service_name=plan.service_name,
+            tfvars=plan.to_tfvars(),
+        )
+        return _write_if_changed(
+            self.get_output_path(plan.service_name), template.render(**context))
+
+    def render(self, plans, extra_context=None, force=False):
+        """
+        Render the terraform file of every plan, skip those whose inputs
+        didn't change since last run.
+
+        :type plans: list
+        :param plans: list of :class:`~bgs_deploy.plan.DeploymentPlan`,
+            one per service.
+
+        :type extra_context: dict
+        :param extra_context: json serializable, shared by all services.
+
+        :type force: bool
+        :param force: ignore the manifest, render everything.
+
+        :rtype: RenderResult
+        """
+        extra_context = extra_context or dict()
+        with open(self.template_path, "rb") as f:
+            source = f.read().decode("utf-8")
+        template_sha256 = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        manifest = dict() if force else self._read_manifest()
+        new_manifest = dict(manifest)
+        result = RenderResult()
+        to_render = list()
+        for plan in plans:
+            filename = os.path.basename(self.get_output_path(plan.service_name))
+            input_hash = get_input_hash(template_sha256, plan, extra_context)
+            new_manifest[filename] = input_hash
+            if manifest.get(filename) == input_hash \
+                    and os.path.exists(self.get_output_path(plan.service_name)):
+                result.skipped.append(filename)
+            else:
+                to_render.append((filename, plan))
+
+        if to_render:
+            template = get_compiled_template(source)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    (filename, executor.submit(self._render_one, template, plan, extra_context))
+                    for filename, plan in to_render
+                ]
+                for filename, future in futures:
+                    if future.result():
+                        result.written.append(filename)
+                    else:
+                        result.unchanged.append(filename)
+
+        self._write_manifest(new_manifest)
+        return result
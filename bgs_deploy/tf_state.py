@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+"""
+Terraform state file parsing.
+
+A Terraform state of a big monorepo can be hundreds of MB, but the blue / green
+deployment logic only needs a handful of resources from it. :func:`load_tf_state`
+walks the top level ``resources`` array while the bytes are still arriving,
+and only keeps the resources accepted by a :class:`ResourceFilter`. Peak memory
+is bounded by the matched resources plus the largest single resource, instead
+of the size of the whole document.
+"""
+
+import codecs
+import json
+import time
+
+from attrs_mate import attr
+
+from .tracing import noop_tracer
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+_json_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+@attr.s(frozen=True)
+class ResourceFilter(object):
+    """
+    Decides whether a terraform resource should be kept.
+
+    Empty ``types`` or ``name_prefixes`` means "no restriction".
+
+    :type types: tuple
+    :param types: terraform resource types, example: ``aws_ecs_service``
+
+    :type name_prefixes: tuple
+    :param name_prefixes: terraform resource name prefix, usually the service name
+    """
+    types = attr.ib(default=(), converter=tuple)
+    name_prefixes = attr.ib(default=(), converter=tuple)
+
+    def match(self, resource_data):
+        """
+        :type resource_data: dict
+        :rtype: bool
+        """
+        if self.types and resource_data.get("type") not in self.types:
+            return False
+        if self.name_prefixes \
+                and not resource_data.get("name", "").startswith(self.name_prefixes):
+            return False
+        return True
+
+
+class _JSONStreamReader(object):
+    """
+    Incrementally decode JSON values from a file-like object.
+
+    It only understands the structural characters needed to walk through
+    the top level object and arrays, every leaf value is decoded by
+    :meth:`json.JSONDecoder.raw_decode` once enough bytes are buffered.
+    """
+
+    def __init__(self, fileobj, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self, size):
+        """
+        Read at least ``size`` more bytes into the buffer, unless end of file.
+        """
+        if self._pos:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        chunks = [self._buffer, ]
+        received = 0
+        while received < size:
+            data = self._fileobj.read(self._chunk_size)
+            if not data:
+                chunks.append(self._text_decoder.decode(b"", final=True))
+                self._eof = True
+                break
+            if isinstance(data, bytes):
+                data = self._text_decoder.decode(data)
+            chunks.append(data)
+            received += len(data)
+        self._buffer = "".join(chunks)
+
+    def peek(self):
+        """
+        Skip whitespace and returns next character, or empty string at EOF.
+
+        :rtype: str
+        """
+        while True:
+            buffer = self._buffer
+            pos = self._pos
+            length = len(buffer)
+            while pos < length and buffer[pos] in _whitespace:
+                pos += 1
+            self._pos = pos
+            if pos < length:
+                return buffer[pos]
+            if self._eof:
+                return ""
+            self._read_more(self._chunk_size)
+
+    def consume(self, char):
+        """
+        Consume ``char`` if it is the next character.
+
+        :rtype: bool
+        """
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.consume(char):
+            raise ValueError(
+                "invalid terraform state json, expect '{}' but got '{}'".format(
+                    char, self.peek()
+                )
+            )
+
+    def decode_value(self):
+        """
+        Decode the next complete JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self._buffer, self._pos)
+                # a number at the end of buffer may be truncated
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # double the buffered data on every retry, so a large value is
+            # decoded O(log(n)) times instead of once per chunk
+            self._read_more(max(self._chunk_size, len(self._buffer) - self._pos))
+
+    def iter_array(self):
+        """
+        Decode items of the next JSON array one by one.
+        """
+        self.expect("[")
+        if self.consume("]"):
+            return
+        while True:
+            yield self.decode_value()
+            if self.consume(","):
+                continue
+            self.expect("]")
+            return
+
+
+def load_tf_state(fileobj, resource_filter=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Incrementally parse a terraform state JSON document.
+
+    Only the top level scalar values (``version``, ``serial``, ``lineage``, ...)
+    and the resources matched by ``resource_filter`` are kept. Other top level
+    containers such as ``outputs`` are dropped.
+
+    :param fileobj: a file-like object with a ``read(size)`` method, for example
+        the ``Body`` of a ``s3_client.get_object`` response.
+
+    :type resource_filter: ResourceFilter
+    :param resource_filter: if None, keep all resources.
+
+    :type chunk_size: int
+
+    :rtype: dict
+    """
+    reader = _JSONStreamReader(fileobj, chunk_size=chunk_size)
+    state_data = {"resources": []}
+    reader.expect("{")
+    if reader.consume("}"):
+        return state_data
+    while True:
+        key = reader.decode_value()
+        reader.expect(":")
+        if key == "resources":
+            resources = state_data["resources"]
+            for resource_data in reader.iter_array():
+                if resource_filter is None or resource_filter.match(resource_data):
+                    resources.append(resource_data)
+        else:
+            value = reader.decode_value()
+            if not isinstance(value, (dict, list)):
+                state_data[key] = value
+        if reader.consume(","):
+            continue
+        reader.expect("}")
+        return state_data
+
+
+class _DeadlineReader(object):
+    """
+    Wraps a file-like object, raises ``TimeoutError`` when reading after the
+    deadline.
+    """
+
+    def __init__(self, fileobj, deadline, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._fileobj = fileobj
+        self._deadline = deadline
+        self._chunk_size = chunk_size
+
+    def _check_deadline(self):
+        if time.monotonic() > self._deadline:
+            raise TimeoutError("reading terraform state exceeded the timeout")
+
+    def read(self, size=-1):
+        self._check_deadline()
+        if size is not None and size >= 0:
+            return self._fileobj.read(size)
+        chunks = list()
+        while True:
+            chunk = self._fileobj.read(self._chunk_size)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+            self._check_deadline()
+
+    def close(self):
+        self._fileobj.close()
+
+
+class _CountingReader(object):
+    """
+    Wraps a file-like object, counts bytes read.
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.n_bytes = 0
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self.n_bytes += len(data)
+        return data
+
+    def close(self):
+        self._fileobj.close()
+
+
+def is_no_such_key_error(e):
+    """
+    Is this a botocore ``ClientError`` for a missing key, in an existing
+    bucket? Terraform didn't write the state yet.
+
+    :rtype: bool
+    """
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") == "NoSuchKey"
+
+
+def read_tf_state(s3_client,
+                  bucket,
+                  key,
+                  stream=False,
+                  resource_filter=None,
+                  cache=None,
+                  timeout=None,
+                  tracer=noop_tracer):
+    """
+    Download and parse a terraform state file from S3.
+
+    :type bucket: str
+    :type key: str
+
+    :type stream: bool
+    :param stream: if True, parse with :func:`load_tf_state` and only keep
+        resources matched by ``resource_filter``. Otherwise ``json.loads`` the
+        full document.
+
+    :type resource_filter: ResourceFilter
+
+    :type cache: bgs_deploy.s3_disk_cache.S3DiskCache
+    :param cache: optional local cache of the state file.
+
+    :type timeout: float
+    :param timeout: max seconds to read the body, including downloading it
+        to the ``cache``, ``TimeoutError`` is raised if exceeded.
+
+    :type tracer: bgs_deploy.tracing.Tracer
+    :param tracer: records ``tf_state.fetch`` and ``tf_state.parse`` spans.
+
+    :rtype: dict
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with tracer.span("tf_state.fetch", bucket=bucket, key=key, cache=cache is not None) as span:
+        if cache is None:
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+        else:
+            # a cache miss downloads the whole body, it counts toward the timeout
+            body = cache.open_object(s3_client, bucket, key, deadline=deadline)
+        if deadline is not None:
+            body = _DeadlineReader(body, deadline=deadline)
+        if tracer.enabled:
+            body = _CountingReader(body)
+        if not stream:
+            try:
+                data = body.read()
+            except:
+                body.close()
+                raise
+            span.set_attribute("bytes", len(data))
+    try:
+        with tracer.span("tf_state.parse", stream=stream) as span:
+            if stream:
+                tf_state_data = load_tf_state(body, resource_filter=resource_filter)
+                if tracer.enabled:
+                    span.set_attribute("bytes", body.n_bytes)
+            else:
+                tf_state_data = json.loads(data)
+            span.set_attribute("resources", len(tf_state_data.get("resources", ())))
+        return tf_state_data
+    finally:
+        body.close()
+
+
+def read_tf_state_file(path, stream=False, resource_filter=None):
+    """
+    Parse a local terraform state file, for example the output of
+    ``terraform state pull``.
+
+    :type path: str
+    :type stream: bool
+    :type resource_filter: ResourceFilter
+    :rtype: dict
+    """
+    with open(path, "rb") as f:
+        if stream:
+            return load_tf_state(f, resource_filter=resource_filter)
+        return json.load(f)
+
+
+class TfStateIndex(object):
+    """
+    Index terraform resources by service name and resource type.
+
+    Resource names follow the ``{service_name}_{suffix}`` convention, for
+    example ``helpdesk_a`` or ``helpdesk_active``, so the service name is
+    everything before the last underscore.
+
+    :type types: list
+    :param types: only index these resource types, None means all.
+    """
+
+    def __init__(self, types=None):
+        self.types = None if types is None else frozenset(types)
+        self._data = dict()  # {service_name: {resource_type: [resource_data, ...]}}
+
+    @classmethod
+    def from_tf_state_data(cls, tf_state_data, types=None):
+        """
+        :type tf_state_data: dict
+        :type types: list
+        :rtype: TfStateIndex
+        """
+        index = cls(types=types)
+        for resource_data in tf_state_data["resources"]:
+            index.add(resource_data)
+        return index
+
+    def add(self, resource_data):
+        """
+        :type resource_data: dict
+        """
+        resource_type = resource_data.get("type")
+        if self.types is not None and resource_type not in self.types:
+            return
+        service_name = resource_data.get("name", "").rsplit("_", 1)[0]
+        self._data.setdefault(service_name, dict()) \
+            .setdefault(resource_type, list()) \
+            .append(resource_data)
+
+    def service_names(self):
+        """
+        :rtype: list
+        """
+        return list(self._data)
+
+    def get_resources(self, service_name, resource_type=None):
+        """
+        Returns resources of a service, optionally of a specific type.
+
+        :type service_name: str
+        :type resource_type: str
+        :rtype: list
+        """
+        resources_by_type = self._data.get(service_name, {})
+        if resource_type is not None:
+            return list(resources_by_type.get(resource_type, []))
+        resources = list()
+        for resource_list in resources_by_type.values():
+            resources.extend(resource_list)
+        return resources
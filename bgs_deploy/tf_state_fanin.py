@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fetch and parse many terraform state files concurrently.
+
+When the terraform state is split per team, one release touches dozens of
+``(tf_s3_bucket, tf_s3_key)`` pairs. :func:`fetch_tf_states` downloads and
+parses them in a bounded thread pool, and returns results in input order.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from attrs_mate import attr
+
+from .boto_pool import get_client
+from .tf_state import read_tf_state
+from .tracing import noop_tracer
+
+
+@attr.s
+class TfStateFetchResult(object):
+    """
+    :type tf_state_data: dict
+    :param tf_state_data: None if failed.
+
+    :type error: Exception
+    :param error: None if succeeded.
+
+    :type elapsed: float
+    :param elapsed: seconds spent on this state file.
+    """
+    bucket = attr.ib()
+    key = attr.ib()
+    tf_state_data = attr.ib(default=None)
+    error = attr.ib(default=None)
+    elapsed = attr.ib(default=None)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def create_s3_client(boto_ses, max_pool_connections=10, timeout=None):
+    """
+    Get a s3 client sized for ``max_pool_connections`` concurrent requests
+    from the shared client pool, ``timeout`` is used for both connect and
+    read socket timeout.
+    """
+    kwargs = dict(max_pool_connections=max_pool_connections)
+    if timeout is not None:
+        kwargs["connect_timeout"] = timeout
+        kwargs["read_timeout"] = timeout
+    return get_client(boto_ses, "s3", **kwargs)
+
+
+def _fetch_one(s3_client, bucket, key, stream, resource_filter, cache, timeout, tracer):
+    start = time.monotonic()
+    result = TfStateFetchResult(bucket=bucket, key=key)
+    try:
+        result.tf_state_data = read_tf_state(
+            s3_client, bucket, key,
+            stream=stream,
+            resource_filter=resource_filter,
+            cache=cache,
+            timeout=timeout,
+            tracer=tracer,
+        )
+    except Exception as e:
+        result.error = e
+    result.elapsed = time.monotonic() - start
+    return result
+
+
+def fetch_tf_states(boto_ses,
+                    locations,
+                    max_workers=8,
+                    timeout=None,
+                    stream=False,
+                    resource_filter=None,
+                    cache=None,
+                    s3_client=None,
+                    tracer=noop_tracer):
+    """
+    Fetch and parse terraform state files concurrently.
+
+    A failed or timed out state file doesn't affect the others, check
+    :attr:`TfStateFetchResult.error`.
+
+    :param boto_ses: boto3 session.
+
+    :type locations: list
+    :param locations: list of ``(bucket, key)``.
+
+    :type max_workers: int
+    :param max_workers: max number of state files fetched at the same time.
+
+    :type timeout: float
+    :param timeout: per state file timeout in seconds, for connecting and
+        reading the body.
+
+    :type stream: bool
+    :type resource_filter: bgs_deploy.tf_state.ResourceFilter
+    :type cache: bgs_deploy.s3_disk_cache.S3DiskCache
+    :param stream, resource_filter, cache: see
+        :func:`bgs_deploy.tf_state.read_tf_state`
+
+    :param s3_client: optional, by default a client with ``max_workers``
+        connections is created from ``boto_ses``.
+
+    :type tracer: bgs_deploy.tracing.Tracer
+
+    :rtype: list
+    :return: list of :class:`TfStateFetchResult`, in the order of ``locations``.
+    """
+    locations = list(locations)
+    if not locations:
+        return []
+    if s3_client is None:
+        s3_client = create_s3_client(
+            boto_ses, max_pool_connections=max_workers, timeout=timeout)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(locations))) as executor:
+        futures = [
+            executor.submit(
+                _fetch_one, s3_client, bucket, key,
+                stream, resource_filter, cache, timeout, tracer,
+            )
+            for bucket, key in locations
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Find the terraform resources a deployment plan actually changes.
+
+``deploy_to_active`` and ``roll_back_to_previous`` only re-point the
+``aws_lb_listener`` resources, ``destroy_staging`` only touches one logic id.
+:func:`get_tf_target_addresses` compares the current ``blue_green_state_data``
+with a :class:`~bgs_deploy.plan.DeploymentPlan` and returns the resource
+addresses to pass to ``terraform plan / apply -target=...``, so terraform
+doesn't refresh every resource in a large state.
+"""
+
+# resources created per logic id, and per blue / green stage
+LOGIC_ID_RESOURCE_TYPES = (
+    "aws_ecs_task_definition",
+    "aws_lb_target_group",
+    "aws_ecs_service",
+)
+BLUE_GREEN_STAGE_RESOURCE_TYPES = (
+    "aws_lb_listener",
+)
+
+# task_definition_arg is the ``task_definition`` argument of the ecs service,
+# the state stores the resolved arn while the plan stores the expression,
+# it changes if and only if one of these changes.
+COMPARED_PARAMETERS = (
+    "docker_image_digest",
+    "task_definition_arn",
+)
+
+
+def get_changed_logic_ids(blue_green_state_data, plan):
+    """
+    :type blue_green_state_data: dict
+    :type plan: bgs_deploy.plan.DeploymentPlan
+
+    :rtype: list
+    """
+    changed = list()
+    for logic_id, should_create in sorted(plan.should_create_logic_id.items()):
+        current_values = blue_green_state_data["logic_id"][logic_id]
+        exists = any(bool(current_values[name]) for name in COMPARED_PARAMETERS)
+        if exists != should_create:
+            changed.append(logic_id)
+        elif should_create and any(
+                current_values[name] != plan.get_config_value(logic_id, name)
+                for name in COMPARED_PARAMETERS
+        ):
+            changed.append(logic_id)
+    return changed
+
+
+def get_changed_blue_green_stages(blue_green_state_data, plan):
+    """
+    :type blue_green_state_data: dict
+    :type plan: bgs_deploy.plan.DeploymentPlan
+
+    :rtype: list
+    """
+    changed = list()
+    for blue_green_stage, should_create in sorted(plan.should_create_blue_green_stage.items()):
+        current_logic_id = blue_green_state_data["blue_green_stage"][blue_green_stage]["logic_id"]
+        if bool(current_logic_id) != should_create:
+            changed.append(blue_green_stage)
+        elif should_create and current_logic_id != plan.get_logic_id(blue_green_stage):
+            changed.append(blue_green_stage)
+    return changed
+
+
+def get_tf_target_addresses(blue_green_state_data, plan):
+    """
+    Terraform resource addresses changed by ``plan``, empty if nothing changes.
+
+    :type blue_green_state_data: dict
+    :type plan: bgs_deploy.plan.DeploymentPlan
+
+    :rtype: list
+    """
+    addresses = list()
+    # a staging logic id reusing another task definition has none of its own
+    reusing_logic_id = None if plan.reused_task_definition is None \
+        else plan.get_logic_id("staging")
+    for logic_id in get_changed_logic_ids(blue_green_state_data, plan):
+        for resource_type in LOGIC_ID_RESOURCE_TYPES:
+            if resource_type == "aws_ecs_task_definition" and logic_id == reusing_logic_id:
+                continue
+            addresses.append("{}.{}_{}".format(resource_type, plan.service_name, logic_id))
+    for blue_green_stage in get_changed_blue_green_stages(blue_green_state_data, plan):
+        for resource_type in BLUE_GREEN_STAGE_RESOURCE_TYPES:
+            addresses.append("{}.{}_{}".format(resource_type, plan.service_name, blue_green_stage))
+    return addresses
+
+
+def to_target_args(addresses):
+    """
+    ``["aws_lb_listener.app_active"]`` -> ``["-target=aws_lb_listener.app_active"]``
+
+    :rtype: list
+    """
+    return ["-target={}".format(address) for address in addresses]
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timed spans for the hot path: terraform state download, parsing, blue / green
+state building and planning.
+
+Usage::
+
+    from bgs_deploy.tracing import Tracer, InMemoryExporter
+
+    exporter = InMemoryExporter()
+    deployment = BlueGreenECSDeployment(..., tracer=Tracer([exporter, ]))
+    deployment.compute_plan()
+    for span in exporter.spans:
+        print(span.name, span.duration, span.attributes)
+
+By default :data:`noop_tracer` is used, its :meth:`NoopTracer.span` returns a
+shared do-nothing span, so disabled tracing costs one method call per span.
+"""
+
+import itertools
+import json
+import threading
+import time
+
+
+class Span(object):
+    """
+    A timed operation, created by :meth:`Tracer.span` and used as a context
+    manager. Exported when it exits.
+
+    :type attributes: dict
+    :param attributes: for example ``bytes``, ``resources``.
+
+    :type duration: float
+    :param duration: seconds.
+    """
+    __slots__ = (
+        "tracer",
+        "name",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_time_ns",
+        "duration",
+        "_start",
+    )
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = None
+        self.parent_id = None
+        self.attributes = attributes
+        self.start_time_ns = None
+        self.duration = None
+        self._start = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.tracer._push(self)
+        self.start_time_ns = int(time.time() * 1e9)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._pop(self)
+        return False
+
+    @property
+    def end_time_ns(self):
+        return self.start_time_ns + int(self.duration * 1e9)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time_ns": self.start_time_ns,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_noop_span = _NoopSpan()
+
+
+class NoopTracer(object):
+    enabled = False
+
+    def span(self, name, **attributes):
+        return _noop_span
+
+
+noop_tracer = NoopTracer()
+
+
+class Tracer(object):
+    """
+    :type exporters: list
+    :param exporters: every finished span is passed to ``exporter.export(span)``.
+    """
+    enabled = True
+
+    def __init__(self, exporters=None):
+        self.exporters = list(exporters or [])
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def span(self, name, **attributes):
+        """
+        :rtype: Span
+        """
+        return Span(self, name, attributes)
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = list()
+            return self._local.stack
+
+    def _push(self, span):
+        stack = self._stack()
+        span.span_id = next(self._ids)
+        if stack:
+            span.parent_id = stack[-1].span_id
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        for exporter in self.exporters:
+            exporter.export(span)
+
+
+class InMemoryExporter(object):
+    def __init__(self):
+        self.spans = list()
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def get_spans(self, name):
+        return [span for span in self.spans if span.name == name]
+
+    def clear(self):
+        with self._lock:
+            self.spans = list()
+
+
+class JsonLinesExporter(object):
+    """
+    Write one json object per span.
+
+    :param fileobj: a text file object, the caller closes it.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            self.fileobj.write(line)
+
+
+class OpenTelemetryExporter(object):
+    """
+    Re-emit finished spans through an OpenTelemetry tracer, with the original
+    start and end time. Parent / child relationship is kept as the
+    ``bgs.span_id`` and ``bgs.parent_id`` attributes.
+
+    :param otel_tracer: ``opentelemetry.trace.Tracer``, by default
+        ``opentelemetry.trace.get_tracer("bgs_deploy")``.
+    """
+
+    def __init__(self, otel_tracer=None):
+        if otel_tracer is None:
+            from opentelemetry import trace
+
+            otel_tracer = trace.get_tracer("bgs_deploy")
+        self.otel_tracer = otel_tracer
+
+    def export(self, span):
+        attributes = dict(span.attributes)
+        attributes["bgs.span_id"] = span.span_id
+        if span.parent_id is not None:
+            attributes["bgs.parent_id"] = span.parent_id
+        otel_span = self.otel_tracer.start_span(
+            span.name,
+            start_time=span.start_time_ns,
+            attributes=attributes,
+        )
+        otel_span.end(end_time=span.end_time_ns)
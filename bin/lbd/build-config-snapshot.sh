@@ -0,0 +1,15 @@
+#!/bin/bash
+# -*- coding: utf-8 -*-
+#
+# Freeze the current config into bgs_deploy/devops/_config_snapshot.py for the lambda runtime
+
+dir_here="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+dir_bin="$(dirname "${dir_here}")"
+dir_project_root=$(dirname "${dir_bin}")
+
+source ${dir_bin}/py/python-env.sh
+
+set -e
+print_colored_line $color_cyan "[DOING] build ${package_name}/devops/_config_snapshot.py ..."
+cd ${dir_project_root}
+${bin_python} -m ${package_name}.devops.config_snapshot --module
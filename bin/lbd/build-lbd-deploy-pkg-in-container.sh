@@ -12,7 +12,6 @@ resolve_important_path ${dir_project_root}
 resolve_linux_venv ${venv_name} ${py_version} ${py_version_major_and_minor}
 
 rm_if_exists ${dir_venv}
-rm_if_exists ${path_lambda_deploy_pkg_file}
 rm_if_exists ${path_run_lambda_site_packages}
 
 cd ${dir_project_root}
@@ -8,7 +8,8 @@ dir_project_root=$(dirname "${dir_bin}")
 
 source ${dir_bin}/lbd/lambda-env.sh
 
+bash ${dir_bin}/lbd/build-config-snapshot.sh
+
 print_colored_line $color_cyan "[DOING] build lambda source code at ${path_lambda_source_file} ..."
 mkdir -p ${path_build_lambda_dir}
-rm_if_exists ${path_lambda_source_file}
 build_lbd_source_code
@@ -50,13 +50,17 @@ path_serverless_yml="${dir_project_root}/serverless.yml"
 path_serverless_cache_dir="${dir_project_root}/.serverless"
 
 
+# the zip is only rebuilt if its content changed, see ${package_name}/devops/lbd_package.py
+# it is not removed first, a rebuilt zip atomically replaces the old one
+# these scripts run the package with ${bin_python}, pip install it first
 build_lbd_deployment_package() {
     print_colored_line $color_cyan "create deploy package"
-    ensure_not_exists ${path_lambda_deploy_pkg_file}
     ensure_not_exists ${path_run_lambda_site_packages}
     print_colored_line $color_cyan "  zip everything in ${dir_venv_site_packages}"
-    cd ${dir_venv_site_packages}
-    zip ${path_lambda_deploy_pkg_file} * -r -9 -q -x boto3\* botocore\* s3transfer\* setuptools\* easy_install.py pip\* wheel\* twine\* _pytest\* pytest\*;
+    ${bin_python} -m ${package_name}.devops.lbd_package deploy-pkg \
+        --site-packages ${dir_venv_site_packages} \
+        --requirements ${dir_project_root}/requirements.txt \
+        --output ${path_lambda_deploy_pkg_file}
     print_colored_line $color_cyan "  copy ${dir_venv_site_packages} to ${path_run_lambda_site_packages}"
     cp -r ${dir_venv_site_packages} ${path_run_lambda_site_packages}
 }
@@ -64,8 +68,9 @@ build_lbd_deployment_package() {
 
 upload_lbd_deployment_package() {
     if [ -e $path_lambda_deploy_pkg_file ]; then
-        aws s3 cp ${path_lambda_deploy_pkg_file} ${s3_uri_lambda_deploy_pkg_file} \
-            ${profile_arg}
+        ${bin_python} -m ${package_name}.s3_upload ${path_lambda_deploy_pkg_file} \
+            --bucket ${s3_bucket_lambda_deploy} --key ${s3_key_lambda_deploy_pkg_file} \
+            ${aws_cli_profile_arg}
     else
         print_colored_line $color_light_red "${path_lambda_deploy_pkg_file} not found"
     fi
@@ -74,23 +79,19 @@ upload_lbd_deployment_package() {
 
 build_lbd_dependencies_layer() {
     print_colored_line $color_cyan "create dependencies layer"
-    ensure_not_exists ${path_lambda_layer_file}
     print_colored_line $color_cyan "  zip everything in ${dir_venv_site_packages} except ${package_name}"
-
-    tmp_dir="/tmp/cookiecutter-pygitrepo/${package_name}"
-    tmp_dir_layer="${tmp_dir}/layer"
-    mkdir_if_not_exists ${tmp_dir_layer}
-    cp -r ${dir_venv_site_packages} "${tmp_dir_layer}/python"
-    cd ${tmp_dir_layer}
-    zip ${path_lambda_layer_file} * -r -9 -q -x python/boto3\* python/botocore\* python/s3transfer\* python/setuptools\* python/easy_install.py python/pip\* python/wheel\* python/twine\* python/_pytest\* python/pytest\* python/${package_name}\*;
-    rm_if_exists ${tmp_dir}
+    ${bin_python} -m ${package_name}.devops.lbd_package layer \
+        --site-packages ${dir_venv_site_packages} \
+        --requirements ${dir_project_root}/requirements.txt \
+        --output ${path_lambda_layer_file}
 }
 
 
 upload_lbd_dependencies_layer() {
     if [ -e $path_lambda_layer_file ]; then
-        aws s3 cp ${path_lambda_layer_file} ${s3_uri_lambda_layer_file} \
-            ${profile_arg}
+        ${bin_python} -m ${package_name}.s3_upload ${path_lambda_layer_file} \
+            --bucket ${s3_bucket_lambda_deploy} --key ${s3_key_lambda_layer_file} \
+            ${aws_cli_profile_arg}
     else
         print_colored_line $color_light_red "${path_lambda_layer_file} not found"
     fi
@@ -99,26 +100,28 @@ upload_lbd_dependencies_layer() {
 
 build_lbd_source_code() {
     print_colored_line $color_cyan "create source code zip"
-    ensure_not_exists ${path_lambda_source_file}
     print_colored_line $color_cyan "  zip ${package_name} source code"
     cd ${dir_project_root}
-    zip ${path_lambda_source_file} ${package_name} -r -9 -q -x __pycache__\* \*.pyc \*.pyd \*.pyo;
+    ${bin_python} -m ${package_name}.devops.lbd_package source \
+        --output ${path_lambda_source_file}
 }
 
 
 upload_lbd_source_code() {
     if [ -e $path_lambda_source_file ]; then
-        source_md5="$(python ${dir_bin}/py/md5.py ${path_lambda_source_file})"
-        s3_uri_lambda_source_file="${s3_uri_lambda_source_file_prefix}-${source_md5}.zip"
-        aws s3 cp ${path_lambda_source_file} ${s3_uri_lambda_source_file} \
-            ${profile_arg}
+        source_md5="$(${bin_python} -m ${package_name}.hashing ${path_lambda_source_file})"
+        s3_key_lambda_source_file="${s3_key_lambda_source_file_prefix}-${source_md5}.zip"
+        ${bin_python} -m ${package_name}.s3_upload ${path_lambda_source_file} \
+            --bucket ${s3_bucket_lambda_deploy} --key ${s3_key_lambda_source_file} \
+            ${aws_cli_profile_arg}
     else
         print_colored_line $color_light_red "${path_lambda_source_file} not found"
     fi
 }
 
 
-# upload deployment package, dependencies layer, source code zip to s3
+# upload deployment package, dependencies layer, source code zip to s3,
+# unchanged artifacts are skipped, see ${package_name}/s3_upload.py
 upload_lbd_deployment_everything() {
     upload_lbd_deployment_package
     upload_lbd_dependencies_layer
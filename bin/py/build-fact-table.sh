@@ -0,0 +1,15 @@
+#!/bin/bash
+# -*- coding: utf-8 -*-
+#
+# Freeze bgs_deploy/fact-table.tsv into bgs_deploy/_fact_table_data.py
+
+dir_here="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+dir_bin="$(dirname "${dir_here}")"
+dir_project_root=$(dirname "${dir_bin}")
+
+source ${dir_bin}/py/python-env.sh
+
+set -e
+print_colored_line $color_cyan "[DOING] build ${package_name}/_fact_table_data.py from fact-table.tsv ..."
+cd ${dir_project_root}
+${bin_python} -m ${package_name}.fact_table_build
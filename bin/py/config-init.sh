@@ -10,5 +10,5 @@ source ${dir_bin}/py/python-env.sh
 
 set -e
 print_colored_line ${color_light_cyan} "run config initialization script ..."
-${bin_python} -c "import ${package_name}.devops.config_init"
+${bin_python} -c "from ${package_name}.devops.config_init import get_config; get_config()"
 print_colored_line ${color_green} "complete"
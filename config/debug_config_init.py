@@ -5,8 +5,8 @@ This is a helper script allows developer to invoke the idm_devops.devops.config_
 module quickly, debug any potential bugs.
 """
 
-from bgs_deploy.devops.config_init import config
+from bgs_deploy.devops.config_init import get_config
 
-_ = config
+config = get_config()
 
 print(config.to_json())
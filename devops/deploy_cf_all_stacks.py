@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deploy the ``ecs_example`` and ``lambda_example`` stacks of several stages
+concurrently.
+
+Usage::
+
+    python devops/deploy_cf_all_stacks.py dev test prod
+
+Stages default to the ``STAGE`` of the current config. Unchanged stacks are
+skipped, the deploy hash is stored as a tag of the stack.
+"""
+
+import sys
+
+from bgs_deploy.cf import ecs_example, lambda_example
+from bgs_deploy.cf_deploy import StackTagHashStore
+from bgs_deploy.cf_orchestrator import CloudFormationOrchestrator, StackDeployment
+from bgs_deploy.devops.boto_ses import get_boto_ses
+from bgs_deploy.devops.config import Config
+from bgs_deploy.devops.config_init import get_config
+
+
+def get_stage_config(base_config, stage):
+    """
+    Copy the constant values of ``base_config``, with another ``STAGE``.
+
+    :rtype: Config
+    """
+    from configirl import ValueNotSetError
+
+    data = dict()
+    for key in base_config._constant_fields:
+        try:
+            data[key] = getattr(base_config, key).get_value(check_dont_dump=False)
+        except ValueNotSetError:
+            pass
+    data["STAGE"] = stage
+    config = Config()
+    config.update(data)
+    return config
+
+
+def get_stack_deployments(config):
+    ecs = ecs_example.build_template(config)
+    ecs["template"].add_resource(ecs["ecr_repo_webapp"])
+    lbd = lambda_example.build_template(config)
+    lbd["template"].add_resource(lbd["iam_role_lambda_exec"])
+    env_name = config.ECS_EXAMPLE_ENVIRONMENT_NAME.get_value()
+    return [
+        StackDeployment(
+            stack_name=env_name,
+            template=ecs["template"],
+            parameters={ecs["param_env_name"].title: env_name},
+        ),
+        StackDeployment(
+            stack_name="{}-lambda-example".format(config.ENVIRONMENT_NAME.get_value()),
+            template=lbd["template"],
+            parameters={lbd["param_env_name"].title: env_name},
+        ),
+    ]
+
+
+def print_event(event):
+    print("{:<40} {:<10} {} {}".format(
+        event.stack_name, event.event_type, event.stack_status or "", event.message or ""))
+
+
+if __name__ == "__main__":
+    base_config = get_config()
+    stages = sys.argv[1:] or [base_config.STAGE.get_value(), ]
+    stacks = list()
+    for stage in stages:
+        stacks.extend(get_stack_deployments(get_stage_config(base_config, stage)))
+
+    boto_ses = get_boto_ses()
+    orchestrator = CloudFormationOrchestrator(
+        boto_ses=boto_ses,
+        hash_store=StackTagHashStore(boto_ses),
+        include_iam=True,
+        cft_bucket=base_config.S3_BUCKET_FOR_DEPLOY.get_value(),
+        on_event=print_event,
+    )
+    results = orchestrator.deploy(stacks)
+    if not all(result.ok for result in results):
+        sys.exit(1)
@@ -10,28 +10,41 @@ should be created. You can extend it by changing the
 ``./bgs_deploy/cf/__init__.py`` file.
 
 ``troposphere_mate`` allows you to deploy your CloudFormation stack to AWS
-from Python.
+from Python. The deploy is skipped if the template and the parameters are the same as the
+last successful deploy, the hash is stored as a tag of the stack. Pass
+``--force`` to deploy anyway.
 """
 
-import boto3
+import sys
+
 from bgs_deploy.cf import ecs_example
+from bgs_deploy.cf_deploy import (
+    StackManagerDeployer, StackTagHashStore, deploy_if_changed,
+)
+from bgs_deploy.devops.boto_ses import get_boto_ses
+from bgs_deploy.devops.config_init import get_config
 from troposphere_mate import StackManager
 
-config = ecs_example.config
-ecs_example.template.add_resource(ecs_example.ecr_repo_webapp)
-
-boto_ses = boto3.session.Session(
-    profile_name=config.AWS_PROFILE_FOR_BOTO3.get_value(),
-    region_name=config.AWS_REGION.get_value(),
-)
+config = get_config()
+ecs = ecs_example.build_template(config)
+ecs["template"].add_resource(ecs["ecr_repo_webapp"])
 
-sm = StackManager(boto_ses=boto_ses, cft_bucket=ecs_example.config.S3_BUCKET_FOR_DEPLOY.get_value())
+boto_ses = get_boto_ses()
 
-sm.deploy(
-    template=ecs_example.template,
+result = deploy_if_changed(
     stack_name=config.ECS_EXAMPLE_ENVIRONMENT_NAME.get_value(),
-    stack_parameters={
-        ecs_example.param_env_name.title: config.ECS_EXAMPLE_ENVIRONMENT_NAME.get_value(),
+    template=ecs["template"],
+    deployer=StackManagerDeployer(
+        StackManager(boto_ses=boto_ses, cft_bucket=config.S3_BUCKET_FOR_DEPLOY.get_value()),
+        include_iam=True,
+    ),
+    hash_store=StackTagHashStore(boto_ses),
+    parameters={
+        ecs["param_env_name"].title: config.ECS_EXAMPLE_ENVIRONMENT_NAME.get_value(),
     },
-    include_iam=True
+    force="--force" in sys.argv,
 )
+if result.skipped:
+    print("stack {} is up to date, deploy skipped".format(result.stack_name))
+else:
+    print("stack {}: {}".format(result.stack_name, result.deployer_result))
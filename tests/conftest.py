@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from helpers import BUCKET
+
+
+@pytest.fixture
+def boto_ses():
+    """
+    A boto3 session on mocked AWS, with the ``helpers.BUCKET`` bucket.
+    """
+    with mock_aws():
+        boto_ses = boto3.session.Session(region_name="us-east-1")
+        boto_ses.client("s3").create_bucket(Bucket=BUCKET)
+        yield boto_ses
+
+
+@pytest.fixture
+def s3_client(boto_ses):
+    return boto_ses.client("s3")
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test data and fakes shared by the test modules. Fixtures are in
+``conftest.py``.
+"""
+
+import io
+import json
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+
+DeploymentOptions = BlueGreenECSDeployment.DeploymentOptions
+
+BUCKET = "bgs-deploy-test"
+
+
+def make_service_resources(service_name, logic_ids, stages):
+    resources = list()
+    for i, logic_id in enumerate(logic_ids):
+        name = "{}_{}".format(service_name, logic_id)
+        resources.append({
+            "type": "aws_ecs_task_definition",
+            "name": name,
+            "instances": [{"attributes": {
+                "arn": "arn:aws:ecs:us-east-1:111122223333:task-definition/{}:{}".format(name, i + 1),
+                "container_definitions": json.dumps([{"image": "app@sha256:" + logic_id * 64}]),
+            }}],
+        })
+        resources.append({
+            "type": "aws_ecs_service",
+            "name": name,
+            "instances": [{"attributes": {"task_definition": "arn-" + name}}],
+        })
+    for stage, logic_id in stages.items():
+        resources.append({
+            "type": "aws_lb_listener",
+            "name": "{}_{}".format(service_name, stage),
+            "instances": [{"attributes": {}, "depends_on": [
+                "aws_lb_target_group.{}_{}".format(service_name, logic_id),
+            ]}],
+        })
+    return resources
+
+
+tf_state_data = {
+    "resources": (
+        make_service_resources("helpdesk", "ab", {"active": "b", "inactive": "a"})
+        + make_service_resources("billing", "c", {"staging": "c"})
+        + make_service_resources("my_web_app", "a", {"active": "a"})
+        + [{"type": "aws_s3_bucket", "name": "helpdesk_bucket", "instances": []}]
+    )
+}
+
+
+class FakeS3Client(object):
+    """
+    Serves :data:`tf_state_data` for any key, counts ``get_object`` calls.
+    """
+    n_get_object = 0
+
+    def get_object(self, Bucket, Key):
+        FakeS3Client.n_get_object += 1
+        return {"Body": io.BytesIO(json.dumps(tf_state_data).encode("utf-8"))}
+
+
+class FakeClientError(Exception):
+    """
+    Looks like a botocore ``ClientError`` to the ``is_*_error`` helpers.
+    """
+
+    def __init__(self, code, message):
+        super(FakeClientError, self).__init__(message)
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class FakeBotoSession(object):
+    def client(self, service_name):
+        return FakeS3Client()
+
+
+deployment_list = [
+    dict(service_name="helpdesk", deployment_option=DeploymentOptions.deploy_to_staging,
+         docker_image_digest="d" * 64),
+    dict(service_name="billing", deployment_option=DeploymentOptions.deploy_to_active),
+    dict(service_name="my_web_app", deployment_option=DeploymentOptions.do_nothing),
+    dict(service_name="my_web_app", deployment_option=DeploymentOptions.roll_back_to_previous),
+    dict(service_name="new_service", deployment_option=DeploymentOptions.deploy_to_staging,
+         docker_image_digest="e" * 64),
+]
+
+
+def make_template(topic_name_suffix="a"):
+    """
+    A CloudFormation template with one SNS topic.
+    """
+    return {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Parameters": {
+            "EnvironmentName": {"Type": "String"},
+        },
+        "Resources": {
+            "Topic": {
+                "Type": "AWS::SNS::Topic",
+                "Properties": {
+                    "TopicName": {"Fn::Sub": "${EnvironmentName}-" + topic_name_suffix},
+                },
+            },
+        },
+    }
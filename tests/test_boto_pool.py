@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import boto3
+import pytest
+
+from bgs_deploy.boto_pool import BotoClientPool
+
+
+class FakeBotoSession(object):
+    region_name = "us-east-1"
+
+    def __init__(self):
+        self.n_client = 0
+
+    def client(self, service_name, **kwargs):
+        self.n_client += 1
+        return object()
+
+
+def test_get_client():
+    pool = BotoClientPool()
+    boto_ses = FakeBotoSession()
+    s3_client = pool.get_client(boto_ses, "s3")
+    assert pool.get_client(boto_ses, "s3") is s3_client
+    assert pool.get_client(boto_ses, "s3", region_name="us-east-1") is s3_client
+    assert pool.get_client(boto_ses, "s3", region_name="us-east-2") is not s3_client
+    assert pool.get_client(boto_ses, "cloudformation") is not s3_client
+    assert pool.get_client(boto_ses, "s3", max_pool_connections=50) is not s3_client
+    assert boto_ses.n_client == 4
+
+    other_boto_ses = FakeBotoSession()
+    assert pool.get_client(other_boto_ses, "s3") is not s3_client
+
+    pool.clear()
+    assert pool.get_client(boto_ses, "s3") is not s3_client
+
+
+def test_get_client_concurrently():
+    pool = BotoClientPool()
+    boto_ses = FakeBotoSession()
+    clients = list()
+
+    def get():
+        clients.append(pool.get_client(boto_ses, "s3"))
+
+    threads = [threading.Thread(target=get) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert boto_ses.n_client == 1
+    assert len({id(client) for client in clients}) == 1
+
+
+def test_get_client_real_session():
+    pool = BotoClientPool(max_pool_connections=20)
+    boto_ses = boto3.session.Session(region_name="us-east-1")
+    s3_client = pool.get_client(boto_ses, "s3")
+    assert s3_client.meta.config.max_pool_connections == 20
+    assert pool.get_client(boto_ses, "s3") is s3_client
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
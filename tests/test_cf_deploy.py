@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from bgs_deploy.cf_deploy import (
+    DEPLOY_HASH_TAG_KEY, CloudFormationDeployer, LocalLedgerHashStore,
+    StackManagerDeployer, StackRollbackCompleteError, StackTagHashStore,
+    deploy_if_changed, describe_stack, get_deploy_hash,
+)
+from helpers import FakeClientError, make_template
+
+stack_name = "bgs-deploy-test"
+
+
+def test_get_deploy_hash():
+    template = make_template()
+    reordered = dict(reversed(list(template.items())))
+    assert get_deploy_hash(template, {"a": 1}) == get_deploy_hash(reordered, {"a": "1"})
+    assert get_deploy_hash(template, {"a": 1}) != get_deploy_hash(template, {"a": 2})
+    assert get_deploy_hash(template) != get_deploy_hash(make_template("b"))
+
+
+class CountingDeployer(object):
+    def __init__(self, deployer):
+        self.deployer = deployer
+        self.n_calls = 0
+
+    def __call__(self, *args):
+        self.n_calls += 1
+        return self.deployer(*args)
+
+
+class FakeStackManager(object):
+    """
+    Mimic ``troposphere_mate.StackManager.deploy``, it doesn't wait.
+    """
+
+    def __init__(self, boto_ses):
+        self.boto_ses = boto_ses
+
+    def deploy(self, template, stack_name, stack_tags=None,
+               stack_parameters=None, include_iam=False):
+        cf_client = self.boto_ses.client("cloudformation")
+        kwargs = dict(
+            StackName=stack_name,
+            TemplateBody=json.dumps(template),
+            Parameters=[
+                dict(ParameterKey=key, ParameterValue=value)
+                for key, value in (stack_parameters or dict()).items()
+            ],
+            Tags=[
+                dict(Key=key, Value=value)
+                for key, value in (stack_tags or dict()).items()
+            ],
+        )
+        if include_iam:
+            kwargs["Capabilities"] = ["CAPABILITY_NAMED_IAM"]
+        if describe_stack(cf_client, stack_name) is None:
+            cf_client.create_stack(**kwargs)
+        else:
+            cf_client.update_stack(**kwargs)
+
+
+@pytest.mark.parametrize("deployer_type", ["stack_manager", "cloudformation"])
+@pytest.mark.parametrize("store_type", ["tag", "ledger"])
+def test_deploy_if_changed(deployer_type, store_type, tmpdir):
+    with mock_aws():
+        boto_ses = boto3.session.Session(region_name="us-east-1")
+        if deployer_type == "stack_manager":
+            deployer = StackManagerDeployer(FakeStackManager(boto_ses), include_iam=True)
+        else:
+            deployer = CloudFormationDeployer(boto_ses)
+        deployer = CountingDeployer(deployer)
+        if store_type == "tag":
+            hash_store = StackTagHashStore(boto_ses)
+        else:
+            hash_store = LocalLedgerHashStore(str(tmpdir.join("ledger.json")))
+
+        def deploy(template, env_name, force=False):
+            return deploy_if_changed(
+                stack_name, template, deployer, hash_store,
+                parameters={"EnvironmentName": env_name},
+                tags={"Project": "bgs_deploy"},
+                force=force,
+            )
+
+        result = deploy(make_template(), "dev")
+        assert result.skipped is False
+        assert result.deployer_result == "create"
+        assert deployer.n_calls == 1
+
+        stack = boto_ses.client("cloudformation").describe_stacks(StackName=stack_name)["Stacks"][0]
+        tags = {tag["Key"]: tag["Value"] for tag in stack["Tags"]}
+        assert tags["Project"] == "bgs_deploy"
+        if store_type == "tag":
+            assert tags[DEPLOY_HASH_TAG_KEY] == result.deploy_hash
+        else:
+            assert DEPLOY_HASH_TAG_KEY not in tags
+            assert hash_store.get(stack_name) == result.deploy_hash
+
+        # nothing changed
+        result = deploy(make_template(), "dev")
+        assert result.skipped is True
+        assert deployer.n_calls == 1
+
+        # parameter changed
+        result = deploy(make_template(), "test")
+        assert result.skipped is False
+        assert result.deployer_result == "update"
+        assert deployer.n_calls == 2
+
+        # template changed
+        assert deploy(make_template("b"), "test").skipped is False
+        assert deploy(make_template("b"), "test").skipped is True
+        assert deploy(make_template("b"), "test", force=True).skipped is False
+        assert deployer.n_calls == 4
+
+
+class RolledBackCloudFormationClient(object):
+    """
+    The stack is in ``ROLLBACK_COMPLETE``, a create after a delete succeeds.
+    """
+
+    class Waiter(object):
+        def wait(self, StackName):
+            pass
+
+    def __init__(self):
+        self.status = "ROLLBACK_COMPLETE"
+        self.calls = list()
+
+    def describe_stacks(self, StackName):
+        if self.status is None:
+            raise FakeClientError(
+                "ValidationError", "Stack with id {} does not exist".format(StackName))
+        return {"Stacks": [{"StackName": StackName, "StackStatus": self.status}]}
+
+    def create_stack(self, StackName, **kwargs):
+        self.calls.append("create_stack")
+        self.status = "CREATE_COMPLETE"
+
+    def update_stack(self, StackName, **kwargs):
+        raise AssertionError("a ROLLBACK_COMPLETE stack can't be updated")
+
+    def delete_stack(self, StackName):
+        self.calls.append("delete_stack")
+        self.status = None
+
+    def get_waiter(self, name):
+        return self.Waiter()
+
+
+def test_deployer_rollback_complete():
+    cf_client = RolledBackCloudFormationClient()
+    deployer = CloudFormationDeployer(None, cf_client=cf_client)
+    with pytest.raises(StackRollbackCompleteError) as excinfo:
+        deployer(stack_name, "{}", dict(), dict())
+    assert "ROLLBACK_COMPLETE" in str(excinfo.value)
+    assert cf_client.calls == []
+
+    deployer = CloudFormationDeployer(
+        None, cf_client=cf_client, recreate_rollback_complete=True)
+    assert deployer(stack_name, "{}", dict(), dict()) == "create"
+    assert cf_client.calls == ["delete_stack", "create_stack"]
+    assert cf_client.status == "CREATE_COMPLETE"
+
+
+def test_stack_manager_deployer_rollback_complete():
+    class StackManager(object):
+        boto_ses = None
+
+        def deploy(self, **kwargs):
+            raise AssertionError("a ROLLBACK_COMPLETE stack can't be updated")
+
+    cf_client = RolledBackCloudFormationClient()
+    deployer = StackManagerDeployer(StackManager(), cf_client=cf_client)
+    with pytest.raises(StackRollbackCompleteError):
+        deployer(stack_name, make_template(), dict(), dict())
+    assert cf_client.calls == []
+
+
+def test_template_url_is_regional():
+    with mock_aws():
+        boto_ses = boto3.session.Session(region_name="us-east-2")
+        boto_ses.client("s3").create_bucket(
+            Bucket="cft-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "us-east-2"},
+        )
+        deployer = CloudFormationDeployer(boto_ses, cft_bucket="cft-bucket")
+        template_url = deployer.get_template_kwargs(stack_name, "{}")["TemplateURL"]
+        assert template_url.startswith("https://cft-bucket.s3.us-east-2.amazonaws.com/")
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
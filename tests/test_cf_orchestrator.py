@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from bgs_deploy.cf_deploy import LocalLedgerHashStore, StackTagHashStore
+from bgs_deploy.cf_orchestrator import (
+    AdaptiveBackoff, CloudFormationOrchestrator, ProgressEventTypes,
+    StackDeployment, TokenBucket,
+)
+from helpers import FakeClientError, make_template
+
+
+class FakeCloudFormationClient(object):
+    """
+    A stack reaches its final status ``durations[stack_name]`` seconds after
+    submitted. Every ``throttle_every`` th describe_stacks call is throttled.
+    """
+
+    def __init__(self, durations, failed=(), throttle_every=None):
+        self.durations = durations
+        self.failed = set(failed)
+        self.throttle_every = throttle_every
+        self.stacks = dict()
+        self.n_describe = 0
+        self.lock = threading.Lock()
+
+    def _submit(self, StackName, action, **kwargs):
+        if StackName in self.failed:
+            final = "ROLLBACK_COMPLETE" if action == "CREATE" else "UPDATE_ROLLBACK_COMPLETE"
+        else:
+            final = "{}_COMPLETE".format(action)
+        self.stacks[StackName] = {
+            "status": "{}_IN_PROGRESS".format(action),
+            "final": final,
+            "ready_at": time.monotonic() + self.durations[StackName],
+        }
+
+    def create_stack(self, StackName, **kwargs):
+        self._submit(StackName, "CREATE")
+
+    def update_stack(self, StackName, **kwargs):
+        self._submit(StackName, "UPDATE")
+
+    def describe_stacks(self, StackName):
+        with self.lock:
+            self.n_describe += 1
+            if self.throttle_every and self.n_describe % self.throttle_every == 0:
+                raise FakeClientError("Throttling", "Rate exceeded")
+        if StackName not in self.stacks:
+            raise FakeClientError(
+                "ValidationError", "Stack with id {} does not exist".format(StackName))
+        stack = self.stacks[StackName]
+        if time.monotonic() >= stack["ready_at"]:
+            stack["status"] = stack["final"]
+        return {"Stacks": [{"StackName": StackName, "StackStatus": stack["status"], "Tags": []}]}
+
+
+def fast_backoff():
+    return AdaptiveBackoff(initial=0.01, maximum=0.05, jitter=0)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_adaptive_backoff():
+    backoff = AdaptiveBackoff(initial=1, maximum=4, factor=2)
+    backoff.on_idle()
+    assert backoff.delay == 2
+    backoff.on_throttle()
+    assert backoff.delay == 4
+    backoff.on_idle()
+    assert backoff.delay == 4
+    backoff.on_progress()
+    assert backoff.delay == 1
+
+
+def test_deploy_concurrently():
+    durations = {"stack-{}".format(i): 0.1 + 0.05 * i for i in range(6)}
+    cf_client = FakeCloudFormationClient(durations, failed=["stack-2"], throttle_every=7)
+    events = list()
+    orchestrator = CloudFormationOrchestrator(
+        boto_ses=None,
+        cf_client=cf_client,
+        rate_limiter=TokenBucket(rate=1000),
+        backoff_factory=fast_backoff,
+        on_event=events.append,
+    )
+    start = time.monotonic()
+    results = orchestrator.deploy([
+        StackDeployment(stack_name=stack_name, template=make_template())
+        for stack_name in durations
+    ])
+    elapsed = time.monotonic() - start
+    # close to the slowest stack, far less than the sum
+    assert elapsed < max(durations.values()) + 0.3
+    assert elapsed < sum(durations.values())
+
+    assert [result.stack_name for result in results] == list(durations)
+    for result in results:
+        if result.stack_name == "stack-2":
+            assert result.ok is False
+            assert result.stack_status == "ROLLBACK_COMPLETE"
+        else:
+            assert result.ok is True
+            assert result.action == "create"
+            assert result.stack_status == "CREATE_COMPLETE"
+
+    event_types = {(event.stack_name, event.event_type) for event in events}
+    assert ("stack-0", ProgressEventTypes.submitted) in event_types
+    assert ("stack-0", ProgressEventTypes.complete) in event_types
+    assert ("stack-2", ProgressEventTypes.failed) in event_types
+    assert any(event.event_type == ProgressEventTypes.throttled for event in events)
+    statuses = [
+        event.stack_status for event in events
+        if event.stack_name == "stack-1" and event.event_type == ProgressEventTypes.status
+    ]
+    assert statuses == ["CREATE_IN_PROGRESS", "CREATE_COMPLETE"]
+
+
+def test_deploy_timeout():
+    cf_client = FakeCloudFormationClient({"slow": 10})
+    orchestrator = CloudFormationOrchestrator(
+        boto_ses=None, cf_client=cf_client,
+        backoff_factory=fast_backoff, timeout=0.1,
+    )
+    result = orchestrator.deploy([StackDeployment(stack_name="slow", template=make_template())])[0]
+    assert result.ok is False
+    assert isinstance(result.error, TimeoutError)
+
+
+class CountingTokenBucket(TokenBucket):
+    n_acquire = 0
+
+    def acquire(self):
+        self.n_acquire += 1
+        super(CountingTokenBucket, self).acquire()
+
+
+def test_tag_hash_store_is_rate_limited():
+    cf_client = FakeCloudFormationClient({"stack": 0}, throttle_every=2)
+    cf_client.n_describe = 1  # the tag lookup is the 2nd call, throttled
+    rate_limiter = CountingTokenBucket(rate=1000)
+    events = list()
+    orchestrator = CloudFormationOrchestrator(
+        boto_ses=None,
+        cf_client=cf_client,
+        rate_limiter=rate_limiter,
+        backoff_factory=fast_backoff,
+        hash_store=StackTagHashStore(None, cf_client=cf_client),
+        on_event=events.append,
+    )
+    result = orchestrator.deploy([StackDeployment(stack_name="stack", template=make_template())])[0]
+    assert result.ok is True
+    assert result.error is None
+    assert events[0].event_type == ProgressEventTypes.throttled
+    # the throttled tag lookup and its retry took a token each
+    assert rate_limiter.n_acquire == result.n_api_calls
+    assert result.n_api_calls >= 3
+
+
+def test_deploy_moto(tmpdir):
+    with mock_aws():
+        boto_ses = boto3.session.Session(region_name="us-east-1")
+        orchestrator = CloudFormationOrchestrator(
+            boto_ses=boto_ses,
+            backoff_factory=fast_backoff,
+            hash_store=LocalLedgerHashStore(str(tmpdir.join("ledger.json"))),
+        )
+        stacks = [
+            StackDeployment(
+                stack_name="bgs-deploy-{}".format(stage),
+                template=make_template(),
+                parameters={"EnvironmentName": "bgs-deploy-{}".format(stage)},
+            )
+            for stage in ["dev", "test", "prod"]
+        ]
+        results = orchestrator.deploy(stacks)
+        assert [result.ok for result in results] == [True] * 3
+        assert [result.stack_status for result in results] == ["CREATE_COMPLETE"] * 3
+
+        results = orchestrator.deploy(stacks)
+        assert [result.skipped for result in results] == [True] * 3
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bgs_deploy.cli import main
+from bgs_deploy.fleet import BlueGreenECSFleet
+from helpers import BUCKET, FakeBotoSession, deployment_list, tf_state_data
+
+dir_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def state_path(tmpdir):
+    path = tmpdir.join("terraform.tfstate")
+    path.write(json.dumps(tf_state_data))
+    return str(path)
+
+
+def make_input(deployments):
+    lines = [json.dumps(kwargs) for kwargs in deployments]
+    lines.insert(2, "")  # blank lines are skipped
+    lines.append("not json")
+    lines.append(json.dumps({"service_name": "helpdesk"}))
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("stream,batch_size", [(False, 100), (True, 2)])
+def test_plan(state_path, stream, batch_size):
+    argv = ["plan", "--state", state_path, "--batch-size", str(batch_size)]
+    if stream:
+        argv.append("--stream")
+    stdout = io.StringIO()
+    exit_code = main(argv, stdin=io.StringIO(make_input(deployment_list)), stdout=stdout)
+    assert exit_code == 1
+
+    results = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [result["line"] for result in results] == [1, 2, 4, 5, 6, 7, 8]
+    expected = BlueGreenECSFleet(FakeBotoSession(), "bucket", "key").plan(deployment_list)
+    for result, expected_result in zip(results, expected):
+        del result["line"]
+        assert result == json.loads(json.dumps(expected_result))
+    assert results[-2]["service_name"] is None
+    assert "Expecting value" in results[-2]["error"]
+    assert "deployment_option" in results[-1]["error"]
+
+
+def test_plan_without_boto3(state_path):
+    process = subprocess.run(
+        [
+            sys.executable, "-c",
+            "import sys; from bgs_deploy.cli import main; code = main(); "
+            "assert not [m for m in sys.modules if m.split('.')[0] in "
+            "('boto3', 'botocore', 'troposphere', 'troposphere_mate')], 'imported'; "
+            "sys.exit(code)",
+            "plan", "--state", state_path,
+        ],
+        input=json.dumps(deployment_list[0]) + "\n",
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, cwd=dir_project_root,
+    )
+    assert process.returncode == 0, process.stderr
+    result = json.loads(process.stdout)
+    assert result["plan"]["blue_green_stage"]["staging"]["logic_id"] == "c"
+
+
+def test_missing_state_file(tmpdir):
+    with pytest.raises(IOError):
+        main(["plan", "--state", str(tmpdir.join("missing.tfstate"))],
+             stdin=io.StringIO(json.dumps(deployment_list[0])), stdout=io.StringIO())
+
+
+def test_plan_broken_service(tmpdir):
+    broken = dict(tf_state_data)
+    broken["resources"] = tf_state_data["resources"] + [{
+        "type": "aws_ecs_service",
+        "name": "helpdesk_z",
+        "instances": [{"attributes": {"task_definition": "arn-helpdesk_z"}}],
+    }]
+    path = tmpdir.join("terraform.tfstate")
+    path.write(json.dumps(broken))
+    stdout = io.StringIO()
+    exit_code = main(["plan", "--state", str(path)],
+                     stdin=io.StringIO(make_input(deployment_list[:2])), stdout=stdout)
+    assert exit_code == 1
+
+    results = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [result["service_name"] for result in results[:2]] == ["helpdesk", "billing"]
+    assert "KeyError" in results[0]["error"]
+    assert results[0]["plan"] is None
+    # other services are still planned
+    assert results[1]["error"] is None
+    assert results[1]["plan"]["blue_green_stage"]["active"]["logic_id"] == "c"
+
+
+def test_plan_from_bucket(boto_ses, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    boto_ses.client("s3").put_object(
+        Bucket=BUCKET, Key="terraform.tfstate", Body=json.dumps(tf_state_data))
+
+    def plan(bucket, key):
+        stdout = io.StringIO()
+        exit_code = main(["plan", "--bucket", bucket, "--key", key],
+                         stdin=io.StringIO(json.dumps(deployment_list[0])), stdout=stdout)
+        return exit_code, json.loads(stdout.getvalue())
+
+    exit_code, result = plan(BUCKET, "terraform.tfstate")
+    assert exit_code == 0
+    assert result["plan"]["blue_green_stage"]["staging"]["logic_id"] == "c"
+
+    # no state yet, plan against an empty state
+    exit_code, result = plan(BUCKET, "missing.tfstate")
+    assert exit_code == 0
+    assert result["plan"]["blue_green_stage"]["staging"]["logic_id"] == "a"
+
+    # any other error is not an empty state
+    with pytest.raises(Exception) as excinfo:
+        plan("no-such-bucket", "terraform.tfstate")
+    assert "NoSuchBucket" in str(excinfo.value)
+
+
+if __name__ == "__main__":
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bgs_deploy.devops.config import Config
+from bgs_deploy.devops.config_snapshot import (
+    SNAPSHOT_ENV_VAR, SnapshotConfig,
+    build_snapshot, encode_snapshot, decode_snapshot, render_snapshot_module,
+    get_secret_keys,
+)
+
+dir_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_config():
+    config = Config()
+    config.update({
+        "PROJECT_NAME": "bgs_deploy",
+        "STAGE": "dev",
+        "AWS_PROFILE": "my_profile",
+        "AWS_REGION": "us-east-1",
+    })
+    return config
+
+
+def test_build_snapshot():
+    snapshot = build_snapshot(make_config())
+    assert snapshot["PROJECT_NAME"] == "bgs_deploy"
+    assert snapshot["PROJECT_NAME_SLUG"] == "bgs-deploy"
+    assert snapshot["ENVIRONMENT_NAME"] == "bgs-deploy-dev"
+    assert snapshot["ECS_EXAMPLE_ENVIRONMENT_NAME"] == "bgs-deploy-dev-ecs-example"
+    # resolved for the lambda runtime
+    assert snapshot["AWS_PROFILE_FOR_BOTO3"] is None
+    assert "AWS_ACCOUNT_ID" not in snapshot
+
+    assert decode_snapshot(encode_snapshot(snapshot)) == snapshot
+
+    namespace = dict()
+    exec(render_snapshot_module(snapshot), namespace)
+    assert namespace["SNAPSHOT"] == snapshot
+
+    config = SnapshotConfig(snapshot)
+    assert config.ENVIRONMENT_NAME.get_value() == "bgs-deploy-dev"
+    assert config.to_dict() == snapshot
+    with pytest.raises(AttributeError):
+        config.STAGE = "prod"
+
+
+def test_build_snapshot_leaves_out_secrets(tmpdir):
+    config = make_config()
+    config.update({"METADATA": {"token": "secret"}, "AWS_ACCOUNT_ID": "111122223333"})
+    path = tmpdir.join("00-config-shared-secrets.json")
+    path.write(json.dumps({"AWS_ACCOUNT_ID": "111122223333"}))
+    secret_keys = get_secret_keys(str(path))
+    assert secret_keys == {"AWS_ACCOUNT_ID"}
+    assert get_secret_keys(str(tmpdir.join("not-exists.json"))) == set()
+
+    snapshot = build_snapshot(config, exclude=secret_keys)
+    # dont_dump field
+    assert "METADATA" not in snapshot
+    assert "AWS_ACCOUNT_ID" not in snapshot
+    assert "111122223333" not in json.dumps(snapshot)
+    assert snapshot["STAGE"] == "dev"
+
+
+code = """
+import json, sys
+from bgs_deploy.handlers.my_func import handler
+print(json.dumps({
+    "modules": sorted(sys.modules),
+    "result": handler({"name": "Alice"}, None),
+}))
+"""
+
+
+def test_lambda_cold_start_uses_snapshot():
+    env = dict(os.environ)
+    env["AWS_LAMBDA_FUNCTION_NAME"] = "my_func"
+    env[SNAPSHOT_ENV_VAR] = encode_snapshot(build_snapshot(make_config()))
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], cwd=dir_project_root, env=env)
+    data = json.loads(output.decode("utf-8"))
+    assert "configirl" not in data["modules"]
+    assert data["result"] == "Hello Alice! This is a demo project called bgs_deploy"
+
+
+if __name__ == "__main__":
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from bgs_deploy import fact_table_build
+from bgs_deploy.framework import FactTable, get_fact_table, fact_table_tsv
+
+
+def test_generated_module_is_up_to_date():
+    assert fact_table_build.check(), \
+        "fact-table.tsv changed, run 'python -m bgs_deploy.fact_table_build'"
+    fact_table = FactTable.from_tsv(fact_table_tsv)
+    assert get_fact_table().option_list == fact_table.option_list
+    assert get_fact_table().flags == fact_table.flags
+
+
+def test_check_detects_drift(tmpdir):
+    tsv_path = tmpdir.join("fact-table.tsv")
+    py_path = tmpdir.join("_fact_table_data.py")
+    with open(fact_table_tsv, "rb") as f:
+        tsv_path.write_binary(f.read())
+    assert fact_table_build.check(str(tsv_path), str(py_path)) is False
+
+    fact_table_build.build(str(tsv_path), str(py_path))
+    assert fact_table_build.check(str(tsv_path), str(py_path)) is True
+
+    content = tsv_path.read_binary().replace(
+        b"do_nothing\t0\t0\t0\t1\t0\t0\t0", b"do_nothing\t0\t0\t0\t0\t0\t0\t0")
+    tsv_path.write_binary(content)
+    assert fact_table_build.check(str(tsv_path), str(py_path)) is False
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
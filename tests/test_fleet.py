@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.fleet import BlueGreenECSFleet, get_future_plan
+from helpers import FakeBotoSession, FakeS3Client, deployment_list
+
+
+@pytest.mark.parametrize("tf_state_stream", [False, True])
+def test_fleet_plan(tf_state_stream):
+    FakeS3Client.n_get_object = 0
+    fleet = BlueGreenECSFleet(
+        FakeBotoSession(), "bucket", "terraform.tfstate",
+        service_names=["helpdesk", "billing", "my_web_app", "new_service"],
+        tf_state_stream=tf_state_stream,
+    )
+    results = fleet.plan(deployment_list)
+    assert FakeS3Client.n_get_object == 1
+    assert [result["service_name"] for result in results] \
+           == [kwargs["service_name"] for kwargs in deployment_list]
+
+    for kwargs, result in zip(deployment_list, results):
+        try:
+            deployment = BlueGreenECSDeployment(
+                FakeBotoSession(), "bucket", "terraform.tfstate", **kwargs)
+        except ValueError:
+            assert result["plan"] is None
+            assert "roll back" in result["error"]
+            continue
+        assert result["error"] is None
+        assert result["blue_green_state_data"] == deployment.blue_green_state_data
+        assert result["plan"] == get_future_plan(deployment)
+
+    assert results[0]["plan"]["blue_green_stage"]["staging"]["logic_id"] == "c"
+    assert results[0]["plan"]["logic_id"]["c"]["docker_image_digest"] == "d" * 64
+    assert results[1]["plan"]["blue_green_stage"]["active"]["logic_id"] == "c"
+    assert results[1]["tf_target_addresses"] == [
+        "aws_lb_listener.billing_active",
+        "aws_lb_listener.billing_staging",
+    ]
+    assert results[2]["tf_target_addresses"] == []
+
+
+def test_fleet_warm():
+    FakeS3Client.n_get_object = 0
+    fleet = BlueGreenECSFleet(FakeBotoSession(), "bucket", "terraform.tfstate")
+    assert fleet.warm() is fleet
+    assert FakeS3Client.n_get_object == 1
+    assert fleet._tf_state_index_cache is not None
+    fleet.plan(deployment_list)
+    assert FakeS3Client.n_get_object == 1
+
+
+def test_fleet_plan_invalid_item():
+    fleet = BlueGreenECSFleet(FakeBotoSession(), "bucket", "terraform.tfstate")
+    results = fleet.plan([
+        {"deployment_option": "do_nothing"},
+        dict(deployment_list[1], color="blue"),
+        "helpdesk",
+        deployment_list[1],
+    ])
+    assert [result["service_name"] for result in results] \
+           == [None, "billing", None, "billing"]
+    assert "service_name" in results[0]["error"]
+    assert "color" in results[1]["error"]
+    assert "expect a dict" in results[2]["error"]
+    assert all(result["plan"] is None for result in results[:3])
+    assert results[3]["error"] is None
+    assert results[3]["plan"]["blue_green_stage"]["active"]["logic_id"] == "c"
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
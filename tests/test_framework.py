@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+
+import pytest
+
+from bgs_deploy import framework
+from bgs_deploy.framework import (
+    DeploymentOptions, DeploymentEnvNames, BlueGreenStageDeployment,
+    get_fact_table, get_fact_table_dict, IS_VALID,
+    FLAG_IS_VALID, FLAG_UNKNOWN, env_name_to_future_flag, to_presence_mask,
+)
+
+
+class StaticBlueGreenStageDeployment(BlueGreenStageDeployment):
+    def __init__(self, active, inactive, staging):
+        self._logic_ids = (active, inactive, staging)
+
+    @property
+    def current_active_logic_id(self):
+        return self._logic_ids[0]
+
+    @property
+    def current_inactive_logic_id(self):
+        return self._logic_ids[1]
+
+    @property
+    def current_staging_logic_id(self):
+        return self._logic_ids[2]
+
+
+all_presence = list(itertools.product([0, 1], repeat=3))
+
+
+def test_compiled_fact_table_matches_tsv():
+    fact_table, fact_table_dict = get_fact_table(), get_fact_table_dict()
+    assert len(fact_table_dict) == len(DeploymentOptions.Values()) * 8
+    for key, row in fact_table_dict.items():
+        option, has_active, has_inactive, has_staging = key.split("-")
+        flags = fact_table.lookup(
+            fact_table.get_option_index(option),
+            to_presence_mask(int(has_active), int(has_inactive), int(has_staging)),
+        )
+        assert bool(flags & FLAG_IS_VALID) is row[IS_VALID]
+        for env_name, future_flag in env_name_to_future_flag.items():
+            assert bool(flags & future_flag) is row[env_name]
+
+
+def test_should_create_bgs_resource():
+    fact_table_dict = get_fact_table_dict()
+    for option in DeploymentOptions.Values():
+        for has_active, has_inactive, has_staging in all_presence:
+            bgd = StaticBlueGreenStageDeployment(
+                "a" if has_active else None,
+                "b" if has_inactive else None,
+                "c" if has_staging else None,
+            )
+            row = fact_table_dict["{}-{}-{}-{}".format(
+                option, has_active, has_inactive, has_staging)]
+            for env_name in DeploymentEnvNames.Values():
+                if row[IS_VALID]:
+                    assert bgd.should_create_bgs_resource(option, env_name) is row[env_name]
+                else:
+                    with pytest.raises(Exception) as e:
+                        bgd.should_create_bgs_resource(option, env_name)
+                    assert "System state is invalid" in str(e.value)
+
+    bgd = StaticBlueGreenStageDeployment("a", None, None)
+    with pytest.raises(ValueError):
+        bgd.should_create_bgs_resource("invalid_option", DeploymentEnvNames.active)
+    with pytest.raises(ValueError):
+        bgd.should_create_bgs_resource(DeploymentOptions.do_nothing, "invalid_env_name")
+
+
+def test_evaluate_batch():
+    rows = [
+        (option, has_active, has_inactive, has_staging)
+        for option in DeploymentOptions.Values()
+        for has_active, has_inactive, has_staging in all_presence
+    ]
+    fact_table = get_fact_table()
+    flags = fact_table.evaluate_batch(rows)
+    for row, flag in zip(rows, flags):
+        option, has_active, has_inactive, has_staging = row
+        assert flag == fact_table.lookup(
+            fact_table.get_option_index(option),
+            to_presence_mask(has_active, has_inactive, has_staging),
+        )
+    assert fact_table.evaluate_batch([(0, True, False, True)]).tolist() \
+           == [fact_table.lookup(0, 0b101)]
+
+    assert fact_table.evaluate_columns([0, 1, 30], [0, 7, 0]).tolist() \
+           == [fact_table.lookup(0, 0), fact_table.lookup(1, 7), FLAG_UNKNOWN]
+    with pytest.raises(KeyError):
+        fact_table.evaluate_batch([("invalid_option", 0, 0, 0)])
+
+
+def test_undefined_combination(monkeypatch):
+    # a fact table where "do_nothing" is only defined with active only
+    rows = [
+        row for row in framework.read_fact_table_rows()
+        if row[0] != DeploymentOptions.do_nothing or row[1:4] == ["1", "0", "0"]
+    ]
+    partial_fact_table = framework.FactTable.from_rows(rows)
+    option_index = partial_fact_table.get_option_index(DeploymentOptions.do_nothing)
+    with pytest.raises(KeyError):
+        partial_fact_table.lookup(option_index, to_presence_mask(1, 1, 0))
+    flags = partial_fact_table.evaluate_batch([(DeploymentOptions.do_nothing, 1, 1, 0)])
+    assert flags.tolist() == [FLAG_UNKNOWN]
+    assert not FLAG_UNKNOWN & FLAG_IS_VALID
+
+    monkeypatch.setattr(framework, "_fact_table", partial_fact_table)
+    bgd = StaticBlueGreenStageDeployment("a", None, None)
+    assert bgd.should_create_bgs_resource(
+        DeploymentOptions.do_nothing, DeploymentEnvNames.active) is True
+    bgd = StaticBlueGreenStageDeployment("a", "b", None)
+    for env_name in DeploymentEnvNames.Values():
+        with pytest.raises(KeyError):
+            bgd.should_create_bgs_resource(DeploymentOptions.do_nothing, env_name)
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+import pytest
+
+from bgs_deploy.hashing import (
+    hash_file, hash_file_cached, hash_files, HashManifest, main,
+)
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+@pytest.mark.parametrize("algorithm", ["md5", "sha256"])
+def test_hash_file(tmpdir, algorithm):
+    data = os.urandom(100000)
+    path = write(str(tmpdir.join("a.zip")), data)
+    expected = hashlib.new(algorithm, data).hexdigest()
+    assert hash_file(path, algorithm=algorithm, chunk_size=4096) == expected
+    # mmap
+    assert hash_file(path, algorithm=algorithm, chunk_size=4096, mmap_threshold=1) == expected
+
+    empty = write(str(tmpdir.join("empty.zip")), b"")
+    assert hash_file(empty, algorithm=algorithm, mmap_threshold=0) \
+           == hashlib.new(algorithm, b"").hexdigest()
+
+    with pytest.raises(ValueError):
+        hash_file(path, algorithm="sha1")
+
+
+def test_hash_files_with_manifest(tmpdir):
+    paths = [
+        write(str(tmpdir.join("{}.zip".format(i))), "content {}".format(i).encode("utf-8"))
+        for i in range(5)
+    ]
+    path_manifest = str(tmpdir.join("manifest.json"))
+
+    manifest = HashManifest(path=path_manifest)
+    digests = hash_files(paths, manifest=manifest, max_workers=3)
+    assert list(digests) == paths
+    assert digests[paths[2]] == hashlib.md5(b"content 2").hexdigest()
+    assert (manifest.hits, manifest.misses) == (0, 5)
+    manifest.save()
+
+    # a new manifest loads the saved one, unchanged files are not read
+    manifest = HashManifest(path=path_manifest)
+    assert hash_files(paths, manifest=manifest) == digests
+    assert (manifest.hits, manifest.misses) == (5, 0)
+
+    # size changed
+    write(paths[0], b"new content 0")
+    assert hash_file_cached(paths[0], manifest=manifest) == hashlib.md5(b"new content 0").hexdigest()
+    assert manifest.misses == 1
+
+    # another algorithm of the same file
+    assert hash_file_cached(paths[1], algorithm="sha256", manifest=manifest) \
+           == hashlib.sha256(b"content 1").hexdigest()
+    assert hash_file_cached(paths[1], algorithm="md5", manifest=manifest) == digests[paths[1]]
+
+
+def test_main(tmpdir, capsys):
+    path_a = write(str(tmpdir.join("a.zip")), b"a")
+    path_b = write(str(tmpdir.join("b.zip")), b"b")
+    main([path_a, path_b, "--algorithm", "sha256"])
+    assert capsys.readouterr().out.split() == [
+        hashlib.sha256(b"a").hexdigest(), hashlib.sha256(b"b").hexdigest(),
+    ]
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
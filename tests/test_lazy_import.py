@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+dir_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+code = """
+import json, sys
+import bgs_deploy.devops.boto_ses
+import bgs_deploy.devops.config_init
+import bgs_deploy.cf.ecs_example
+import bgs_deploy.cf.lambda_example
+import bgs_deploy.framework
+print(json.dumps({
+    "modules": sorted(sys.modules),
+    "config_loaded": bgs_deploy.devops.config_init._config is not None,
+    "boto_ses_created": bgs_deploy.devops.boto_ses._boto_ses is not None,
+    "fact_table_loaded": bgs_deploy.framework._fact_table is not None,
+}))
+"""
+
+
+def test_no_import_time_side_effect():
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], cwd=dir_project_root)
+    data = json.loads(output.decode("utf-8"))
+    for module_name in ["boto3", "botocore", "troposphere_mate", "configirl"]:
+        assert module_name not in data["modules"]
+    assert data["config_loaded"] is False
+    assert data["boto_ses_created"] is False
+    assert data["fact_table_loaded"] is False
+
+
+if __name__ == "__main__":
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import zipfile
+
+import pytest
+
+from bgs_deploy.devops.lbd_package import (
+    PackageSource, LambdaPackageBuilder, get_source_builder,
+)
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_source_dir(dir_path):
+    write(os.path.join(dir_path, "mypkg", "__init__.py"), b"")
+    write(os.path.join(dir_path, "mypkg", "handlers", "hello.py"), b"def handler(event, context): pass\n" * 50)
+    write(os.path.join(dir_path, "mypkg", "data.bin"), os.urandom(1000))
+    write(os.path.join(dir_path, "mypkg", "__pycache__", "hello.cpython-38.pyc"), b"bytecode")
+    write(os.path.join(dir_path, "mypkg", "handlers", "hello.pyc"), b"bytecode")
+    write(os.path.join(dir_path, "requirements.txt"), b"attrs_mate\n")
+
+
+def make_builder(tmpdir, **kwargs):
+    dir_src = str(tmpdir.join("src"))
+    return LambdaPackageBuilder(
+        output_path=str(tmpdir.join("build", "source.zip")),
+        sources=[PackageSource(dir_path=os.path.join(dir_src, "mypkg"), arc_prefix="mypkg"), ],
+        requirements=[os.path.join(dir_src, "requirements.txt"), ],
+        **kwargs
+    )
+
+
+def test_build_is_incremental(tmpdir):
+    make_source_dir(str(tmpdir.join("src")))
+    builder = make_builder(tmpdir)
+
+    result = builder.build()
+    assert result.rebuilt is True
+    assert result.n_files == 3
+    with zipfile.ZipFile(builder.output_path) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == [
+            "mypkg/__init__.py",
+            "mypkg/data.bin",
+            "mypkg/handlers/hello.py",
+        ]
+        assert zf.read("mypkg/handlers/hello.py") == b"def handler(event, context): pass\n" * 50
+        assert all(info.date_time == (1980, 1, 1, 0, 0, 0) for info in zf.infolist())
+
+    # nothing changed
+    assert builder.build().rebuilt is False
+    assert builder.build(force=True).rebuilt is True
+
+    # requirements changed
+    write(str(tmpdir.join("src", "requirements.txt")), b"attrs_mate\njinja2\n")
+    assert builder.build().rebuilt is True
+    assert builder.build().rebuilt is False
+
+    # source changed
+    write(str(tmpdir.join("src", "mypkg", "__init__.py")), b"__version__ = '0.0.1'\n")
+    assert builder.build().rebuilt is True
+
+
+def test_build_is_reproducible(tmpdir):
+    make_source_dir(str(tmpdir.join("src")))
+    builder = make_builder(tmpdir, max_workers=3)
+    builder.build()
+    with open(builder.output_path, "rb") as f:
+        content = f.read()
+
+    # same content, new mtime
+    time.sleep(0.01)
+    path = str(tmpdir.join("src", "mypkg", "data.bin"))
+    with open(path, "rb") as f:
+        data = f.read()
+    write(path, data)
+
+    result = builder.build(force=True)
+    with open(builder.output_path, "rb") as f:
+        assert f.read() == content
+    assert result.size == len(content)
+
+
+def test_duplicate_entries(tmpdir):
+    make_source_dir(str(tmpdir.join("src")))
+    dir_path = str(tmpdir.join("src", "mypkg"))
+    builder = LambdaPackageBuilder(
+        output_path=str(tmpdir.join("build", "source.zip")),
+        sources=[PackageSource(dir_path=dir_path), PackageSource(dir_path=dir_path)],
+    )
+    with pytest.raises(ValueError):
+        builder.build()
+
+
+def test_get_source_builder(tmpdir):
+    builder = get_source_builder(str(tmpdir.join("source.zip")))
+    arcnames = [arcname for _, arcname in builder.collect_files()]
+    assert "bgs_deploy/devops/lbd_package.py" in arcnames
+    assert not [arcname for arcname in arcnames if arcname.endswith(".pyc")]
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from bgs_deploy.ledger import DeploymentLedger, reduce_tf_state
+from helpers import BUCKET as bucket, make_service_resources
+
+key = "terraform.tfstate"
+
+
+@pytest.fixture
+def versioned_s3_client(s3_client):
+    s3_client.put_bucket_versioning(
+        Bucket=bucket, VersioningConfiguration={"Status": "Enabled"})
+    return s3_client
+
+
+def put_state(s3_client, logic_ids, stages):
+    tf_state_data = {"resources": make_service_resources("helpdesk", logic_ids, stages)}
+    return s3_client.put_object(
+        Bucket=bucket, Key=key, Body=json.dumps(tf_state_data))["VersionId"]
+
+
+def test_reduce_tf_state():
+    resources = make_service_resources("helpdesk", "ab", {"active": "b", "inactive": "a"}) \
+                + make_service_resources("billing", "c", {"staging": "c"})
+    result = reduce_tf_state({"resources": resources})
+    assert sorted(result) == ["billing", "helpdesk"]
+    assert result["helpdesk"]["blue_green_stage"]["active"]["logic_id"] == "b"
+    assert result["billing"]["logic_id"]["c"]["docker_image_digest"] == "c" * 64
+
+
+def test_deployment_ledger(versioned_s3_client, tmpdir):
+    s3_client = versioned_s3_client
+    put_state(s3_client, "a", {"staging": "a"})
+    put_state(s3_client, "a", {"active": "a"})
+    put_state(s3_client, "ab", {"active": "a", "staging": "b"})
+    v4 = put_state(s3_client, "ab", {"active": "b", "inactive": "a"})
+
+    db_path = str(tmpdir.join("ledger.sqlite"))
+    ledger = DeploymentLedger(db_path, bucket=bucket, key=key)
+    result = ledger.sync(s3_client, max_workers=3)
+    assert (result.n_versions, result.n_fetched, result.errors) == (4, 4, {})
+
+    # only new versions are fetched
+    assert ledger.sync(s3_client).n_fetched == 0
+    put_state(s3_client, "abc", {"active": "b", "inactive": "a", "staging": "c"})
+    ledger.close()
+    ledger = DeploymentLedger(db_path, bucket=bucket, key=key)
+    result = ledger.sync(s3_client)
+    assert (result.n_versions, result.n_fetched) == (5, 1)
+
+    digests = [row["docker_image_digest"] for row in ledger.get_digest_history("helpdesk")]
+    assert digests == ["c" * 64, "b" * 64, "a" * 64]
+    assert len(ledger.get_digest_history("helpdesk", limit=2)) == 2
+    assert ledger.get_digest_history("unknown") == []
+
+    assert ledger.find_task_definition_arn("helpdesk", "b" * 64) \
+           == "arn:aws:ecs:us-east-1:111122223333:task-definition/helpdesk_b:2"
+    assert ledger.find_task_definition_arn("helpdesk", "f" * 64) is None
+
+    active_history = ledger.get_stage_history("helpdesk", "active")
+    assert [row["logic_id"] for row in active_history] == ["b", "a"]
+    assert active_history[0]["docker_image_digest"] == "b" * 64
+
+    state_data = ledger.get_blue_green_state_data("helpdesk", v4)
+    assert state_data["blue_green_stage"]["active"]["logic_id"] == "b"
+    assert state_data["blue_green_stage"]["staging"]["logic_id"] is None
+    assert state_data["logic_id"]["a"]["docker_image_digest"] == "a" * 64
+    assert state_data["logic_id"]["c"]["docker_image_digest"] is None
+
+    # one ledger per state file
+    ledger.close()
+    with pytest.raises(ValueError):
+        _ = DeploymentLedger(db_path, bucket=bucket, key="other.tfstate").connection
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.plan import DeploymentPlan
+from bgs_deploy.synthetic_tf_state import generate_tf_state, get_service_name, make_digest
+from bgs_deploy.tf_state import TfStateIndex
+from helpers import tf_state_data
+
+DeploymentOptions = BlueGreenECSDeployment.DeploymentOptions
+
+n_services = 30
+tf_state_index = TfStateIndex.from_tf_state_data(generate_tf_state(n_services, seed=1))
+
+
+def iter_deployments():
+    for i in range(n_services):
+        service_name = get_service_name(i)
+        for deployment_option in DeploymentOptions.Values():
+            kwargs = dict()
+            if deployment_option == DeploymentOptions.deploy_to_staging:
+                kwargs["docker_image_digest"] = make_digest("new", service_name)
+            try:
+                yield BlueGreenECSDeployment(
+                    None, "bucket", "key",
+                    service_name=service_name,
+                    deployment_option=deployment_option,
+                    tf_state_index=tf_state_index,
+                    **kwargs
+                )
+            except ValueError:
+                pass
+
+
+def test_compute_plan_matches_methods():
+    n_deployments = 0
+    for deployment in iter_deployments():
+        n_deployments += 1
+        plan = deployment.compute_plan()
+        for logic_id in deployment.DeploymentLogicIds.Values():
+            for parameter_name in deployment.DeploymentParameters.Values():
+                assert plan.get_config_value(logic_id, parameter_name) \
+                       == deployment.get_future_logic_id_specified_config_value(
+                    logic_id, parameter_name)
+            assert plan.should_create_logic_id[logic_id] \
+                   is deployment.should_create_logic_id_specified_resource(logic_id)
+        for blue_green_stage in deployment.DeploymentStages.Values():
+            assert plan.get_logic_id(blue_green_stage) \
+                   == deployment.get_future_blue_green_stage_specified_logic_id(
+                blue_green_stage)
+            assert plan.should_create_blue_green_stage[blue_green_stage] \
+                   is bool(deployment.should_create_blue_green_stage_specified_resource(
+                blue_green_stage))
+    assert n_deployments > n_services
+
+
+def test_deployment_plan_to_tfvars():
+    deployment = next(
+        deployment for deployment in iter_deployments()
+        if deployment.deployment_option == DeploymentOptions.deploy_to_staging
+    )
+    plan = deployment.compute_plan()
+    tfvars = plan.to_tfvars()
+    staging_logic_id = plan.get_logic_id("staging")
+    prefix = "{}_logic_{}".format(deployment.service_name, staging_logic_id)
+    assert tfvars[prefix + "_docker_image_digest"] == deployment.docker_image_digest
+    assert tfvars[prefix + "_should_create"] is True
+    assert tfvars["{}_staging_logic_id".format(deployment.service_name)] == staging_logic_id
+    assert tfvars["{}_staging_should_create".format(deployment.service_name)] is True
+    assert len(tfvars) == 3 * (3 + 1) + 3 * 2
+    assert json.loads(plan.to_tfvars_json()) == tfvars
+
+
+def test_deployment_plan_immutable():
+    plan = next(iter_deployments()).compute_plan()
+    with pytest.raises(AttributeError):
+        plan.service_name = "other"
+    with pytest.raises(AttributeError):
+        plan.new_attribute = 1
+    with pytest.raises(TypeError):
+        plan.blue_green_stage_logic_id["active"] = "a"
+    with pytest.raises(TypeError):
+        plan.logic_id_config_values["a"]["docker_image_digest"] = "a" * 64
+    assert not hasattr(plan, "__dict__")
+    assert plan == next(iter_deployments()).compute_plan()
+    assert isinstance(hash(plan), int)
+    assert isinstance(plan, DeploymentPlan)
+
+
+def test_reuse_task_definition():
+    index = TfStateIndex.from_tf_state_data(tf_state_data)
+
+    def make_deployment(service_name, docker_image_digest, **kwargs):
+        return BlueGreenECSDeployment(
+            None, "bucket", "key",
+            service_name=service_name,
+            deployment_option=DeploymentOptions.deploy_to_staging,
+            docker_image_digest=docker_image_digest,
+            tf_state_index=index,
+            **kwargs
+        )
+
+    # helpdesk: active is b, inactive is a, staging goes to c
+    deployment = make_deployment("helpdesk", "b" * 64)
+    plan = deployment.compute_plan()
+    arn = deployment.logic_b_task_definition_arn
+    assert plan.reused_task_definition == {"logic_id": "b", "task_definition_arn": arn}
+    assert plan.to_dict()["reused_task_definition"] == {"logic_id": "b", "task_definition_arn": arn}
+    # the digest is kept, only the task definition is not registered again
+    assert plan.get_config_value("c", "docker_image_digest") == "b" * 64
+    assert plan.to_tfvars()["helpdesk_logic_c_docker_image_digest"] == "b" * 64
+    assert plan.get_config_value("c", "task_definition_arn") == arn
+    assert plan.get_config_value("c", "task_definition_arg") == arn
+    assert plan.should_create_logic_id["c"] is True
+    assert deployment.get_future_logic_id_specified_config_value("c", "task_definition_arn") == arn
+    assert deployment.get_future_logic_id_specified_config_value("c", "docker_image_digest") \
+           == "b" * 64
+
+    # inactive a is never reused, it becomes the next staging logic id
+    # after deploy_to_active and is destroyed, its task definition with it
+    plan = make_deployment("helpdesk", "a" * 64).compute_plan()
+    assert plan.reused_task_definition is None
+    assert plan.get_config_value("c", "docker_image_digest") == "a" * 64
+    assert plan.get_config_value("c", "task_definition_arg") \
+           == "${aws_ecs_task_definition.helpdesk_c.arn}"
+
+    # new digest
+    plan = make_deployment("helpdesk", "f" * 64).compute_plan()
+    assert plan.reused_task_definition is None
+    assert plan.get_config_value("c", "docker_image_digest") == "f" * 64
+
+    # disabled
+    plan = make_deployment("helpdesk", "b" * 64, reuse_task_definition=False).compute_plan()
+    assert plan.reused_task_definition is None
+    assert plan.get_config_value("c", "docker_image_digest") == "b" * 64
+    assert plan.get_config_value("c", "task_definition_arg") \
+           == "${aws_ecs_task_definition.helpdesk_c.arn}"
+
+    # billing: only staging c runs this digest, it is not active
+    plan = make_deployment("billing", "c" * 64).compute_plan()
+    assert plan.reused_task_definition is None
+
+
+def apply_plan(tf_state_index, plan):
+    """
+    Do what terraform does with the plan, return the new terraform state.
+    """
+    service_name = plan.service_name
+    current = {
+        (resource["type"], resource["name"]): resource
+        for resource in tf_state_index.get_resources(service_name)
+    }
+    resources = list()
+    for logic_id, should_create in sorted(plan.should_create_logic_id.items()):
+        if not should_create:
+            continue
+        name = "{}_{}".format(service_name, logic_id)
+        task_definition_arg = plan.get_config_value(logic_id, "task_definition_arg")
+        task_definition = current.get(("aws_ecs_task_definition", name))
+        if task_definition is None \
+                and task_definition_arg == "${{aws_ecs_task_definition.{}.arn}}".format(name):
+            task_definition = {
+                "type": "aws_ecs_task_definition",
+                "name": name,
+                "instances": [{"attributes": {
+                    "arn": "arn:aws:ecs:us-east-1:111122223333:task-definition/{}:9".format(name),
+                    "container_definitions": json.dumps([{
+                        "image": "app@sha256:" + plan.get_config_value(logic_id, "docker_image_digest"),
+                    }]),
+                }}],
+            }
+        if task_definition is not None:
+            resources.append(task_definition)
+            if task_definition_arg.startswith("${"):
+                task_definition_arg = task_definition["instances"][0]["attributes"]["arn"]
+        resources.append({
+            "type": "aws_ecs_service",
+            "name": name,
+            "instances": [{"attributes": {"task_definition": task_definition_arg}}],
+        })
+    for stage, should_create in sorted(plan.should_create_blue_green_stage.items()):
+        if should_create:
+            resources.append({
+                "type": "aws_lb_listener",
+                "name": "{}_{}".format(service_name, stage),
+                "instances": [{"attributes": {}, "depends_on": [
+                    "aws_lb_target_group.{}_{}".format(service_name, plan.get_logic_id(stage)),
+                ]}],
+            })
+    return {"resources": resources}
+
+
+def test_reuse_task_definition_round_trip():
+    index = TfStateIndex.from_tf_state_data(tf_state_data)
+
+    def make_deployment(index, deployment_option, docker_image_digest=None):
+        return BlueGreenECSDeployment(
+            None, "bucket", "key",
+            service_name="helpdesk",
+            deployment_option=deployment_option,
+            docker_image_digest=docker_image_digest,
+            tf_state_index=index,
+        )
+
+    # helpdesk: active is b, inactive is a, staging c reuses b
+    deployment = make_deployment(index, DeploymentOptions.deploy_to_staging, "b" * 64)
+    plan = deployment.compute_plan()
+    arn_b = deployment.logic_b_task_definition_arn
+    assert plan.reused_task_definition["task_definition_arn"] == arn_b
+    addresses = deployment.get_tf_target_addresses(plan)
+    assert "aws_ecs_task_definition.helpdesk_c" not in addresses
+    assert "aws_ecs_service.helpdesk_c" in addresses
+
+    index = TfStateIndex.from_tf_state_data(apply_plan(index, plan))
+    deployment = make_deployment(index, DeploymentOptions.do_nothing)
+    config_values = deployment.blue_green_state_data["logic_id"]["c"]
+    assert config_values["docker_image_digest"] == "b" * 64
+    assert config_values["task_definition_arn"] == arn_b
+    assert config_values["task_definition_arg"] == arn_b
+    assert deployment.blue_green_state_data["blue_green_stage"]["staging"]["logic_id"] == "c"
+    # the state matches the plan, nothing left to apply
+    assert deployment.get_tf_target_addresses() == []
+    for parameter_name in deployment.DeploymentParameters.Values():
+        assert config_values[parameter_name] == plan.get_config_value("c", parameter_name)
+
+    # c becomes active, the same digest is reused from c
+    plan = make_deployment(index, DeploymentOptions.deploy_to_active).compute_plan()
+    index = TfStateIndex.from_tf_state_data(apply_plan(index, plan))
+    deployment = make_deployment(index, DeploymentOptions.deploy_to_staging, "b" * 64)
+    assert deployment.active_logic_id == "c"
+    plan = deployment.compute_plan()
+    assert plan.reused_task_definition == {"logic_id": "c", "task_definition_arn": arn_b}
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
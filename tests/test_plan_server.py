@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from bgs_deploy.plan_server import MAX_BODY_SIZE, PlanService, LatencyStats, make_server
+from helpers import FakeBotoSession, FakeClientError, FakeS3Client, deployment_list
+
+
+@pytest.fixture
+def server():
+    FakeS3Client.n_get_object = 0
+    service = PlanService(FakeBotoSession(), "bucket", "terraform.tfstate", ttl=60)
+    service.warm()
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def call(server, method, path, data=None):
+    url = "http://{}:{}{}".format(*server.server_address[:2], path)
+    body = None if data is None else json.dumps(data).encode("utf-8")
+    request = Request(url, data=body, method=method)
+    try:
+        with urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_latency_stats():
+    stats = LatencyStats(window=10)
+    assert stats.to_dict() == {"count": 0, "errors": 0}
+    for i in range(20):
+        stats.record(i, error=(i == 0))
+    data = stats.to_dict()
+    assert (data["count"], data["errors"], data["max"]) == (20, 1, 19)
+    assert data["p50"] == 15
+
+
+def test_record_concurrently():
+    service = PlanService(None, "bucket", "terraform.tfstate")
+    n_threads, n_records = 8, 500
+    barrier = threading.Barrier(n_threads)
+
+    def record(i):
+        barrier.wait()
+        for _ in range(n_records):
+            service.record("POST /plan", 0.001)
+            service.record("GET /endpoint-{}".format(i % 2), 0.001)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        list(executor.map(record, range(n_threads)))
+    requests = service.get_metrics()["requests"]
+    assert requests["POST /plan"]["count"] == n_threads * n_records
+    assert requests["GET /endpoint-0"]["count"] == n_threads * n_records // 2
+
+
+def test_oversized_body_closes_connection(server):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        # announce a body larger than allowed but never send it
+        connection.putrequest("POST", "/plan")
+        connection.putheader("Content-Length", str(MAX_BODY_SIZE + 1))
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 400
+        assert "larger than" in json.loads(response.read())["error"]
+        assert response.getheader("Connection") == "close"
+        assert response.will_close
+    finally:
+        connection.close()
+    assert call(server, "GET", "/health") == (200, {"status": "ok"})
+
+
+def test_plan_server(server):
+    assert call(server, "GET", "/health") == (200, {"status": "ok"})
+    assert FakeS3Client.n_get_object == 1  # loaded by warm()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(
+            lambda _: call(server, "POST", "/plan", {"deployments": deployment_list}),
+            range(16),
+        ))
+    for status, data in responses:
+        assert status == 200
+        assert [result["service_name"] for result in data["results"]] \
+               == [kwargs["service_name"] for kwargs in deployment_list]
+        assert data["results"] == responses[0][1]["results"]
+    results = responses[0][1]["results"]
+    assert results[0]["plan"]["blue_green_stage"]["staging"]["logic_id"] == "c"
+    assert "roll back" in results[3]["error"]
+    assert FakeS3Client.n_get_object == 1  # served from the warm state
+
+    status, data = call(server, "POST", "/plan", [{"service_name": "helpdesk"}])
+    assert status == 400
+    assert "deployment_option" in data["error"]
+    assert call(server, "GET", "/nothing")[0] == 404
+
+    assert call(server, "POST", "/invalidate", {})[0] == 200
+    assert call(server, "POST", "/plan", deployment_list[:1])[0] == 200
+    assert FakeS3Client.n_get_object == 2
+
+    status, metrics = call(server, "GET", "/metrics")
+    assert status == 200
+    assert metrics["requests"]["POST /plan"]["count"] == 18
+    assert metrics["requests"]["POST /plan"]["errors"] == 1
+    assert metrics["requests"]["POST /plan"]["p99"] >= metrics["requests"]["POST /plan"]["p50"]
+    assert metrics["cache"]["misses"] >= 2
+
+
+class ErrorS3Client(object):
+    def __init__(self, code):
+        self.code = code
+
+    def get_object(self, Bucket, Key):
+        raise FakeClientError(self.code, "get_object failed")
+
+
+class ErrorBotoSession(object):
+    def __init__(self, code):
+        self.code = code
+
+    def client(self, service_name):
+        return ErrorS3Client(self.code)
+
+
+@pytest.mark.parametrize("code,expected_status", [("AccessDenied", 500), ("NoSuchKey", 200)])
+def test_plan_tf_state_error(code, expected_status):
+    service = PlanService(ErrorBotoSession(code), "bucket", "terraform.tfstate")
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        status, data = call(server, "POST", "/plan", deployment_list[:1])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert status == expected_status
+    if code == "NoSuchKey":
+        # nothing deployed yet, staging goes to the first logic id
+        assert data["results"][0]["plan"]["blue_green_stage"]["staging"]["logic_id"] == "a"
+    else:
+        assert "get_object failed" in data["error"]
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.fleet import BlueGreenECSFleet
+from bgs_deploy.rollout import (
+    RolloutStatus, ServiceRollout, RolloutScheduler, build_waves,
+)
+from bgs_deploy.synthetic_tf_state import generate_tf_state, get_service_name, make_digest
+
+DeploymentOptions = BlueGreenECSDeployment.DeploymentOptions
+
+n_services = 6
+tf_state_body = json.dumps(generate_tf_state(n_services, seed=3)).encode("utf-8")
+
+
+class FakeS3Client(object):
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(tf_state_body)}
+
+
+class FakeBotoSession(object):
+    def client(self, service_name):
+        return FakeS3Client()
+
+
+class FakeApplyRunner(object):
+    """
+    Record apply calls, sleep ``delay`` seconds, fail services in ``fail``,
+    block services in ``hang`` until cancelled, and block services in
+    ``block`` for ``block_seconds`` ignoring the cancel event.
+    """
+
+    def __init__(self, delay=0.02, fail=(), hang=(), block=(), block_seconds=3):
+        self.delay = delay
+        self.fail = set(fail)
+        self.hang = set(hang)
+        self.block = set(block)
+        self.block_seconds = block_seconds
+        self.lock = threading.Lock()
+        self.started = dict()
+        self.finished = dict()
+        self.cancelled = set()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, deployment, plan, cancel_event):
+        service_name = deployment.service_name
+        with self.lock:
+            self.started[service_name] = time.monotonic()
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            if service_name in self.hang:
+                if cancel_event.wait(5):
+                    with self.lock:
+                        self.cancelled.add(service_name)
+                raise RuntimeError("cancelled")
+            if service_name in self.block:
+                time.sleep(self.block_seconds)
+            time.sleep(self.delay)
+            if service_name in self.fail:
+                raise RuntimeError("apply failed")
+            return deployment.get_tf_target_addresses(plan)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.finished[service_name] = time.monotonic()
+
+
+def make_rollouts(depends_on=None):
+    depends_on = depends_on or dict()
+    return [
+        ServiceRollout(
+            service_name=get_service_name(i),
+            deployment_option=DeploymentOptions.deploy_to_staging,
+            docker_image_digest=make_digest("new", i),
+            depends_on=depends_on.get(get_service_name(i), []),
+        )
+        for i in range(n_services)
+    ]
+
+
+def make_scheduler(apply_func, **kwargs):
+    fleet = BlueGreenECSFleet(FakeBotoSession(), "bucket", "terraform.tfstate")
+    return RolloutScheduler(fleet=fleet, apply_func=apply_func, **kwargs)
+
+
+def test_build_waves():
+    rollouts = make_rollouts(depends_on={
+        "service0": ["service1"],
+        "service2": ["service0", "service1"],
+        "service4": ["service2"],
+    })
+    assert build_waves(rollouts) == [
+        ["service1", "service3", "service5"],
+        ["service0"],
+        ["service2"],
+        ["service4"],
+    ]
+
+    with pytest.raises(ValueError) as e:
+        build_waves(make_rollouts(depends_on={
+            "service0": ["service2"],
+            "service1": ["service0"],
+            "service2": ["service1"],
+        }))
+    assert "cycle" in str(e.value)
+
+    with pytest.raises(ValueError):
+        build_waves(make_rollouts(depends_on={"service0": ["unknown"]}))
+
+    with pytest.raises(ValueError):
+        build_waves(make_rollouts() + make_rollouts())
+
+
+def test_run():
+    depends_on = {"service0": ["service1"], "service2": ["service0"]}
+    runner = FakeApplyRunner()
+    results = make_scheduler(runner, max_workers=2).run(make_rollouts(depends_on))
+    assert [result.service_name for result in results] \
+           == [get_service_name(i) for i in range(n_services)]
+    for result in results:
+        assert result.status == RolloutStatus.succeeded
+        assert result.plan.get_config_value(
+            result.plan.get_logic_id("staging"), "docker_image_digest",
+        ) == make_digest("new", int(result.service_name[len("service"):]))
+        assert "aws_ecs_task_definition.{}_{}".format(
+            result.service_name, result.plan.get_logic_id("staging"),
+        ) in result.apply_result
+    assert runner.max_running <= 2
+    for service_name, dependencies in depends_on.items():
+        for dependency in dependencies:
+            assert runner.started[service_name] >= runner.finished[dependency]
+
+
+def test_run_fail_fast():
+    depends_on = {"service1": ["service0"], "service2": ["service1"]}
+    runner = FakeApplyRunner(fail=["service0"], hang=["service3"])
+    results = make_scheduler(runner, max_workers=n_services).run(make_rollouts(depends_on))
+    statuses = {result.service_name: result.status for result in results}
+    assert statuses["service0"] == RolloutStatus.failed
+    assert isinstance(results[0].error, RuntimeError)
+    assert statuses["service1"] == RolloutStatus.cancelled
+    assert statuses["service2"] == RolloutStatus.cancelled
+    # hanging apply received the cancel event
+    assert statuses["service3"] == RolloutStatus.failed
+
+
+def test_run_no_fail_fast():
+    depends_on = {"service1": ["service0"], "service2": ["service1"]}
+    runner = FakeApplyRunner(fail=["service0"])
+    results = make_scheduler(runner, fail_fast=False).run(make_rollouts(depends_on))
+    statuses = {result.service_name: result.status for result in results}
+    assert statuses == {
+        "service0": RolloutStatus.failed,
+        "service1": RolloutStatus.skipped,
+        "service2": RolloutStatus.skipped,
+        "service3": RolloutStatus.succeeded,
+        "service4": RolloutStatus.succeeded,
+        "service5": RolloutStatus.succeeded,
+    }
+
+
+def test_run_timeout():
+    runner = FakeApplyRunner(hang=["service2"])
+    start = time.monotonic()
+    results = make_scheduler(runner, timeout=0.2, fail_fast=False).run(make_rollouts())
+    assert time.monotonic() - start < 2
+    statuses = {result.service_name: result.status for result in results}
+    assert statuses["service2"] == RolloutStatus.timeout
+    assert isinstance(results[2].error, TimeoutError)
+    assert [
+               status for service_name, status in statuses.items()
+               if service_name != "service2"
+           ] == [RolloutStatus.succeeded] * (n_services - 1)
+    # the timed out apply got its own cancel signal, without fail fast, the
+    # abandoned worker finishes in the background
+    deadline = time.monotonic() + 1
+    while "service2" not in runner.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert runner.cancelled == {"service2"}
+
+
+def test_run_timeout_blocking_apply():
+    # service0 ignores the cancel event, its worker is abandoned and gives
+    # its slot to the queued services, their timeout starts when they start
+    runner = FakeApplyRunner(delay=0.1, block=["service0"], block_seconds=3)
+    start = time.monotonic()
+    results = make_scheduler(
+        runner, max_workers=1, timeout=0.2, fail_fast=False,
+    ).run(make_rollouts())
+    assert time.monotonic() - start < 2
+    statuses = [result.status for result in results]
+    assert statuses == [RolloutStatus.timeout] + [RolloutStatus.succeeded] * (n_services - 1)
+    assert results[0].elapsed < 1
+    assert "service0" not in runner.finished
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenDeployment
+from bgs_deploy.s3_disk_cache import S3DiskCache
+from helpers import BUCKET as bucket
+
+
+def test_s3_disk_cache(boto_ses, tmpdir):
+    s3_client = boto_ses.client("s3")
+    s3_client.put_object(Bucket=bucket, Key="k1", Body=b"v1")
+
+    cache = S3DiskCache(cache_dir=str(tmpdir))
+    assert cache.get_object_body(s3_client, bucket, "k1") == b"v1"
+    assert cache.get_object_body(s3_client, bucket, "k1") == b"v1"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.bytes_saved == 2
+
+    # a new instance reads the persisted index
+    cache = S3DiskCache(cache_dir=str(tmpdir))
+    assert cache.get_object_body(s3_client, bucket, "k1") == b"v1"
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    # etag changed
+    s3_client.put_object(Bucket=bucket, Key="k1", Body=b"v1-new")
+    assert cache.get_object_body(s3_client, bucket, "k1") == b"v1-new"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # object deleted
+    s3_client.delete_object(Bucket=bucket, Key="k1")
+    with pytest.raises(Exception):
+        cache.get_object_body(s3_client, bucket, "k1")
+
+
+def test_s3_disk_cache_lru_eviction(boto_ses, tmpdir):
+    s3_client = boto_ses.client("s3")
+    for key in ["k1", "k2", "k3", "huge"]:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=b"x" * (100 if key == "huge" else 10))
+
+    cache = S3DiskCache(cache_dir=str(tmpdir), max_size=25)
+    cache.get_object_body(s3_client, bucket, "k1")
+    cache.get_object_body(s3_client, bucket, "k2")
+    cache.get_object_body(s3_client, bucket, "k1")  # k2 is the least recently used
+    cache.get_object_body(s3_client, bucket, "k3")
+    cached_keys = sorted(entry["key"] for entry in cache.index.values())
+    assert cached_keys == ["k1", "k3"]
+
+    assert cache.get_object_body(s3_client, bucket, "huge") == b"x" * 100
+    assert "huge" not in [entry["key"] for entry in cache.index.values()]
+
+
+def test_s3_disk_cache_shared_dir(boto_ses, tmpdir):
+    # two instances on one dir, like two CI jobs on one runner
+    s3_client = boto_ses.client("s3")
+    s3_client.put_object(Bucket=bucket, Key="k1", Body=b"v1")
+    s3_client.put_object(Bucket=bucket, Key="k2", Body=b"v2")
+
+    cache1 = S3DiskCache(cache_dir=str(tmpdir))
+    cache2 = S3DiskCache(cache_dir=str(tmpdir))
+    assert cache2.index == {}
+    cache1.get_object_body(s3_client, bucket, "k1")
+    cache2.get_object_body(s3_client, bucket, "k2")
+    # cache2 didn't overwrite the entry added by cache1
+    assert sorted(entry["key"] for entry in S3DiskCache(cache_dir=str(tmpdir)).index.values()) \
+           == ["k1", "k2"]
+    assert cache2.get_object_body(s3_client, bucket, "k1") == b"v1"
+    assert cache2.hits == 1
+
+    # invalidated by the other instance, downloaded again
+    cache1.invalidate(bucket, "k2")
+    assert cache2.get_object_body(s3_client, bucket, "k2") == b"v2"
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith(".tmp")]
+
+
+def test_blue_green_deployment_with_cache(boto_ses, tmpdir):
+    s3_client = boto_ses.client("s3")
+    s3_client.put_object(
+        Bucket=bucket, Key="terraform.tfstate",
+        Body=json.dumps({"version": 4, "resources": [{"type": "aws_s3_bucket"}]}),
+    )
+    cache = S3DiskCache(cache_dir=str(tmpdir))
+    for tf_state_stream in [False, True]:
+        bg = BlueGreenDeployment(
+            boto_ses, bucket, "terraform.tfstate",
+            tf_state_stream=tf_state_stream,
+            tf_state_cache=cache,
+        )
+        assert bg.tf_state_data["resources"] == [{"type": "aws_s3_bucket"}]
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 1
+
+    bg = BlueGreenDeployment(
+        boto_ses, bucket, "not-exists.tfstate", tf_state_cache=cache)
+    assert bg.tf_state_data == {"resources": []}
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+import pytest
+
+from bgs_deploy.s3_upload import (
+    CONTENT_HASH_METADATA_KEY, MB, get_part_size, upload_file,
+)
+from helpers import BUCKET as bucket
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_get_part_size():
+    assert get_part_size(100 * MB, 1 * MB) == 5 * MB
+    assert get_part_size(100 * MB, 8 * MB) == 8 * MB
+    assert get_part_size(100000 * MB, 8 * MB) == 16 * MB
+
+
+def test_upload_file(s3_client, tmpdir):
+    path = write(str(tmpdir.join("source.zip")), b"source code v1")
+    result = upload_file(s3_client, path, bucket, "source.zip")
+    assert (result.skipped, result.bytes_uploaded, result.n_parts) == (False, 14, 0)
+    response = s3_client.get_object(Bucket=bucket, Key="source.zip")
+    assert response["Body"].read() == b"source code v1"
+    assert response["Metadata"][CONTENT_HASH_METADATA_KEY] \
+           == hashlib.sha256(b"source code v1").hexdigest()
+
+    result = upload_file(s3_client, path, bucket, "source.zip")
+    assert (result.skipped, result.bytes_uploaded, result.bytes_saved) == (True, 0, 14)
+
+    result = upload_file(s3_client, path, bucket, "source.zip", force=True)
+    assert result.skipped is False
+
+    write(path, b"source code v2")
+    result = upload_file(
+        s3_client, path, bucket, "source.zip", extra_args=dict(Metadata=dict(stage="dev")))
+    assert result.skipped is False
+    response = s3_client.head_object(Bucket=bucket, Key="source.zip")
+    assert response["Metadata"]["stage"] == "dev"
+
+
+def test_multipart_upload(s3_client, tmpdir):
+    data = os.urandom(11 * MB)
+    path = write(str(tmpdir.join("layer.zip")), data)
+    result = upload_file(
+        s3_client, path, bucket, "layer.zip",
+        part_size=5 * MB, max_workers=3, multipart_threshold=5 * MB,
+    )
+    assert (result.skipped, result.n_parts, result.bytes_uploaded) == (False, 3, 11 * MB)
+    response = s3_client.get_object(Bucket=bucket, Key="layer.zip")
+    assert response["Body"].read() == data
+    assert response["Metadata"][CONTENT_HASH_METADATA_KEY] == hashlib.sha256(data).hexdigest()
+    assert s3_client.list_multipart_uploads(Bucket=bucket).get("Uploads", []) == []
+
+    result = upload_file(s3_client, path, bucket, "layer.zip", multipart_threshold=5 * MB)
+    assert (result.skipped, result.bytes_saved) == (True, 11 * MB)
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
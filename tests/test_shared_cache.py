@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.fleet import BlueGreenECSFleet
+from bgs_deploy.shared_cache import SharedCache
+from helpers import FakeBotoSession, FakeS3Client
+
+DeploymentOptions = BlueGreenECSDeployment.DeploymentOptions
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_and_invalidate():
+    clock = FakeClock()
+    cache = SharedCache(ttl=10, clock=clock)
+    n_loads = [0]
+
+    def loader():
+        n_loads[0] += 1
+        return n_loads[0]
+
+    assert cache.get_with_generation("k", loader) == (1, 1)
+    clock.now = 9
+    assert cache.get("k", loader) == 1
+    clock.now = 10
+    assert cache.get_with_generation("k", loader) == (2, 2)
+    cache.invalidate("k")
+    assert cache.get("k", loader) == 3
+    cache.invalidate()
+    assert cache.get("k", loader) == 4
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 4, 1)
+
+
+def test_max_entries():
+    clock = FakeClock()
+    cache = SharedCache(ttl=10, max_entries=2, clock=clock)
+    for i in range(3):
+        clock.now = i
+        cache.get(i, lambda: i)
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(0, lambda: "reloaded") == "reloaded"
+
+
+def test_single_flight():
+    cache = SharedCache(ttl=60)
+    n_loads = [0]
+    started = threading.Event()
+
+    def loader():
+        n_loads[0] += 1
+        started.set()
+        time.sleep(0.2)
+        return "value"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(cache.get, "k", loader)]
+        started.wait()
+        futures.extend(executor.submit(cache.get, "k", loader) for _ in range(7))
+        assert [future.result() for future in futures] == ["value"] * 8
+    assert n_loads[0] == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["in_flight"]) == (1, 7, 0)
+
+
+def test_errors_are_not_cached():
+    cache = SharedCache(ttl=60)
+    started = threading.Event()
+
+    def failing_loader():
+        started.set()
+        time.sleep(0.1)
+        raise IOError("boom")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(cache.get, "k", failing_loader)]
+        started.wait()
+        futures.extend(executor.submit(cache.get, "k", failing_loader) for _ in range(2))
+        for future in futures:
+            with pytest.raises(IOError):
+                future.result()
+    assert cache.stats()["errors"] == 1
+    assert cache.get("k", lambda: "ok") == "ok"
+
+
+def test_invalidate_in_flight():
+    cache = SharedCache(ttl=60)
+    started = threading.Event()
+
+    def loader():
+        started.set()
+        time.sleep(0.1)
+        return "old"
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(cache.get, "k", loader)
+        started.wait()
+        cache.invalidate("k")
+        assert future.result() == "old"
+    assert cache.get("k", lambda: "new") == "new"
+
+
+def test_deployments_share_tf_state():
+    cache = SharedCache(ttl=60)
+    FakeS3Client.n_get_object = 0
+
+    def plan(service_name):
+        deployment = BlueGreenECSDeployment(
+            FakeBotoSession(), "bucket", "key",
+            service_name=service_name,
+            deployment_option=DeploymentOptions.do_nothing,
+            shared_cache=cache,
+        )
+        return deployment.compute_plan()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        plans = list(executor.map(plan, ["helpdesk", "billing", "my_web_app"] * 4))
+    assert FakeS3Client.n_get_object == 1
+    assert plans[0].get_logic_id("active") == "b"
+    assert plans[0] == plans[3]
+    assert cache.stats()["hits"] + cache.stats()["coalesced"] > 0
+
+    # the fleet shares the state and its index
+    fleet = BlueGreenECSFleet(FakeBotoSession(), "bucket", "key", shared_cache=cache)
+    other_fleet = BlueGreenECSFleet(FakeBotoSession(), "bucket", "key", shared_cache=cache)
+    assert fleet.tf_state_index is other_fleet.tf_state_index
+    assert FakeS3Client.n_get_object == 1
+
+    cache.invalidate()
+    fleet = BlueGreenECSFleet(FakeBotoSession(), "bucket", "key", shared_cache=cache)
+    assert fleet.tf_state_index is not other_fleet.tf_state_index
+    assert FakeS3Client.n_get_object == 2
+
+
+def test_cached_blue_green_state_data_is_copied():
+    cache = SharedCache(ttl=60)
+
+    def make_deployment():
+        return BlueGreenECSDeployment(
+            FakeBotoSession(), "bucket", "key",
+            service_name="helpdesk",
+            deployment_option=DeploymentOptions.do_nothing,
+            shared_cache=cache,
+        )
+
+    deployment = make_deployment()
+    state_data = deployment.blue_green_state_data
+    state_data["logic_id"]["a"]["docker_image_digest"] = "f" * 64
+    state_data["blue_green_stage"]["active"]["logic_id"] = "c"
+    # the same instance keeps its own, changed, copy
+    assert deployment.blue_green_state_data is state_data
+
+    other = make_deployment()
+    assert other.blue_green_state_data["logic_id"]["a"]["docker_image_digest"] == "a" * 64
+    assert other.active_logic_id == "b"
+    assert cache.stats()["hits"] > 0
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.synthetic_tf_state import (
+    generate_tf_state, generate_tf_state_with_n_resources, get_service_name,
+)
+from bgs_deploy.tf_state import TfStateIndex
+
+
+def test_generate_tf_state():
+    tf_state_data = generate_tf_state(
+        n_services=20, n_noise_resources=30, container_definitions_size=2000, seed=1)
+    assert tf_state_data == generate_tf_state(
+        n_services=20, n_noise_resources=30, container_definitions_size=2000, seed=1)
+    types = [resource_data["type"] for resource_data in tf_state_data["resources"]]
+    assert len([t for t in types if t.startswith("aws_ecs") or t.startswith("aws_lb")]) \
+           == len(types) - 30
+
+    index = TfStateIndex.from_tf_state_data(tf_state_data)
+    for i in range(20):
+        deployment = BlueGreenECSDeployment(
+            None, "bucket", "key",
+            service_name=get_service_name(i),
+            deployment_option=BlueGreenECSDeployment.DeploymentOptions.do_nothing,
+            tf_state_index=index,
+        )
+        stage_logic_ids = [
+            deployment.active_logic_id,
+            deployment.inactive_logic_id,
+            deployment.staging_logic_id,
+        ]
+        used_logic_ids = [logic_id for logic_id in stage_logic_ids if logic_id]
+        assert len(set(used_logic_ids)) == len(used_logic_ids)
+        for logic_id in used_logic_ids:
+            state = deployment.blue_green_state_data["logic_id"][logic_id]
+            assert len(state["docker_image_digest"]) == 64
+            assert state["task_definition_arg"] == state["task_definition_arn"]
+
+
+def test_generate_tf_state_with_n_resources():
+    tf_state_data = generate_tf_state_with_n_resources(500, seed=1)
+    assert len(tf_state_data["resources"]) == 500
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
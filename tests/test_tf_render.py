@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.synthetic_tf_state import generate_tf_state, get_service_name, make_digest
+from bgs_deploy.tf_render import TfRenderer, MANIFEST_FILE
+from bgs_deploy.tf_state import TfStateIndex
+
+DeploymentOptions = BlueGreenECSDeployment.DeploymentOptions
+
+n_services = 10
+tf_state_index = TfStateIndex.from_tf_state_data(generate_tf_state(n_services, seed=2))
+
+
+def get_plans(new_digest_services=()):
+    plans = list()
+    for i in range(n_services):
+        service_name = get_service_name(i)
+        if service_name in new_digest_services:
+            kwargs = dict(
+                deployment_option=DeploymentOptions.deploy_to_staging,
+                docker_image_digest=make_digest("new", service_name),
+            )
+        else:
+            kwargs = dict(deployment_option=DeploymentOptions.do_nothing)
+        plans.append(BlueGreenECSDeployment(
+            None, "bucket", "key",
+            service_name=service_name,
+            tf_state_index=tf_state_index,
+            **kwargs
+        ).compute_plan())
+    return plans
+
+
+def test_tf_renderer(tmpdir):
+    output_dir = str(tmpdir)
+    renderer = TfRenderer(output_dir=output_dir, max_workers=4)
+
+    result = renderer.render(get_plans())
+    assert len(result.written) == n_services
+    assert os.path.exists(os.path.join(output_dir, MANIFEST_FILE))
+    with open(renderer.get_output_path("service0"), "r") as f:
+        content = f.read()
+    assert "service0_active_logic_id" in content
+
+    # nothing changed
+    result = renderer.render(get_plans())
+    assert len(result.skipped) == n_services
+    assert result.written == []
+
+    # one service changed
+    result = renderer.render(get_plans(new_digest_services=["service3"]))
+    assert result.written == ["service3.tf"]
+    assert len(result.skipped) == n_services - 1
+    with open(renderer.get_output_path("service3"), "r") as f:
+        assert make_digest("new", "service3") in f.read()
+
+    # deleted output file is rendered again
+    os.remove(renderer.get_output_path("service5"))
+    result = renderer.render(get_plans(new_digest_services=["service3"]))
+    assert result.written == ["service5.tf"]
+
+    # extra context changes every file
+    result = renderer.render(get_plans(), extra_context={"env": "dev"})
+    assert len(result.written) + len(result.unchanged) == n_services
+
+    # force renders everything, but content is the same
+    result = renderer.render(get_plans(), extra_context={"env": "dev"}, force=True)
+    assert len(result.unchanged) == n_services
+
+
+def test_tf_renderer_template_change(tmpdir):
+    template_path = str(tmpdir.join("custom.tf.j2"))
+    output_dir = str(tmpdir.join("output"))
+    with open(template_path, "w") as f:
+        f.write("# {{ service_name }} v1\n")
+    renderer = TfRenderer(output_dir=output_dir, template_path=template_path)
+    assert len(renderer.render(get_plans()).written) == n_services
+
+    with open(template_path, "w") as f:
+        f.write("# {{ service_name }} v2\n")
+    assert len(renderer.render(get_plans()).written) == n_services
+    with open(renderer.get_output_path("service1"), "r") as f:
+        assert f.read() == "# service1 v2\n"
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
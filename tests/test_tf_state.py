@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.tf_state import ResourceFilter, load_tf_state
+
+digest_a = "a" * 64
+digest_b = "b" * 64
+
+
+def task_definition(name, digest, revision):
+    return {
+        "mode": "managed",
+        "type": "aws_ecs_task_definition",
+        "name": name,
+        "instances": [
+            {
+                "attributes": {
+                    "arn": "arn:aws:ecs:us-east-1:111122223333:task-definition/{}:{}".format(name, revision),
+                    "container_definitions": json.dumps([
+                        {"image": "111122223333.dkr.ecr.us-east-1.amazonaws.com/app@sha256:{}".format(digest)},
+                    ]),
+                },
+            },
+        ],
+    }
+
+
+def listener(name, logic_id):
+    return {
+        "mode": "managed",
+        "type": "aws_lb_listener",
+        "name": name,
+        "instances": [
+            {
+                "attributes": {},
+                "depends_on": [
+                    "aws_lb.main",
+                    "aws_lb_target_group.helpdesk_{}".format(logic_id),
+                ],
+            },
+        ],
+    }
+
+
+tf_state_data = {
+    "version": 4,
+    "terraform_version": "0.12.29",
+    "serial": 17,
+    "lineage": "8a6c9f4e-中文",
+    "outputs": {"url": {"value": "http://example.com", "type": "string"}},
+    "resources": [
+        task_definition("helpdesk_a", digest_a, 1),
+        task_definition("helpdesk_b", digest_b, 2),
+        {"mode": "managed", "type": "aws_s3_bucket", "name": "noise",
+         "instances": [{"attributes": {"tags": {"名字": "x" * 100}}}]},
+        listener("helpdesk_active", "b"),
+        listener("helpdesk_inactive", "a"),
+        task_definition("billing_a", digest_a, 3),
+    ],
+}
+tf_state_body = json.dumps(tf_state_data, ensure_ascii=False, indent=4).encode("utf-8")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1024 * 1024])
+def test_load_tf_state(chunk_size):
+    state_data = load_tf_state(io.BytesIO(tf_state_body), chunk_size=chunk_size)
+    assert state_data["resources"] == tf_state_data["resources"]
+    assert state_data["serial"] == 17
+    assert state_data["lineage"] == tf_state_data["lineage"]
+    assert "outputs" not in state_data
+
+    resource_filter = ResourceFilter(
+        types=["aws_ecs_task_definition", "aws_lb_listener"],
+        name_prefixes=["helpdesk"],
+    )
+    state_data = load_tf_state(
+        io.BytesIO(tf_state_body),
+        resource_filter=resource_filter,
+        chunk_size=chunk_size,
+    )
+    assert [r["name"] for r in state_data["resources"]] == [
+        "helpdesk_a", "helpdesk_b", "helpdesk_active", "helpdesk_inactive",
+    ]
+
+
+def test_load_tf_state_edge_cases():
+    assert load_tf_state(io.BytesIO(b"{}")) == {"resources": []}
+    assert load_tf_state(io.BytesIO(b' { "resources" : [ ] , "serial" : 123 } ')) \
+           == {"resources": [], "serial": 123}
+    with pytest.raises(ValueError):
+        load_tf_state(io.BytesIO(b'{"resources": [{"type": "a"'))
+    with pytest.raises(ValueError):
+        load_tf_state(io.BytesIO(b'[]'))
+
+
+class FakeS3Client(object):
+    def __init__(self, body):
+        self.body = body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.body)}
+
+
+class FakeBotoSession(object):
+    def __init__(self, body):
+        self.body = body
+
+    def client(self, service_name):
+        return FakeS3Client(self.body)
+
+
+@pytest.mark.parametrize("tf_state_stream", [False, True])
+def test_blue_green_ecs_deployment_stream(tf_state_stream):
+    bg = BlueGreenECSDeployment(
+        FakeBotoSession(tf_state_body), "bucket", "terraform.tfstate",
+        service_name="helpdesk",
+        deployment_option=BlueGreenECSDeployment.DeploymentOptions.deploy_to_staging,
+        docker_image_digest="c" * 64,
+        tf_state_stream=tf_state_stream,
+    )
+    if tf_state_stream:
+        assert len(bg.tf_state_data["resources"]) == 4
+    assert bg.active_logic_id == "b"
+    assert bg.inactive_logic_id == "a"
+    assert bg.logic_a_docker_image_digest == digest_a
+    assert bg.find_which_logic_id_should_use_for_staging() == "c"
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import os
+import time
+
+import pytest
+
+from bgs_deploy.s3_disk_cache import S3DiskCache
+from bgs_deploy.tf_state import ResourceFilter
+from bgs_deploy.tf_state_fanin import fetch_tf_states
+from helpers import BUCKET as bucket
+
+
+def test_fetch_tf_states(boto_ses):
+    s3_client = boto_ses.client("s3")
+    locations = list()
+    for i in range(20):
+        key = "team{}/terraform.tfstate".format(i)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps({
+            "serial": i,
+            "resources": [
+                {"type": "aws_ecs_service", "name": "service{}_a".format(i)},
+                {"type": "aws_s3_bucket", "name": "noise"},
+            ],
+        }))
+        locations.append((bucket, key))
+    locations.insert(5, (bucket, "not-exists.tfstate"))
+
+    results = fetch_tf_states(
+        boto_ses, locations,
+        max_workers=4,
+        stream=True,
+        resource_filter=ResourceFilter(types=["aws_ecs_service"]),
+    )
+    assert [(r.bucket, r.key) for r in results] == locations
+    assert results[5].ok is False
+    ok_results = [r for r in results if r.ok]
+    assert len(ok_results) == 20
+    for i, result in enumerate(ok_results):
+        assert result.tf_state_data["serial"] == i
+        assert result.tf_state_data["resources"] == [
+            {"type": "aws_ecs_service", "name": "service{}_a".format(i)},
+        ]
+
+    assert fetch_tf_states(None, []) == []
+
+
+class SlowBody(object):
+    def __init__(self, data, delay):
+        self.data = io.BytesIO(data)
+        self.delay = delay
+
+    def read(self, size=-1):
+        time.sleep(self.delay)
+        return self.data.read(64)
+
+    def close(self):
+        pass
+
+
+class SlowS3Client(object):
+    def get_object(self, Bucket, Key, **kwargs):
+        delay = 0.05 if Key == "slow" else 0
+        data = b'{"resources": [' + b'{}, ' * 100 + b'{}]}'
+        return {
+            "Body": SlowBody(data, delay),
+            "ContentLength": len(data),
+            "ETag": '"{}"'.format(Key),
+        }
+
+
+def test_fetch_tf_states_timeout():
+    results = fetch_tf_states(
+        None, [("b", "fast"), ("b", "slow"), ("b", "fast")],
+        timeout=0.3,
+        stream=True,
+        s3_client=SlowS3Client(),
+    )
+    assert [r.ok for r in results] == [True, False, True]
+    assert isinstance(results[1].error, TimeoutError)
+
+
+def test_fetch_tf_states_timeout_with_cache(tmpdir):
+    # the timeout also covers downloading the body into the cache
+    cache = S3DiskCache(cache_dir=str(tmpdir))
+    start = time.monotonic()
+    results = fetch_tf_states(
+        None, [("b", "fast"), ("b", "slow")],
+        timeout=0.3,
+        cache=cache,
+        s3_client=SlowS3Client(),
+    )
+    assert time.monotonic() - start < 1
+    assert [r.ok for r in results] == [True, False]
+    assert isinstance(results[1].error, TimeoutError)
+    assert [entry["key"] for entry in cache.index.values()] == ["fast"]
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith(".tmp")]
+
+
+if __name__ == "__main__":
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.tf_state import TfStateIndex
+from bgs_deploy.tf_target import to_target_args
+from helpers import make_service_resources
+
+DeploymentOptions = BlueGreenECSDeployment.DeploymentOptions
+
+tf_state_index = TfStateIndex.from_tf_state_data({
+    "resources": (
+        make_service_resources("two", "ab", {"active": "b", "inactive": "a"})
+        + make_service_resources("three", "abc", {"active": "a", "inactive": "b", "staging": "c"})
+    )
+})
+
+
+def get_addresses(service_name, deployment_option, **kwargs):
+    return BlueGreenECSDeployment(
+        None, "bucket", "key",
+        service_name=service_name,
+        deployment_option=deployment_option,
+        tf_state_index=tf_state_index,
+        **kwargs
+    ).get_tf_target_addresses()
+
+
+def test_get_tf_target_addresses():
+    assert get_addresses("two", DeploymentOptions.do_nothing) == []
+    assert get_addresses("three", DeploymentOptions.do_nothing) == []
+
+    assert get_addresses(
+        "two", DeploymentOptions.deploy_to_staging, docker_image_digest="d" * 64,
+    ) == [
+        "aws_ecs_task_definition.two_c",
+        "aws_lb_target_group.two_c",
+        "aws_ecs_service.two_c",
+        "aws_lb_listener.two_staging",
+    ]
+
+    assert get_addresses("two", DeploymentOptions.roll_back_to_previous) == [
+        "aws_lb_listener.two_active",
+        "aws_lb_listener.two_inactive",
+    ]
+
+    assert get_addresses("three", DeploymentOptions.deploy_to_active) == [
+        "aws_lb_listener.three_active",
+        "aws_lb_listener.three_inactive",
+        "aws_lb_listener.three_staging",
+    ]
+
+    assert get_addresses("three", DeploymentOptions.destroy_staging) == [
+        "aws_ecs_task_definition.three_c",
+        "aws_lb_target_group.three_c",
+        "aws_ecs_service.three_c",
+        "aws_lb_listener.three_staging",
+    ]
+
+
+def test_to_target_args():
+    assert to_target_args(["aws_lb_listener.two_active"]) \
+           == ["-target=aws_lb_listener.two_active"]
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+
+import pytest
+
+from bgs_deploy.blue_green_iac import BlueGreenECSDeployment
+from bgs_deploy.synthetic_tf_state import generate_tf_state, get_service_name, make_digest
+from bgs_deploy.tracing import (
+    Tracer, noop_tracer, InMemoryExporter, JsonLinesExporter, OpenTelemetryExporter,
+)
+
+tf_state_body = json.dumps(generate_tf_state(5, n_noise_resources=20, seed=4)).encode("utf-8")
+
+
+class FakeS3Client(object):
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(tf_state_body)}
+
+
+class FakeBotoSession(object):
+    def client(self, service_name):
+        return FakeS3Client()
+
+
+def test_tracer():
+    exporter = InMemoryExporter()
+    tracer = Tracer([exporter, ])
+    with tracer.span("outer", a=1) as outer:
+        with tracer.span("inner") as inner:
+            inner.set_attribute("b", 2)
+    with pytest.raises(ValueError):
+        with tracer.span("failed"):
+            raise ValueError
+    assert [span.name for span in exporter.spans] == ["inner", "outer", "failed"]
+    assert inner.parent_id == outer.span_id
+    assert outer.parent_id is None
+    assert outer.attributes == {"a": 1}
+    assert inner.attributes == {"b": 2}
+    assert exporter.get_spans("failed")[0].attributes["error"] == "ValueError"
+    assert outer.duration >= inner.duration >= 0
+
+
+def test_noop_tracer():
+    assert noop_tracer.enabled is False
+    span = noop_tracer.span("a", b=1)
+    assert noop_tracer.span("c") is span
+    with span as s:
+        s.set_attribute("d", 2)
+
+
+@pytest.mark.parametrize("tf_state_stream", [False, True])
+def test_deployment_spans(tf_state_stream):
+    exporter = InMemoryExporter()
+    deployment = BlueGreenECSDeployment(
+        FakeBotoSession(), "bucket", "terraform.tfstate",
+        service_name=get_service_name(1),
+        deployment_option=BlueGreenECSDeployment.DeploymentOptions.deploy_to_staging,
+        docker_image_digest=make_digest("new"),
+        tf_state_stream=tf_state_stream,
+        tracer=Tracer([exporter, ]),
+    )
+    deployment.compute_plan()
+    fetch, parse, build, plan = [
+        exporter.get_spans(name)[0]
+        for name in ["tf_state.fetch", "tf_state.parse", "bg_state.build", "plan.compute"]
+    ]
+    if tf_state_stream:
+        assert parse.attributes["bytes"] == len(tf_state_body)
+        assert parse.attributes["resources"] < 25
+    else:
+        assert fetch.attributes["bytes"] == len(tf_state_body)
+        assert parse.attributes["resources"] == len(json.loads(tf_state_body)["resources"])
+    assert build.attributes["resources"] == parse.attributes["resources"]
+    assert build.attributes["container_definitions"] >= 1
+    assert build.attributes["container_definitions_bytes"] > 0
+    assert fetch.parent_id == build.span_id
+    assert build.parent_id == plan.span_id
+
+
+def test_json_lines_exporter():
+    f = io.StringIO()
+    tracer = Tracer([JsonLinesExporter(f), ])
+    with tracer.span("a", n=1):
+        pass
+    with tracer.span("b"):
+        pass
+    records = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert [record["name"] for record in records] == ["a", "b"]
+    assert records[0]["attributes"] == {"n": 1}
+
+
+class FakeOtelSpan(object):
+    def __init__(self, name, start_time, attributes):
+        self.name = name
+        self.start_time = start_time
+        self.attributes = attributes
+        self.end_time = None
+
+    def end(self, end_time=None):
+        self.end_time = end_time
+
+
+class FakeOtelTracer(object):
+    def __init__(self):
+        self.spans = list()
+
+    def start_span(self, name, start_time=None, attributes=None):
+        span = FakeOtelSpan(name, start_time, attributes)
+        self.spans.append(span)
+        return span
+
+
+def test_open_telemetry_exporter():
+    otel_tracer = FakeOtelTracer()
+    tracer = Tracer([OpenTelemetryExporter(otel_tracer), ])
+    with tracer.span("outer", bytes=10):
+        with tracer.span("inner"):
+            pass
+    inner, outer = otel_tracer.spans
+    assert outer.name == "outer"
+    assert outer.attributes["bytes"] == 10
+    assert inner.attributes["bgs.parent_id"] == outer.attributes["bgs.span_id"]
+    assert outer.start_time <= inner.start_time <= inner.end_time <= outer.end_time
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])